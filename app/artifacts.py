@@ -0,0 +1,122 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timezone
+from email.utils import format_datetime
+
+# готовые файлы экспорта по версии каталога (models.CatalogVersion, см. catalog_tag): пока в books ничего не писали,
+# повторная выгрузка отдает тот же файл; каталог общий для воркеров одного хоста
+EXPORT_CACHE_DIR = os.getenv("EXPORT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "books-export-cache"))
+EXPORT_CACHE_MAX_BYTES = int(os.getenv("EXPORT_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+
+BUILD_PREFIX = ".build-"
+
+
+def catalog_tag(version: int, updated_at: datetime | None) -> str:
+    # номер версии повторяется в пересозданной или восстановленной базе, а каталог файлов в /tmp
+    # переживает ее; время последней записи отличает одну базу от другой на той же версии
+    return f"{version}-{updated_at:%Y%m%d%H%M%S%f}" if updated_at is not None else str(version)
+
+
+def catalog_etag(tag: str, variant: str) -> str:
+    return f'"catalog-{tag}-{variant}"'
+
+
+def http_date(value: datetime) -> str:
+    # в базе наивное UTC-время
+    return format_datetime(value.replace(tzinfo=timezone.utc), usegmt=True)
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    # сравнение для GET слабое: W/"x" совпадает с "x"
+    candidates = {tag.strip().removeprefix("W/") for tag in if_none_match.split(",")}
+    return etag in candidates
+
+
+class ArtifactCache:
+    def __init__(self, directory: str = EXPORT_CACHE_DIR, max_bytes: int = EXPORT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._building: dict[str, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    async def get_or_build(self, name: str, build) -> str:
+        # build(path) пишет файл; одинаковые одновременные запросы ждут одну сборку
+        path = self.path(name)
+        if os.path.exists(path):
+            self.hits += 1
+            # свежая mtime: вытесняются давно не скачанные, а не давно собранные
+            os.utime(path)
+            return path
+
+        task = self._building.get(name)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._build(name, build))
+            self._building[name] = task
+        return await asyncio.shield(task)
+
+    async def _build(self, name: str, build) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # у каждой сборки свой файл, готовый подменяется атомарно: соседний воркер, собирающий
+        # то же самое, не увидит недописанный файл
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=BUILD_PREFIX, suffix=os.path.splitext(name)[1])
+        os.close(fd)
+        try:
+            await build(tmp_path)
+            os.replace(tmp_path, self.path(name))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        finally:
+            self._building.pop(name, None)
+        self.evict(keep=name)
+        return self.path(name)
+
+    def entries(self) -> list[tuple[float, int, str]]:
+        found = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.startswith(BUILD_PREFIX):
+                stat = entry.stat()
+                found.append((stat.st_mtime, stat.st_size, entry.name))
+        return sorted(found)
+
+    def evict(self, keep: str | None = None):
+        # по размеру: удаляем самые давние, пока все вместе не влезут в max_bytes
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        for _, size, name in entries:
+            if total <= self.max_bytes:
+                break
+            if name == keep:
+                continue
+            try:
+                os.remove(self.path(name))
+            except FileNotFoundError:
+                pass
+            total -= size
+            self.evicted += 1
+
+    def stats(self) -> dict:
+        entries = self.entries() if os.path.isdir(self.directory) else []
+        return {
+            "files": len(entries),
+            "bytes": sum(size for _, size, _ in entries),
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evicted": self.evicted,
+        }
+
+
+export_cache = ArtifactCache()
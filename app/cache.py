@@ -0,0 +1,250 @@
+import asyncio
+import hashlib
+import os
+import pickle
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    # LRU по порядку обращения + срок жизни у каждой записи
+    def __init__(self, maxsize: int = 1024, ttl: float = 300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._data.get(key)
+        if entry is None:
+            self.misses += 1
+            return False, None
+
+        expires_at, value = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return False, None
+
+        self._data.move_to_end(key)
+        self.hits += 1
+        return True, value
+
+    def set(self, key, value, ttl: float | None = None):
+        self._data[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def delete(self, key):
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {"size": len(self._data), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
+
+class _CachedError:
+    def __init__(self, error: Exception):
+        self.error = error
+
+
+class AsyncTTLCache(TTLCache):
+    # одинаковые одновременные промахи ждут один и тот же запрос (single-flight)
+    def __init__(self, maxsize: int = 1024, ttl: float = 300, negative_ttl: float = 60):
+        super().__init__(maxsize, ttl)
+        self.negative_ttl = negative_ttl
+        self._inflight: dict = {}
+        self.coalesced = 0
+
+    async def get_or_load(self, key, loader, cache_error=lambda e: False):
+        hit, value = self.get(key)
+        if hit:
+            if isinstance(value, _CachedError):
+                raise value.error
+            return value
+
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._load(key, loader, cache_error))
+            self._inflight[key] = task
+        else:
+            self.coalesced += 1
+        # shield: отмена одного ожидающего не отменяет общий запрос
+        return await asyncio.shield(task)
+
+    async def _load(self, key, loader, cache_error):
+        try:
+            value = await loader()
+        except Exception as e:
+            if cache_error(e):
+                self.set(key, _CachedError(e), self.negative_ttl)
+            raise
+        else:
+            self.set(key, value)
+            return value
+        finally:
+            self._inflight.pop(key, None)
+
+    def clear(self):
+        super().clear()
+        self.coalesced = 0
+
+    def stats(self) -> dict:
+        return {**super().stats(), "coalesced": self.coalesced, "inflight": len(self._inflight)}
+
+
+# бэкенды read-through кэша запросов к каталогу: одинаковый async-интерфейс
+# get/set/delete/incr/get_counters и delete_and_incr для инвалидации одним обращением
+class MemoryBackend:
+    # кэш внутри процесса; при нескольких воркерах инвалидация не доходит до соседей, там нужен redis
+    def __init__(self, maxsize: int = 4096, ttl: float = 60, counters_maxsize: int | None = None):
+        self.cache = TTLCache(maxsize, ttl)
+        # версии книг (book-version:{id}) в LRU, иначе счетчик на каждую когда-либо измененную книгу.
+        # Вытесненный счетчик читается как counters_floor — не меньше любого вытесненного значения,
+        # поэтому ключ с версией ниже последней записи снова не станет текущим
+        self.counters = OrderedDict()
+        self.counters_maxsize = counters_maxsize or maxsize
+        self.counters_floor = 0
+
+    async def get(self, key):
+        return self.cache.get(key)
+
+    async def set(self, key, value):
+        self.cache.set(key, value)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.cache.delete(key)
+
+    async def incr(self, key) -> int:
+        value = self.counters.get(key, self.counters_floor) + 1
+        self.counters[key] = value
+        self.counters.move_to_end(key)
+        while len(self.counters) > self.counters_maxsize:
+            _, evicted = self.counters.popitem(last=False)
+            self.counters_floor = max(self.counters_floor, evicted)
+        return value
+
+    async def get_counter(self, key) -> int:
+        return self.counters.get(key, self.counters_floor)
+
+    async def get_counters(self, *keys) -> list[int]:
+        return [await self.get_counter(key) for key in keys]
+
+    async def delete_and_incr(self, keys, counters):
+        await self.delete(*keys)
+        for key in counters:
+            await self.incr(key)
+
+
+class RedisBackend:
+    # общий кэш для всех воркеров; client это redis.asyncio.Redis или совместимая заглушка
+    def __init__(self, client, ttl: float = 60, prefix: str = "books-cache:"):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        if raw is None:
+            return False, None
+        return True, pickle.loads(raw)
+
+    async def set(self, key, value):
+        await self.client.set(self.prefix + key, pickle.dumps(value), ex=max(1, int(self.ttl)))
+
+    async def delete(self, *keys):
+        if keys:
+            await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def incr(self, key) -> int:
+        return await self.client.incr(self.prefix + key)
+
+    async def get_counter(self, key) -> int:
+        return int(await self.client.get(self.prefix + key) or 0)
+
+    async def get_counters(self, *keys) -> list[int]:
+        if not keys:
+            return []
+        return [int(raw or 0) for raw in await self.client.mget([self.prefix + key for key in keys])]
+
+    async def delete_and_incr(self, keys, counters):
+        # один pipeline (MULTI/EXEC) вместо обращения на каждый ключ
+        async with self.client.pipeline(transaction=True) as pipe:
+            if keys:
+                pipe.delete(*(self.prefix + key for key in keys))
+            for key in counters:
+                pipe.incr(self.prefix + key)
+            await pipe.execute()
+
+
+class QueryCache:
+    GENERATION_KEY = "books:generation"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.hits = 0
+        self.misses = 0
+
+    async def get_or_load(self, key, loader):
+        if self.backend is None:
+            return await loader()
+
+        hit, value = await self.backend.get(key)
+        if hit:
+            self.hits += 1
+            return value
+
+        self.misses += 1
+        value = await loader()
+        await self.backend.set(key, value)
+        return value
+
+    async def book_key(self, book_id: str) -> str:
+        # версия в ключе: чтение, начатое до записи, положит результат под старый ключ
+        version = await self.backend.get_counter(f"book-version:{book_id}") if self.backend else 0
+        return f"book:{book_id}:{version}"
+
+    async def list_key(self, *parts) -> str:
+        # списки зависят от любой записи, поэтому в ключе поколение каталога, а не id книг
+        generation = await self.backend.get_counter(self.GENERATION_KEY) if self.backend else 0
+        digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+        return f"books:list:{generation}:{digest}"
+
+    async def invalidate(self, *book_ids):
+        # два обращения к бэкенду на любое число книг: версии одним чтением, удаление и инкременты пачкой
+        if self.backend is None:
+            return
+        book_ids = list(dict.fromkeys(book_ids))
+        version_keys = [f"book-version:{book_id}" for book_id in book_ids]
+        versions = await self.backend.get_counters(*version_keys)
+        book_keys = [f"book:{book_id}:{version}" for book_id, version in zip(book_ids, versions)]
+        await self.backend.delete_and_incr(book_keys, [*version_keys, self.GENERATION_KEY])
+
+    def stats(self) -> dict:
+        return {"backend": type(self.backend).__name__ if self.backend else None, "hits": self.hits, "misses": self.misses}
+
+
+def create_query_cache() -> QueryCache:
+    backend = os.getenv("QUERY_CACHE_BACKEND", "memory")
+    ttl = float(os.getenv("QUERY_CACHE_TTL", "60"))
+    if backend == "off":
+        return QueryCache(None)
+    if backend == "redis":
+        import redis.asyncio as redis
+
+        client = redis.from_url(os.getenv("QUERY_CACHE_REDIS_URL", "redis://localhost:6379/0"))
+        return QueryCache(RedisBackend(client, ttl))
+    return QueryCache(MemoryBackend(int(os.getenv("QUERY_CACHE_SIZE", "4096")), ttl))
+
+
+query_cache = create_query_cache()
@@ -0,0 +1,62 @@
+import asyncio
+import multiprocessing
+import os
+import time
+import weakref
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from app import metrics
+
+# разбор и сборка xlsx (app.spreadsheets) идут в отдельных процессах и не держат event loop воркера;
+# CPU_POOL_WORKERS=0 выполняет их прямо в обработчике, как раньше
+CPU_POOL_WORKERS = int(os.getenv("CPU_POOL_WORKERS", "2"))
+# сколько тяжелых задач одного воркера uvicorn выполняется одновременно, остальные ждут
+CPU_POOL_MAX_JOBS = int(os.getenv("CPU_POOL_MAX_JOBS", str(max(CPU_POOL_WORKERS, 1))))
+# fork из процесса с запущенным loop и потоками драйверов небезопасен
+CPU_POOL_START_METHOD = os.getenv("CPU_POOL_START_METHOD", "spawn")
+
+
+class CpuPool:
+    def __init__(self, workers: int = CPU_POOL_WORKERS, max_jobs: int = CPU_POOL_MAX_JOBS, start_method: str = CPU_POOL_START_METHOD):
+        self.workers = workers
+        self.max_jobs = max_jobs
+        self.start_method = start_method
+        self._executor = None
+        # семафор привязан к loop, в тестах у каждого теста свой
+        self._limits = weakref.WeakKeyDictionary()
+
+    def executor(self) -> ProcessPoolExecutor:
+        # процессы поднимаются при первой тяжелой задаче, а не при старте приложения
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context(self.start_method))
+        return self._executor
+
+    def limit(self) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        semaphore = self._limits.get(loop)
+        if semaphore is None:
+            semaphore = self._limits[loop] = asyncio.Semaphore(self.max_jobs)
+        return semaphore
+
+    async def run(self, func, *args):
+        # func и аргументы передаются pickle-ом: только функции уровня модуля и небольшие значения
+        if self.workers <= 0:
+            return func(*args)
+
+        start_time = time.perf_counter()
+        async with self.limit():
+            metrics.record_cpu_wait(func.__name__, time.perf_counter() - start_time)
+            try:
+                return await asyncio.get_running_loop().run_in_executor(self.executor(), func, *args)
+            except BrokenProcessPool:
+                # процесс упал (например, OOM); следующая задача поднимет пул заново
+                self.shutdown(wait=False)
+                raise
+
+    def shutdown(self, wait: bool = True):
+        executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait, cancel_futures=True)
+
+
+cpu_pool = CpuPool()
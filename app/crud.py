@@ -1,34 +1,223 @@
-from sqlalchemy.orm import Session
+from datetime import datetime
+from sqlalchemy import Boolean, bindparam, case, delete, func, insert, select, union_all, update
+from sqlalchemy.ext.asyncio import AsyncSession
 from app import models, schemas
+from app.models import natural_key
+from app.pagination import keyset_page
 
-def get_book(db: Session, book_id: str):
-    return db.query(models.Book).filter(models.Book.id == book_id).first()
+async def get_book(db: AsyncSession, book_id: str):
+    return await db.get(models.Book, book_id)
 
-def get_books(db: Session, skip: int = 0, limit: int = 10):
-    return db.query(models.Book).offset(skip).limit(limit).all()
+async def get_books(db: AsyncSession, skip: int = 0, limit: int = 10):
+    query = select(models.Book).order_by(models.Book.id).offset(skip).limit(limit)
+    return (await db.scalars(query)).all()
 
-def create_book(db: Session, book: schemas.BookCreate):
+async def get_books_page(db: AsyncSession, limit: int = 10, cursor: str | None = None):
+    return await keyset_page(db, select(models.Book), limit, cursor)
+
+async def get_catalog_version(db: AsyncSession) -> tuple[int, datetime | None]:
+    row = (await db.execute(
+        select(models.CatalogVersion.version, models.CatalogVersion.updated_at).where(models.CatalogVersion.id == 1)
+    )).first()
+    return (row.version, row.updated_at) if row else (0, None)
+
+async def bump_catalog_version(db: AsyncSession):
+    # вызывать прямо перед commit записи в books: строка блокируется до конца транзакции
+    result = await db.execute(
+        update(models.CatalogVersion)
+        .where(models.CatalogVersion.id == 1)
+        .values(version=models.CatalogVersion.version + 1, updated_at=models.utcnow())
+    )
+    if result.rowcount == 0:
+        # база без миграции 4 (например, create_all в тестах)
+        db.add(models.CatalogVersion(id=1, version=1, updated_at=models.utcnow()))
+
+def facet_counts(facet: str):
+    # свернутые счетчики плюс еще не свернутые изменения (см. app.stats): O(групп + delta), books не сканируется
+    parts = [
+        select(table.value, table.books).where(table.facet == facet)
+        for table in (models.BookStat, models.BookStatDelta)
+    ]
+    combined = union_all(*parts).subquery()
+    books = func.sum(combined.c.books).label("books")
+    return select(combined.c.value, books).group_by(combined.c.value).having(books > 0)
+
+async def get_book_stats(db: AsyncSession, top_authors: int = 10) -> dict:
+    total = (await db.execute(facet_counts("total"))).first()
+    authors = facet_counts("author").subquery()
+    top = await db.execute(select(authors.c.value, authors.c.books).order_by(authors.c.books.desc(), authors.c.value).limit(top_authors))
+    years = await db.execute(facet_counts("year"))
+    return {
+        "total": total.books if total else 0,
+        "authors": [{"author": author, "books": books} for author, books in top],
+        # год хранится строкой, '' — не указан; без года в конце
+        "years": sorted(
+            ({"year": int(year) if year else None, "books": books} for year, books in years),
+            key=lambda item: (item["year"] is None, item["year"] or 0),
+        ),
+    }
+
+async def has_books(db: AsyncSession) -> bool:
+    return (await db.execute(select(models.Book.id).limit(1))).first() is not None
+
+async def count_books(db: AsyncSession) -> int:
+    return await db.scalar(select(func.count()).select_from(models.Book))
+
+async def iter_book_batches(db: AsyncSession, batch_size: int = 1000):
+    # yield_per включает серверный курсор на postgres, в памяти только одна пачка строк
+    stmt = (
+        select(models.Book.id, models.Book.title, models.Book.author, models.Book.year)
+        .execution_options(yield_per=batch_size)
+    )
+    result = await db.stream(stmt)
+    async for batch in result.partitions():
+        yield batch
+
+async def bulk_insert_books(db: AsyncSession, rows: list[dict]):
+    # один executemany на пачку, без ORM-объектов в сессии
+    if rows:
+        await db.execute(insert(models.Book), rows)
+
+# sqlite не принимает больше 32766 параметров в одном запросе, IN (...) режем на части
+IN_CHUNK_SIZE = 1000
+BULK_UPDATE_FIELDS = ("title", "author", "year")
+# вместе с полями книги всегда меняется и ее естественный ключ
+SYNC_FIELDS = BULK_UPDATE_FIELDS + ("natural_key",)
+
+def chunked(items: list, size: int = IN_CHUNK_SIZE):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+async def existing_book_ids(db: AsyncSession, ids: list[str]) -> set[str]:
+    found = set()
+    for chunk in chunked(ids):
+        found.update(await db.scalars(select(models.Book.id).where(models.Book.id.in_(chunk))))
+    return found
+
+async def get_books_by_ids(db: AsyncSession, ids: list[str]) -> dict[str, models.Book]:
+    found = {}
+    for chunk in chunked(ids):
+        found.update((book.id, book) for book in await db.scalars(select(models.Book).where(models.Book.id.in_(chunk))))
+    return found
+
+def dialect_insert(db: AsyncSession):
+    # INSERT ... ON CONFLICT есть у postgres и sqlite, но конструкции у каждого диалекта свои
+    dialect_name = db.bind.dialect.name
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert
+    if dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert
+    raise NotImplementedError(f"upsert не поддерживается для {dialect_name}")
+
+async def upsert_books(db: AsyncSession, rows: list[dict], index_elements=("id",), update_fields=()):
+    # без update_fields конфликтующие строки пропускаются (on conflict do nothing)
+    if not rows:
+        return
+    stmt = dialect_insert(db)(models.Book)
+    if update_fields:
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(index_elements),
+            # onupdate на on conflict do update не распространяется
+            set_={**{field: stmt.excluded[field] for field in update_fields}, "updated_at": stmt.excluded.updated_at},
+        )
+    else:
+        # без index_elements пропускается конфликт по любому уникальному ключу
+        stmt = stmt.on_conflict_do_nothing(index_elements=list(index_elements) or None)
+    await db.execute(stmt, rows)
+
+async def natural_key_owners(db: AsyncSession, keys: list[str]) -> dict[str, str]:
+    # естественный ключ -> id книги, которой он принадлежит
+    owners = {}
+    for chunk in chunked(list(set(keys))):
+        owners.update((await db.execute(
+            select(models.Book.natural_key, models.Book.id).where(models.Book.natural_key.in_(chunk))
+        )).all())
+    return owners
+
+async def sync_books(db: AsyncSession, rows: list[dict], key: str = "natural_key", update_existing: bool = True) -> dict:
+    # идемпотентная загрузка: в базу уходят только новые и изменившиеся строки, остальные пропускаем
+    for row in rows:
+        row.setdefault("natural_key", natural_key(row["title"], row["author"], row["year"]))
+    unique = {row[key]: row for row in rows}
+    key_column = getattr(models.Book, key)
+    stored = {}
+    for chunk in chunked(list(unique)):
+        result = await db.execute(
+            select(key_column, models.Book.id, models.Book.title, models.Book.author, models.Book.year).where(key_column.in_(chunk))
+        )
+        stored.update((row[0], tuple(row[1:])) for row in result)
+
+    changed = [
+        row for row_key, row in unique.items()
+        if row_key not in stored or (update_existing and stored[row_key][1:] != (row["title"], row["author"], row["year"]))
+    ]
+    if key != "natural_key":
+        # по id у книги может смениться естественный ключ; ключ, занятый другой книгой в базе или
+        # строкой выше в этой же загрузке, дал бы дубль, такие строки пропускаем
+        owners = await natural_key_owners(db, [row["natural_key"] for row in changed])
+        changed = [row for row in changed if owners.setdefault(row["natural_key"], row[key]) == row[key]]
+    inserted = sum(1 for row in changed if row[key] not in stored)
+    await upsert_books(db, changed, index_elements=(key,), update_fields=SYNC_FIELDS if update_existing else ())
+    # книги, чьи записи могли лежать в кэше чтения: обновленные, а с ключом id и вставленные
+    # (GET /books/{id} по id из файла мог закэшировать 404)
+    changed_ids = [row[key] if key == "id" else stored[row[key]][0] for row in changed if key == "id" or row[key] in stored]
+    return {"inserted": inserted, "updated": len(changed) - inserted, "skipped": len(rows) - len(changed), "changed_ids": changed_ids}
+
+async def bulk_update_books(db: AsyncSession, rows: list[dict]):
+    # один UPDATE на все строки (executemany); флаг <поле>_set отличает "не менять" от явного null
+    if not rows:
+        return
+    table = models.Book.__table__
+    stmt = (
+        update(table)
+        .where(table.c.id == bindparam("b_id"))
+        .values({
+            field: case((bindparam(f"{field}_set", type_=Boolean), bindparam(f"b_{field}", type_=table.c[field].type)), else_=table.c[field])
+            for field in SYNC_FIELDS
+        })
+    )
+    params = [
+        {
+            "b_id": row["id"],
+            **{f"{field}_set": field in row for field in SYNC_FIELDS},
+            **{f"b_{field}": row.get(field) for field in SYNC_FIELDS},
+        }
+        for row in rows
+    ]
+    await db.execute(stmt, params)
+
+async def bulk_delete_books(db: AsyncSession, ids: list[str]):
+    for chunk in chunked(ids):
+        await db.execute(delete(models.Book).where(models.Book.id.in_(chunk)))
+
+async def create_book(db: AsyncSession, book: schemas.BookCreate):
     db_book = models.Book(title=book.title, author=book.author, year=book.year)
     db.add(db_book)
-    db.commit()
-    db.refresh(db_book)
+    await bump_catalog_version(db)
+    await db.commit()
+    await db.refresh(db_book)
     return db_book
 
-def update_book(db: Session, book_id: str, book: schemas.BookCreate):
-    db_book = get_book(db, book_id)
+async def update_book(db: AsyncSession, book_id: str, book: schemas.BookCreate):
+    db_book = await get_book(db, book_id)
     if db_book is None:
         return None
     db_book.title = book.title
     db_book.author = book.author
     db_book.year = book.year
-    db.commit()
-    db.refresh(db_book)
+    db_book.natural_key = natural_key(book.title, book.author, book.year)
+    await bump_catalog_version(db)
+    await db.commit()
+    await db.refresh(db_book)
     return db_book
 
-def delete_book(db: Session, book_id: str):
-    db_book = get_book(db, book_id)
+async def delete_book(db: AsyncSession, book_id: str):
+    db_book = await get_book(db, book_id)
     if db_book is None:
         return None
-    db.delete(db_book)
-    db.commit()
+    await db.delete(db_book)
+    await bump_catalog_version(db)
+    await db.commit()
     return db_book
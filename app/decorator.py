@@ -1,21 +1,41 @@
+import os
+import random
 import time
 import tracemalloc
 from functools import wraps
+from app import metrics
 
-def measure_performance(func):
-    @wraps(func)
-    async def wrapper(*args, **kwargs):
-        tracemalloc.start()
-        start_time = time.perf_counter()
+# доля вызовов с замером памяти; tracemalloc замедляет весь процесс, поэтому по умолчанию выключен
+MEMORY_SAMPLE_RATE = float(os.getenv("METRICS_MEMORY_SAMPLE_RATE", "0"))
 
-        result = await func(*args, **kwargs)
+_tracing = False
 
-        end_time = time.perf_counter()
-        current, peak = tracemalloc.get_traced_memory()
-        tracemalloc.stop()
+def measure_performance(func):
+    name = func.__name__
 
-        print(f"{func.__name__} завершилась за {end_time - start_time:.4f} секунд")
-        print(f"Память: текущая = {current / 10**6:.3f} MB; пик = {peak / 10**6:.3f} MB")
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        global _tracing
+        if not metrics.METRICS_ENABLED:
+            return await func(*args, **kwargs)
 
-        return result
+        # tracemalloc общий на процесс: одновременно замеряем только один вызов,
+        # и пик все равно включает аллокации параллельных запросов
+        sampled = MEMORY_SAMPLE_RATE > 0 and not _tracing and random.random() < MEMORY_SAMPLE_RATE
+        if sampled:
+            _tracing = True
+            tracemalloc.start()
+        start_time = time.perf_counter()
+        try:
+            return await func(*args, **kwargs)
+        except Exception:
+            metrics.handler_errors.inc(1, name)
+            raise
+        finally:
+            metrics.handler_duration.observe(time.perf_counter() - start_time, name)
+            if sampled:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                _tracing = False
+                metrics.handler_memory.observe(peak, name)
     return wrapper
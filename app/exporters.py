@@ -0,0 +1,227 @@
+import csv
+import inspect
+import io
+import json
+import os
+import tempfile
+import time
+import zlib
+import orjson
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import crud, metrics, spreadsheets
+from app.cpu_pool import cpu_pool
+
+EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", "1000"))
+EXPORT_CHUNK_SIZE = 64 * 1024
+EXPORT_COLUMNS = ["id", "title", "author", "year"]
+
+
+def iter_file_chunks(file_path: str, chunk_size: int = EXPORT_CHUNK_SIZE):
+    try:
+        with open(file_path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                yield chunk
+    finally:
+        os.remove(file_path)
+
+
+# каждый writer получает пачки строк (id, title, author, year) и отдает готовые куски байт:
+# start() -> write(rows) на каждую пачку -> finish()
+class CsvWriter:
+    media_type = "text/csv; charset=utf-8"
+
+    def __init__(self):
+        self.buffer = io.StringIO()
+        self.writer = csv.writer(self.buffer)
+
+    def _drain(self):
+        data = self.buffer.getvalue().encode("utf-8")
+        self.buffer.seek(0)
+        self.buffer.truncate()
+        return [data] if data else []
+
+    def start(self):
+        self.writer.writerow(EXPORT_COLUMNS)
+        return self._drain()
+
+    def write(self, rows):
+        self.writer.writerows(rows)
+        return self._drain()
+
+    def finish(self):
+        return []
+
+
+class NdjsonWriter:
+    media_type = "application/x-ndjson"
+
+    def start(self):
+        return []
+
+    def write(self, rows):
+        lines = [json.dumps(dict(zip(EXPORT_COLUMNS, row)), ensure_ascii=False) for row in rows]
+        return ["\n".join(lines).encode("utf-8") + b"\n"] if lines else []
+
+    def finish(self):
+        return []
+
+
+class _ChunkSink(io.RawIOBase):
+    # не-seekable приемник для pyarrow: копит записанное до следующего drain()
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self.position
+
+    def drain(self):
+        chunks, self.chunks = self.chunks, []
+        return [b"".join(chunks)] if chunks else []
+
+
+class ParquetWriter:
+    media_type = "application/vnd.apache.parquet"
+
+    def start(self):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.schema = pa.schema([
+            ("id", pa.string()),
+            ("title", pa.string()),
+            ("author", pa.string()),
+            ("year", pa.int64()),
+        ])
+        self.sink = _ChunkSink()
+        self.writer = pq.ParquetWriter(self.sink, self.schema)
+        return self.sink.drain()
+
+    def write(self, rows):
+        columns = list(zip(*rows)) if rows else [[] for _ in EXPORT_COLUMNS]
+        # каждая пачка становится отдельной row group
+        self.writer.write_table(self.pa.Table.from_arrays(
+            [self.pa.array(col, type=field.type) for col, field in zip(columns, self.schema)],
+            schema=self.schema,
+        ))
+        return self.sink.drain()
+
+    def finish(self):
+        self.writer.close()
+        return self.sink.drain()
+
+
+class XlsxWriter:
+    media_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+    # openpyxl на каждой строке и save — долгий CPU: здесь пачки только пишутся в спул,
+    # а лист собирается в пуле процессов (cpu_pool), как в кэшируемых выгрузках
+    def start(self):
+        fd, self.spool_path = tempfile.mkstemp(suffix=".pickle")
+        self.spool = os.fdopen(fd, "wb")
+        return []
+
+    def write(self, rows):
+        spreadsheets.dump_batch(self.spool, [tuple(row) for row in rows])
+        return []
+
+    async def finish(self):
+        # xlsx это zip, байты появляются только после save
+        self.spool.close()
+        with tempfile.NamedTemporaryFile(suffix=".xlsx", delete=False) as tmp:
+            file_path = tmp.name
+        try:
+            await cpu_pool.run(spreadsheets.write_xlsx_openpyxl, self.spool_path, file_path)
+        except BaseException:
+            os.remove(file_path)
+            raise
+        finally:
+            self.close()
+        return iter_file_chunks(file_path)
+
+    def close(self):
+        # и при обрыве потока: клиент ушел до finish
+        if getattr(self, "spool", None) is not None:
+            self.spool.close()
+            if os.path.exists(self.spool_path):
+                os.remove(self.spool_path)
+            self.spool = None
+
+
+EXPORT_WRITERS = {
+    "csv": CsvWriter,
+    "ndjson": NdjsonWriter,
+    "parquet": ParquetWriter,
+    "xlsx": XlsxWriter,
+}
+
+
+def get_writer(file_format: str):
+    writer_cls = EXPORT_WRITERS.get(file_format)
+    if writer_cls is None:
+        raise ValueError(f"Неизвестный формат экспорта: {file_format}")
+    return writer_cls()
+
+
+async def iter_export(db: AsyncSession, writer, batch_size: int | None = None, progress=None):
+    try:
+        for chunk in writer.start():
+            yield chunk
+        async for batch in crud.iter_book_batches(db, batch_size or EXPORT_BATCH_SIZE):
+            for chunk in writer.write(batch):
+                yield chunk
+            if progress:
+                progress(len(batch))
+        chunks = writer.finish()
+        if inspect.isawaitable(chunks):
+            chunks = await chunks
+        for chunk in chunks:
+            yield chunk
+    finally:
+        if hasattr(writer, "close"):
+            writer.close()
+
+
+async def stream_export(bind, writer, batch_size: int | None = None):
+    # сессия запроса закрывается до отправки тела ответа, поэтому у генератора своя
+    rows = 0
+
+    def count(batch_rows: int):
+        nonlocal rows
+        rows += batch_rows
+
+    start_time = time.perf_counter()
+    async with AsyncSession(bind=bind) as db:
+        async for chunk in iter_export(db, writer, batch_size, progress=count):
+            yield chunk
+    metrics.record_rows("export", rows, time.perf_counter() - start_time)
+
+
+async def stream_ndjson(bind, query, fields: tuple, batch_size: int | None = None, gzip: bool = False):
+    # серверный курсор (yield_per), в памяти одна пачка; следующая читается, когда предыдущая
+    # ушла клиенту: медленный клиент притормаживает чтение из базы
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31) if gzip else None
+    rows = 0
+    start_time = time.perf_counter()
+    async with AsyncSession(bind=bind) as db:
+        result = await db.stream(query.execution_options(yield_per=batch_size or EXPORT_BATCH_SIZE))
+        async for batch in result.partitions():
+            chunk = b"".join(orjson.dumps(dict(zip(fields, row)), option=orjson.OPT_APPEND_NEWLINE) for row in batch)
+            rows += len(batch)
+            if compressor:
+                chunk = compressor.compress(chunk)
+            if chunk:
+                yield chunk
+    if compressor:
+        yield compressor.flush()
+    metrics.record_rows("stream", rows, time.perf_counter() - start_time)
+
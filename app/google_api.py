@@ -1,18 +1,107 @@
+import asyncio
+import os
+import random
+import time
 import httpx
 from fastapi import HTTPException
 from app.schemas import BookRead
 
+GOOGLE_API_URL = os.getenv("GOOGLE_API_URL", "https://www.googleapis.com/books/v1/volumes")
+GOOGLE_MAX_CONNECTIONS = int(os.getenv("GOOGLE_MAX_CONNECTIONS", "100"))
+GOOGLE_MAX_KEEPALIVE = int(os.getenv("GOOGLE_MAX_KEEPALIVE", "20"))
+GOOGLE_KEEPALIVE_EXPIRY = float(os.getenv("GOOGLE_KEEPALIVE_EXPIRY", "30"))
+GOOGLE_HTTP2 = os.getenv("GOOGLE_HTTP2", "0") == "1"
+GOOGLE_CONNECT_TIMEOUT = float(os.getenv("GOOGLE_CONNECT_TIMEOUT", "3"))
+GOOGLE_READ_TIMEOUT = float(os.getenv("GOOGLE_READ_TIMEOUT", "10"))
+GOOGLE_RETRIES = int(os.getenv("GOOGLE_RETRIES", "2"))
+GOOGLE_RETRY_BACKOFF = float(os.getenv("GOOGLE_RETRY_BACKOFF", "0.2"))
+GOOGLE_RATE_LIMIT = float(os.getenv("GOOGLE_RATE_LIMIT", "10"))
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_client: httpx.AsyncClient | None = None
+
+
+def create_client() -> httpx.AsyncClient:
+    return httpx.AsyncClient(
+        http2=GOOGLE_HTTP2,
+        limits=httpx.Limits(
+            max_connections=GOOGLE_MAX_CONNECTIONS,
+            max_keepalive_connections=GOOGLE_MAX_KEEPALIVE,
+            keepalive_expiry=GOOGLE_KEEPALIVE_EXPIRY,
+        ),
+        timeout=httpx.Timeout(GOOGLE_READ_TIMEOUT, connect=GOOGLE_CONNECT_TIMEOUT),
+    )
+
+
+def get_client() -> httpx.AsyncClient:
+    # в приложении клиент создается в lifespan, тут ленивый вариант для скриптов и тестов
+    global _client
+    if _client is None or _client.is_closed:
+        _client = create_client()
+    return _client
+
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+
+class RateLimiter:
+    # не больше rate запросов в секунду на процесс: каждый следующий старт сдвигается на 1/rate
+    def __init__(self, rate: float):
+        self.interval = 1 / rate if rate > 0 else 0
+        self.next_at = 0.0
+
+    async def acquire(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        wait = self.next_at - now
+        self.next_at = max(now, self.next_at) + self.interval
+        if wait > 0:
+            await asyncio.sleep(wait)
+
+
+rate_limiter = RateLimiter(GOOGLE_RATE_LIMIT)
+
+
+def retry_delay(attempt: int, response: httpx.Response | None = None) -> float:
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after and retry_after.isdigit():
+        return min(float(retry_after), GOOGLE_READ_TIMEOUT)
+    return random.uniform(0, GOOGLE_RETRY_BACKOFF * 2 ** attempt)
+
+
+async def request_volumes(params: dict) -> httpx.Response:
+    # лимит на каждое обращение к апстриму, включая повторы; ответы из кэша его не тратят
+    client = get_client()
+    for attempt in range(GOOGLE_RETRIES + 1):
+        last_attempt = attempt == GOOGLE_RETRIES
+        await rate_limiter.acquire()
+        try:
+            response = await client.get(GOOGLE_API_URL, params=params)
+        except httpx.TransportError:
+            if last_attempt:
+                raise HTTPException(status_code=502, detail="Ошибка при запросе к Google Books API")
+            await asyncio.sleep(retry_delay(attempt))
+            continue
+
+        if response.status_code not in RETRY_STATUSES or last_attempt:
+            return response
+        await asyncio.sleep(retry_delay(attempt, response))
+
+
 async def fetch_books_from_google(title: str, limit: int = 5) -> list[BookRead]:
-    url = "https://www.googleapis.com/books/v1/volumes"
     params = {"q": title, "maxResults": limit}
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
+    response = await request_volumes(params)
 
     if response.status_code != 200:
         raise HTTPException(status_code=502, detail="Ошибка при запросе")
 
-    data = await response.json()
+    data = response.json()
     books = []
     for item in data.get("items", []):
         info = item.get("volumeInfo", {})
@@ -1,42 +1,121 @@
 from fastapi import HTTPException
-import httpx
-from sqlalchemy.orm import Session
-from app.schemas import BookRead
+import asyncio
+import os
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import crud
+from app.schemas import BookRead, GoogleBatchRequest
 from app.models import Book
-from app.google_api import fetch_books_from_google
+from app.cache import AsyncTTLCache, query_cache
+from app.google_api import request_volumes
 
 ADMIN_PASSWORD = "123"
+GOOGLE_BATCH_CONCURRENCY = int(os.getenv("GOOGLE_BATCH_CONCURRENCY", "8"))
+GOOGLE_BATCH_MAX_QUERIES = int(os.getenv("GOOGLE_BATCH_MAX_QUERIES", "100"))
+
+google_cache = AsyncTTLCache(
+    maxsize=int(os.getenv("GOOGLE_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("GOOGLE_CACHE_TTL", "300")),
+    negative_ttl=float(os.getenv("GOOGLE_CACHE_NEGATIVE_TTL", "60")),
+)
 
 async def fetch_and_save_books_handler(
     title: str | None,
     author: str | None,
     year: str | None,
     password: str,
-    db: Session
+    db: AsyncSession
 ) -> list[BookRead]:
     if password != ADMIN_PASSWORD:
         raise HTTPException(status_code=401, detail="Неверный пароль")
 
     books = await fetch_books_from_google(title=title, author=author, year=year, limit=5)
 
-    saved_books = []
-    for book_data in books:
-        exists = db.query(Book).filter(Book.id == book_data.id).first()
-        if exists:
-            saved_books.append(exists)
+    existing, _ = await save_google_books(db, books)
+    return [existing.get(book.id, book) for book in books]
+
+async def save_google_books(db: AsyncSession, books: list[BookRead]) -> tuple[dict[str, Book], set[str]]:
+    # выборки IN по всем id и естественным ключам и один INSERT ... ON CONFLICT DO NOTHING вместо
+    # запроса на каждую книгу; уже сохраненные книги не перезаписываем. Книга, которая есть в каталоге
+    # под другим id (импорт, POST /books), не дублируется: existing отдает сохраненную
+    unique = {book.id: book for book in books}
+    existing = await crud.get_books_by_ids(db, list(unique))
+    keys = {book_id: crud.natural_key(book.title, book.author, book.year) for book_id, book in unique.items()}
+    owners = await crud.natural_key_owners(db, [keys[book_id] for book_id in unique if book_id not in existing])
+    same_books = await crud.get_books_by_ids(db, list(set(owners.values())))
+    rows = []
+    for book_id, book in unique.items():
+        if book_id in existing:
             continue
-
-        new_book = Book(
-            id=book_data.id,
-            title=book_data.title,
-            author=book_data.author,
-            year=book_data.year,
-        )
-        db.add(new_book)
-        saved_books.append(new_book)
-
-    db.commit()
-    return saved_books
+        owner = owners.get(keys[book_id])
+        if owner in same_books:
+            existing[book_id] = same_books[owner]
+        if owner is not None:
+            # или одна и та же книга под разными id в одном ответе Google: сохраняется первая
+            continue
+        owners[keys[book_id]] = book_id
+        rows.append({"id": book_id, "title": book.title, "author": book.author, "year": book.year, "natural_key": keys[book_id]})
+    try:
+        # конфликт по id или естественному ключу с параллельной записью: книга уже сохранена
+        await crud.upsert_books(db, rows, index_elements=())
+        if rows:
+            await crud.bump_catalog_version(db)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+
+    inserted = {row["id"] for row in rows}
+    if inserted:
+        await query_cache.invalidate(*inserted)
+    return existing, inserted
+
+async def fetch_and_save_books_batch_handler(request: GoogleBatchRequest, db: AsyncSession) -> dict:
+    if request.password != ADMIN_PASSWORD:
+        raise HTTPException(status_code=401, detail="Неверный пароль")
+    if not request.queries:
+        raise HTTPException(status_code=422, detail="Пустой список запросов")
+    if len(request.queries) > GOOGLE_BATCH_MAX_QUERIES:
+        raise HTTPException(status_code=413, detail=f"Не больше {GOOGLE_BATCH_MAX_QUERIES} запросов за раз")
+
+    semaphore = asyncio.Semaphore(GOOGLE_BATCH_CONCURRENCY)
+
+    async def run(query):
+        async with semaphore:
+            return await fetch_books_from_google(title=query.title, author=query.author, year=query.year, limit=request.limit)
+
+    outcomes = await asyncio.gather(*(run(query) for query in request.queries), return_exceptions=True)
+    for outcome in outcomes:
+        if isinstance(outcome, BaseException) and not isinstance(outcome, HTTPException):
+            raise outcome
+
+    found = [book for outcome in outcomes if isinstance(outcome, list) for book in outcome]
+    existing, inserted = await save_google_books(db, found)
+
+    items, counted = [], set()
+    for index, outcome in enumerate(outcomes):
+        if isinstance(outcome, HTTPException):
+            status = "not_found" if outcome.status_code == 404 else "error"
+            items.append({"index": index, "status": status, "found": 0, "inserted": 0, "existing": 0, "detail": outcome.detail})
+            continue
+        # книга, найденная несколькими запросами, считается вставленной только в первом из них
+        ids = list(dict.fromkeys(book.id for book in outcome))
+        new_ids = [book_id for book_id in ids if book_id in inserted and book_id not in counted]
+        counted.update(new_ids)
+        items.append({"index": index, "status": "ok", "found": len(ids), "inserted": len(new_ids), "existing": len(ids) - len(new_ids)})
+
+    return {
+        "queries": len(items),
+        "found": len(set(book.id for book in found)),
+        "inserted": len(inserted),
+        "existing": len(existing),
+        "failed": sum(1 for item in items if item["status"] == "error"),
+        "items": items,
+    }
+
+def google_cache_key(title: str | None, author: str | None, year, limit: int) -> tuple:
+    def norm(value):
+        return " ".join(str(value).lower().split()) if value is not None else ""
+    return norm(title), norm(author), norm(year), limit
 
 async def fetch_books_from_google(
     title: str = None,
@@ -44,8 +123,19 @@ async def fetch_books_from_google(
     year: str = None,
     limit: int = 5
 ) -> list[BookRead]:
-    url = "https://www.googleapis.com/books/v1/volumes"
-
+    # 404 тоже кэшируем (negative_ttl), ошибки апстрима нет
+    return await google_cache.get_or_load(
+        google_cache_key(title, author, year, limit),
+        lambda: fetch_books_from_google_uncached(title=title, author=author, year=year, limit=limit),
+        cache_error=lambda e: isinstance(e, HTTPException) and e.status_code == 404,
+    )
+
+async def fetch_books_from_google_uncached(
+    title: str = None,
+    author: str = None,
+    year: str = None,
+    limit: int = 5
+) -> list[BookRead]:
     q_parts = []
     if title:
         q_parts.append(f'intitle:{title}')
@@ -60,13 +150,12 @@ async def fetch_books_from_google(
     query = " ".join(q_parts)
     params = {"q": query, "maxResults": limit}
 
-    async with httpx.AsyncClient() as client:
-        response = await client.get(url, params=params)
+    response = await request_volumes(params)
 
     if response.status_code != 200:
         raise HTTPException(status_code=502, detail="Ошибка при запросе к Google Books API")
 
-    data = await response.json()
+    data = response.json()
     books = []
 
     for item in data.get("items", []):
@@ -75,9 +164,9 @@ async def fetch_books_from_google(
             id=item.get("id", ""),
             title=info.get("title", "Без названия"),
             author=", ".join(info.get("authors", ["Неизвестный автор"])),
-            year=info.get("publishedDate", "")[:4],
+            year=info.get("publishedDate", "")[:4] or None,
         )
-        if year and book.year != year:
+        if year and str(book.year) != str(year):
             continue
         books.append(book)
 
@@ -1,140 +1,301 @@
 from fastapi import HTTPException, UploadFile
-from sqlalchemy.orm import Session
-from app import models, schemas, crud
+from pydantic import BaseModel
+from sqlalchemy import select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import models, schemas, crud, metrics
 from app.handlers.external import fetch_books_from_google
-import pandas as pd
+import orjson
 import os
+import shutil
 import tempfile
-from fastapi.responses import FileResponse
-from openpyxl import Workbook, load_workbook
+import time
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app.artifacts import catalog_etag, catalog_tag, etag_matches, export_cache, http_date
 from app.decorator import measure_performance
-from io import BytesIO
-
-#на пандас тут все
-@measure_performance
-async def export_books_handler(db: Session, file_format: str = "xlsx"):
-    books = db.query(models.Book).all()
-    if not books:
-        raise ValueError("Нет данных для экспорта")
-
-    data = [
-        {
-            "ID": b.id,
-            "title": b.title,
-            "author": b.author,
-            "year": b.year,
-        }
-        for b in books
-    ]
-
-    df = pd.DataFrame(data)
-
-    tmp_dir = tempfile.gettempdir()
-    file_path = os.path.join(tmp_dir, f"books_export.{file_format}")
-
-    df.to_excel(file_path, index=False, engine="openpyxl")
-
+from app import spreadsheets
+from app.cpu_pool import cpu_pool
+from app.exporters import EXPORT_BATCH_SIZE, EXPORT_CHUNK_SIZE, EXPORT_WRITERS, get_writer, iter_export, stream_export, stream_ndjson
+from app.spreadsheets import generate_uuids
+from app.search import apply_text_search
+from app.pagination import keyset_page, sort_clauses
+from app.cache import query_cache
+from app.database import is_replica
+from app.jobs import artifact_path, job_manager
+
+XLSX_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+IMPORT_CHUNK_SIZE = int(os.getenv("IMPORT_CHUNK_SIZE", "5000"))
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "50000"))
+# append: строки файла добавляются новыми книгами, кроме тех, что уже есть в каталоге (по title, author, year);
+# upsert: новые вставляются, изменившиеся обновляются; skip_existing: вставляются только новые.
+# Ключ строки для upsert/skip_existing: natural (title, author, year) или колонка id из файла
+IMPORT_KEYS = {"natural": "natural_key", "id": "id"}
+
+def export_headers(version: int, updated_at, variant: str) -> dict:
+    headers = {"ETag": catalog_etag(catalog_tag(version, updated_at), variant)}
+    if updated_at is not None:
+        headers["Last-Modified"] = http_date(updated_at)
+    return headers
+
+async def cached_export_response(db: AsyncSession, variant: str, file_format: str, build, if_none_match: str | None = None):
+    # файл собирается один раз на версию каталога; клиент с актуальным ETag получает 304 без сборки
+    version, updated_at = await crud.get_catalog_version(db)
+    headers = export_headers(version, updated_at, variant)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    file_path = await export_cache.get_or_build(f"books-{variant}-v{catalog_tag(version, updated_at)}.{file_format}", build)
     return FileResponse(
         file_path,
         filename=f"books_export.{file_format}",
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=XLSX_MEDIA_TYPE,
+        headers=headers,
     )
 
+def temp_path(suffix: str = "") -> str:
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    os.close(fd)
+    return path
+
+async def spool_book_rows(db: AsyncSession, spool_path: str) -> int:
+    # строки из курсора пачками в файл; процесс сборки читает его сам, через pipe идут только пути
+    rows = 0
+    with open(spool_path, "wb") as spool:
+        async for batch in crud.iter_book_batches(db, EXPORT_BATCH_SIZE):
+            spreadsheets.dump_batch(spool, [tuple(row) for row in batch])
+            rows += len(batch)
+    return rows
+
+async def build_xlsx_export(db: AsyncSession, writer, file_path: str):
+    start_time = time.perf_counter()
+    spool_path = temp_path(".pickle")
+    try:
+        if not await spool_book_rows(db, spool_path):
+            raise ValueError("Нет данных для экспорта")
+        rows = await cpu_pool.run(writer, spool_path, file_path)
+    finally:
+        os.remove(spool_path)
+    metrics.record_rows("export", rows, time.perf_counter() - start_time)
+
+#на пандас тут все
 @measure_performance
-async def import_books_from_excel(file: UploadFile, db: Session):
-    contents = await file.read()
-    df = pd.read_excel(BytesIO(contents))
-
-    required_columns = {"title", "author", "year"}
-    if not required_columns.issubset(df.columns):
-        missing = required_columns - set(df.columns)
-        raise ValueError(f"Отсутствуют колонки: {', '.join(missing)}")
-
-    imported_count = 0
-
-    for _, row in df.iterrows():
-        book = models.Book(
-            title=row["title"],
-            author=row["author"],
-            year=int(row["year"]) if not pd.isna(row["year"]) else None
-        )
-        db.add(book)
-        imported_count += 1
+async def export_books_handler(db: AsyncSession, file_format: str = "xlsx", if_none_match: str | None = None):
+    async def build(file_path: str):
+        await build_xlsx_export(db, spreadsheets.write_xlsx_pandas, file_path)
+
+    return await cached_export_response(db, "pandas", file_format, build, if_none_match)
+
+async def write_import_chunk(db: AsyncSession, rows: list[dict], mode: str = "append", key: str = "natural") -> dict:
+    if mode == "append":
+        # естественный ключ уникален по всему каталогу: книга, которая уже есть, пропускается
+        return await crud.sync_books(db, rows, "natural_key", update_existing=False)
+    return await crud.sync_books(db, rows, IMPORT_KEYS[key], update_existing=mode == "upsert")
+
+def add_counts(total: dict, counts: dict) -> dict:
+    # счетчики складываются, списки (changed_ids) склеиваются
+    merged = dict(total)
+    for name, value in counts.items():
+        merged[name] = merged[name] + value if name in merged else value
+    return merged
+
+def import_result(counts: dict, stats: dict, elapsed: float) -> dict:
+    # skipped: все строки файла, которые не записались (невалидные, дубли, без изменений)
+    imported_count = counts.get("inserted", 0) + counts.get("updated", 0)
+    metrics.record_rows("import", imported_count, elapsed)
+    return {
+        "imported": imported_count,
+        "inserted": counts.get("inserted", 0),
+        "updated": counts.get("updated", 0),
+        **stats,
+        "skipped": stats.get("skipped", 0) + counts.get("skipped", 0),
+        "seconds": round(elapsed, 3),
+        "rows_per_sec": round(imported_count / elapsed) if elapsed else imported_count,
+    }
 
-    db.commit()
-    return imported_count
+#импорт колонками, без iterrows
+@measure_performance
+async def import_books_from_excel(
+    file: UploadFile,
+    db: AsyncSession,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    mode: str = "append",
+    key: str = "natural",
+):
+    file_path = await spool_upload(file, suffix=".xlsx")
+    try:
+        start_time = time.perf_counter()
+        counts, stats = await import_books_xlsx_file(db, file_path, chunk_size, mode=mode, key=key, engine="pandas")
+        elapsed = time.perf_counter() - start_time
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        os.remove(file_path)
+    await query_cache.invalidate(*counts.get("changed_ids", ()))
+
+    return import_result(counts, stats, elapsed)
 
 #тут на openpyxl все
 @measure_performance
-async def export_books_handler_openpyxl(db: Session, file_format: str = "xlsx"):
-    books = db.query(models.Book).all()
-    if not books:
-        raise ValueError("Нет данных для экспорта")
-
-    wb = Workbook()
-    ws = wb.active
-    ws.append(["ID", "title", "author", "year"])
+async def export_books_handler_openpyxl(db: AsyncSession, file_format: str = "xlsx", if_none_match: str | None = None):
+    async def build(file_path: str):
+        await build_xlsx_export(db, spreadsheets.write_xlsx_openpyxl, file_path)
+
+    return await cached_export_response(db, "openpyxl", file_format, build, if_none_match)
+
+def copy_upload(source, suffix: str = "") -> str:
+    source.seek(0)
+    with tempfile.NamedTemporaryFile(suffix=suffix, delete=False) as tmp:
+        shutil.copyfileobj(source, tmp, EXPORT_CHUNK_SIZE)
+        return tmp.name
+
+async def spool_upload(file: UploadFile, suffix: str = "") -> str:
+    # загрузку копируем на диск кусками, целиком в память не читаем; копирование сотен мегабайт
+    # идет в потоке, event loop в это время обслуживает остальные запросы
+    return await run_in_threadpool(copy_upload, file.file, suffix)
+
+async def import_books_xlsx_file(
+    db: AsyncSession,
+    file_path: str,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    progress=None,
+    mode: str = "append",
+    key: str = "natural",
+    engine: str = "openpyxl",
+    on_total=None,
+) -> tuple[dict, dict]:
+    # лист разбирается в процессе пула (pandas или openpyxl) в спул из пачек строк, в базу пачки
+    # пишутся уже здесь; в event loop за раз читается одна пачка. Возвращает (counts, stats разбора)
+    spool_path = temp_path(".pickle")
+    try:
+        if engine == "pandas":
+            parse = (spreadsheets.parse_xlsx_pandas, file_path, spool_path, chunk_size, key if mode != "append" else None)
+        else:
+            parse = (spreadsheets.parse_xlsx_rows, file_path, spool_path, chunk_size, mode, key)
+        stats = await cpu_pool.run(*parse)
+        rows = stats.pop("rows")
+        if on_total:
+            on_total(rows)
+        counts = {}
+        for chunk in spreadsheets.read_batches(spool_path):
+            counts = add_counts(counts, await write_import_chunk(db, chunk, mode, key))
+            if progress:
+                progress(len(chunk))
+    finally:
+        os.remove(spool_path)
+
+    await crud.bump_catalog_version(db)
+    await db.commit()
+    return counts, stats
 
-    for b in books:
-        ws.append([b.id, b.title, b.author, b.year])
-
-    tmp_dir = tempfile.gettempdir()
-    file_path = os.path.join(tmp_dir, f"books_export.{file_format}")
-    wb.save(file_path)
+@measure_performance
+async def import_books_from_openpyxl(
+    file: UploadFile,
+    db: AsyncSession,
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    mode: str = "append",
+    key: str = "natural",
+):
+    file_path = await spool_upload(file, suffix=".xlsx")
+    try:
+        start_time = time.perf_counter()
+        counts, stats = await import_books_xlsx_file(db, file_path, chunk_size, mode=mode, key=key)
+        elapsed = time.perf_counter() - start_time
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        os.remove(file_path)
+    await query_cache.invalidate(*counts.get("changed_ids", ()))
+
+    return {"status": "ok", **import_result(counts, stats, elapsed)}
+
+#потоковый экспорт в любой формат из EXPORT_WRITERS, строки пачками из курсора
+@measure_performance
+async def export_books_handler_streaming(db: AsyncSession, file_format: str = "xlsx", if_none_match: str | None = None):
+    try:
+        writer = get_writer(file_format)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # поток не кэшируется, но ETag по версии каталога позволяет не качать неизменившийся каталог заново
+    version, updated_at = await crud.get_catalog_version(db)
+    headers = export_headers(version, updated_at, f"stream-{file_format}")
+    if etag_matches(if_none_match, headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+
+    if not await crud.has_books(db):
+        raise ValueError("Нет данных для экспорта")
 
-    return FileResponse(
-        file_path,
-        filename=f"books_export.{file_format}",
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    return StreamingResponse(
+        stream_export(db.bind, writer),
+        media_type=writer.media_type,
+        headers={"Content-Disposition": f'attachment; filename="books_export.{file_format}"', **headers},
     )
 
-@measure_performance
-async def import_books_from_openpyxl(file: UploadFile, db: Session):
-    contents = await file.read()
-    wb = load_workbook(filename=BytesIO(contents), data_only=True)
-    ws = wb.active
-
-    headers = [cell.value.lower() for cell in next(ws.iter_rows(min_row=1, max_row=1))]
-    required_columns = {"title", "author", "year"}
-    if not required_columns.issubset(headers):
-        missing = required_columns - set(headers)
-        raise ValueError(f"Отсутствуют колонки: {', '.join(missing)}")
-
-    imported_count = 0
-    for row in ws.iter_rows(min_row=2, values_only=True):
-        row_data = dict(zip(headers, row))
-        book = models.Book(
-            title=row_data["title"],
-            author=row_data["author"],
-            year=int(row_data["year"]) if row_data["year"] else None
-        )
-        db.add(book)
-        imported_count += 1
+# списки читаются только нужными колонками, без ORM-объектов, и кодируются orjson без повторной
+# проверки через response_model; порядок полей как в schemas.BookRead
+BOOK_LIST_FIELDS = ("id", "title", "author", "year", "created_at", "updated_at")
+BOOK_LIST_COLUMNS = tuple(getattr(models.Book, field) for field in BOOK_LIST_FIELDS)
 
-    db.commit()
-    return imported_count
+def book_dicts(items) -> list[dict]:
+    # строки выборки по колонкам; то, что нашлось в Google Books, приходит как BookRead
+    return [item.model_dump() if isinstance(item, BaseModel) else dict(zip(BOOK_LIST_FIELDS, item)) for item in items]
 
-async def get_books_by_filters(db: Session, filters, skip: int, limit: int):
-    query = db.query(models.Book)
+def books_json_response(content) -> Response:
+    if isinstance(content, dict):
+        content = {**content, "items": book_dicts(content["items"])}
+    else:
+        content = book_dicts(content)
+    return Response(orjson.dumps(content), media_type="application/json")
+
+def build_books_query(db: AsyncSession, filters, ranked: bool = True):
+    query = select(*BOOK_LIST_COLUMNS)
 
     filter_mapping = {
         "book_id": lambda v: models.Book.id == v,
-        "title": lambda v: models.Book.title.ilike(f"%{v}%"),
-        "author": lambda v: models.Book.author.ilike(f"%{v}%"),
         "year": lambda v: models.Book.year == v,
     }
 
     for field, condition in filter_mapping.items():
         value = getattr(filters, field, None)
         if value is not None:
-            query = query.filter(condition(value))
-
+            query = query.where(condition(value))
+
+    # title/author через индекс поиска, с сортировкой по релевантности, если не задан sort_by
+    sort_by = getattr(filters, "sort_by", None)
+    query = apply_text_search(
+        query,
+        db.bind.dialect.name,
+        ranked=ranked and sort_by is None,
+        title=getattr(filters, "title", None),
+        author=getattr(filters, "author", None),
+    )
+    if ranked:
+        # без sort_by после релевантности (или вместо нее, если поиска нет) порядок по id:
+        # без полного порядка страницы offset могут повторять и терять строки
+        query = query.order_by(*sort_clauses(sort_by, getattr(filters, "order", "asc") if sort_by else "asc"))
+    return query
 
-    results = query.offset(skip).limit(limit).all()
+@measure_performance
+async def stream_books_handler(db: AsyncSession, filters, gzip: bool = False):
+    # весь отфильтрованный каталог одним ответом, без Google Books и кэша запросов;
+    # без sort_by порядок по id
+    query = build_books_query(db, filters, ranked=False)
+    query = query.order_by(*sort_clauses(getattr(filters, "sort_by", None), getattr(filters, "order", "asc")))
+    headers = {"Content-Encoding": "gzip", "Vary": "Accept-Encoding"} if gzip else {}
+    return StreamingResponse(
+        stream_ndjson(db.bind, query, BOOK_LIST_FIELDS, gzip=gzip),
+        media_type="application/x-ndjson",
+        headers=headers,
+    )
 
-    if results:
-        return results
+@measure_performance
+async def get_book_stats_handler(db: AsyncSession, top_authors: int = 10):
+    return await crud.get_book_stats(db, top_authors)
 
+async def fetch_missing_from_google(filters, limit: int):
     if filters.title or filters.author or filters.year:
         return await fetch_books_from_google(
             title=filters.title,
@@ -145,8 +306,45 @@ async def get_books_by_filters(db: Session, filters, skip: int, limit: int):
 
     raise HTTPException(status_code=404, detail="Книги не найдены")
 
+def filters_key(filters) -> tuple:
+    return tuple(getattr(filters, field, None) for field in schemas.BookFilter.model_fields)
+
+async def cached_list(db: AsyncSession, key_parts: tuple, loader):
+    # выборка с реплики не кэшируется: отставшая реплика положила бы старую страницу под поколение
+    # после записи, и она отдавалась бы весь QUERY_CACHE_TTL. Нагрузку чтения тогда несет реплика
+    if is_replica(db):
+        return await loader()
+    return await query_cache.get_or_load(await query_cache.list_key(*key_parts), loader)
+
+async def get_books_by_filters(db: AsyncSession, filters, skip: int, limit: int):
+    query = build_books_query(db, filters)
+
+    async def load():
+        return (await db.execute(query.offset(skip).limit(limit))).all()
+
+    results = await cached_list(db, ("offset", filters_key(filters), skip, limit), load)
+
+    if results:
+        return results
+
+    return await fetch_missing_from_google(filters, limit)
+
+async def get_books_page_by_filters(db: AsyncSession, filters, limit: int, cursor: str | None = None):
+    # курсорная пагинация: порядок по sort_by (или id) вместо релевантности, чтобы страницы были стабильны
+    query = build_books_query(db, filters, ranked=False)
+    sort_by, order = getattr(filters, "sort_by", None), getattr(filters, "order", "asc")
+    items, next_cursor = await cached_list(
+        db, ("cursor", filters_key(filters), limit, cursor), lambda: keyset_page(db, query, limit, cursor, sort_by, order),
+    )
 
-def create_book_handler(book: schemas.BookCreate, db: Session) -> schemas.BookOut:
+    if not items and not cursor:
+        items = await fetch_missing_from_google(filters, limit)
+
+    return {"items": items, "next_cursor": next_cursor}
+
+DUPLICATE_BOOK = "Книга с таким названием, автором и годом уже есть"
+
+async def create_book_handler(book: schemas.BookCreate, db: AsyncSession) -> schemas.BookOut:
     if not book.title or not book.author:
         raise HTTPException(status_code=422, detail="Название книги и автор обязательны")
 
@@ -156,19 +354,222 @@ def create_book_handler(book: schemas.BookCreate, db: Session) -> schemas.BookOu
         year=book.year
     )
     db.add(new_book)
-    db.commit()
-    db.refresh(new_book)
+    try:
+        await crud.bump_catalog_version(db)
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=DUPLICATE_BOOK)
+    await db.refresh(new_book)
+    await query_cache.invalidate(new_book.id)
     return new_book
 
-def update_book_handler(book_id: str, book: schemas.BookCreate, db: Session):
-    updated = crud.update_book(db, book_id, book)
+async def get_book_handler(book_id: str, db: AsyncSession):
+    book = await query_cache.get_or_load(await query_cache.book_key(book_id), lambda: crud.get_book(db, book_id))
+    if book is None:
+        raise HTTPException(status_code=404, detail="Книга не найдена")
+    return book
+
+async def update_book_handler(book_id: str, book: schemas.BookCreate, db: AsyncSession):
+    try:
+        updated = await crud.update_book(db, book_id, book)
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=409, detail=DUPLICATE_BOOK)
     if updated is None:
         raise HTTPException(status_code=404, detail="Книга не найдена")
+    await query_cache.invalidate(book_id)
     return updated
 
 
-def delete_book_handler(book_id: str, db: Session):
-    deleted = crud.delete_book(db, book_id)
+async def delete_book_handler(book_id: str, db: AsyncSession):
+    deleted = await crud.delete_book(db, book_id)
     if deleted is None:
         raise HTTPException(status_code=404, detail="Книга не найдена")
+    await query_cache.invalidate(book_id)
     return {"message": "Книга удалена"}
+
+
+#пакетные операции: один запрос на всю пачку, одна транзакция, результат по каждому элементу
+def check_bulk_size(items: list):
+    if not items:
+        raise HTTPException(status_code=422, detail="Пустой список")
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Не больше {BULK_MAX_ITEMS} элементов за запрос")
+
+def bulk_result(items: list[dict]) -> dict:
+    succeeded = sum(1 for item in items if item["status"] in ("created", "updated", "deleted"))
+    return {"total": len(items), "succeeded": succeeded, "failed": len(items) - succeeded, "items": items}
+
+async def run_bulk_write(db: AsyncSession, write, *book_ids):
+    try:
+        await write()
+        await crud.bump_catalog_version(db)
+        await db.commit()
+    except Exception:
+        await db.rollback()
+        raise
+    await query_cache.invalidate(*book_ids)
+
+async def bulk_create_books_handler(books: list[schemas.BookCreate], db: AsyncSession):
+    check_bulk_size(books)
+
+    keys = [crud.natural_key(book.title, book.author, book.year) for book in books]
+    taken = set(await crud.natural_key_owners(db, keys))
+    results, rows = [], []
+    for index, (book, book_id, key) in enumerate(zip(books, generate_uuids(len(books)), keys)):
+        if not book.title or not book.author:
+            results.append({"index": index, "status": "invalid", "detail": "Название книги и автор обязательны"})
+            continue
+        if key in taken:
+            results.append({"index": index, "status": "invalid", "detail": DUPLICATE_BOOK})
+            continue
+        taken.add(key)
+        rows.append({"id": book_id, "title": book.title, "author": book.author, "year": book.year, "natural_key": key})
+        results.append({"index": index, "id": book_id, "status": "created"})
+
+    await run_bulk_write(db, lambda: crud.bulk_insert_books(db, rows))
+    return bulk_result(results)
+
+async def bulk_update_books_handler(books: list[schemas.BookBulkUpdate], db: AsyncSession):
+    check_bulk_size(books)
+    existing = await crud.get_books_by_ids(db, list({book.id for book in books}))
+
+    # поля книг после уже принятых правок пачки; по ним пересчитывается естественный ключ
+    current = {book_id: {field: getattr(book, field) for field in crud.BULK_UPDATE_FIELDS} for book_id, book in existing.items()}
+    # чей ключ сейчас: книги пачки (None — ключ освободился в этой пачке), иначе владелец в базе
+    key_owner = {book.natural_key: book_id for book_id, book in existing.items()}
+    candidates = [
+        crud.natural_key(**{**current[book.id], **book.model_dump(include=book.model_fields_set - {"id"})})
+        for book in books if book.id in existing
+    ]
+    db_owners = await crud.natural_key_owners(db, candidates)
+    checked = set(candidates)
+    book_keys = {book_id: book.natural_key for book_id, book in existing.items()}
+
+    results, rows = [], []
+    for index, book in enumerate(books):
+        changes = book.model_dump(include=book.model_fields_set - {"id"})
+        if book.id not in existing:
+            results.append({"index": index, "id": book.id, "status": "not_found"})
+            continue
+        if any(field in changes and not changes[field] for field in ("title", "author")):
+            results.append({"index": index, "id": book.id, "status": "invalid", "detail": "Название книги и автор обязательны"})
+            continue
+        key = crud.natural_key(**{**current[book.id], **changes})
+        if key not in checked:
+            # книга правится в пачке второй раз, такой ключ заранее не проверяли
+            db_owners.update(await crud.natural_key_owners(db, [key]))
+            checked.add(key)
+        owner = key_owner[key] if key in key_owner else db_owners.get(key)
+        if owner is not None and owner != book.id:
+            results.append({"index": index, "id": book.id, "status": "invalid", "detail": DUPLICATE_BOOK})
+            continue
+        if key != book_keys[book.id]:
+            key_owner[book_keys[book.id]] = None
+            key_owner[key] = book.id
+            book_keys[book.id] = key
+        current[book.id].update(changes)
+        rows.append({"id": book.id, **changes, "natural_key": key})
+        results.append({"index": index, "id": book.id, "status": "updated"})
+
+    await run_bulk_write(db, lambda: crud.bulk_update_books(db, rows), *(row["id"] for row in rows))
+    return bulk_result(results)
+
+async def bulk_delete_books_handler(book_ids: list[str], db: AsyncSession):
+    check_bulk_size(book_ids)
+    existing = await crud.existing_book_ids(db, list(set(book_ids)))
+
+    results = [
+        {"index": index, "id": book_id, "status": "deleted" if book_id in existing else "not_found"}
+        for index, book_id in enumerate(book_ids)
+    ]
+
+    await run_bulk_write(db, lambda: crud.bulk_delete_books(db, list(existing)), *existing)
+    return bulk_result(results)
+
+
+#фоновые задачи: запрос только ставит задачу в очередь, ход выполнения смотрим через GET /jobs/{id}
+async def run_import_job(
+    db: AsyncSession,
+    ctx,
+    file_path: str,
+    engine: str = "openpyxl",
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    mode: str = "append",
+    key: str = "natural",
+):
+    try:
+        start_time = time.perf_counter()
+        counts, stats = await import_books_xlsx_file(
+            db, file_path, chunk_size, progress=ctx.advance, mode=mode, key=key, engine=engine, on_total=ctx.set_total,
+        )
+        elapsed = time.perf_counter() - start_time
+    except Exception:
+        await db.rollback()
+        raise
+    finally:
+        os.remove(file_path)
+    await query_cache.invalidate(*counts.get("changed_ids", ()))
+    return import_result(counts, stats, elapsed)
+
+async def run_export_job(db: AsyncSession, ctx, file_format: str):
+    writer = get_writer(file_format)
+    ctx.rows_total = await crud.count_books(db)
+    if not ctx.rows_total:
+        raise ValueError("Нет данных для экспорта")
+
+    file_path = artifact_path(ctx.job_id, file_format)
+    start_time = time.perf_counter()
+    try:
+        with open(file_path, "wb") as f:
+            async for chunk in iter_export(db, writer, progress=ctx.advance):
+                f.write(chunk)
+    except Exception:
+        os.remove(file_path)
+        raise
+    metrics.record_rows("export", ctx.rows_done, time.perf_counter() - start_time)
+    return {
+        "artifact_path": file_path,
+        "filename": f"books_export.{file_format}",
+        "media_type": writer.media_type,
+        "bytes": os.path.getsize(file_path),
+    }
+
+async def create_import_job_handler(
+    file: UploadFile,
+    engine: str = "openpyxl",
+    chunk_size: int = IMPORT_CHUNK_SIZE,
+    mode: str = "append",
+    key: str = "natural",
+):
+    if not file.filename.endswith((".xlsx", ".xlsm")):
+        raise HTTPException(status_code=400, detail="Файл должен быть в формате .xlsx или .xlsm")
+
+    file_path = await spool_upload(file, suffix=".xlsx")
+    try:
+        return await job_manager.submit("import", run_import_job, {
+            "file_path": file_path, "engine": engine, "chunk_size": chunk_size, "mode": mode, "key": key,
+        })
+    except Exception:
+        os.remove(file_path)
+        raise
+
+async def create_export_job_handler(file_format: str = "xlsx"):
+    if file_format not in EXPORT_WRITERS:
+        raise HTTPException(status_code=400, detail=f"Неизвестный формат экспорта: {file_format}")
+    return await job_manager.submit("export", run_export_job, {"file_format": file_format}, read_only=True)
+
+async def get_job_handler(job_id: str):
+    job = await job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    return job
+
+async def get_job_artifact_handler(job_id: str):
+    job = await get_job_handler(job_id)
+    file_path = await job_manager.get_artifact(job_id)
+    if file_path is None:
+        raise HTTPException(status_code=409 if job["status"] in ("queued", "running") else 404, detail="Файл задачи недоступен")
+
+    return FileResponse(file_path, filename=job["result"]["filename"], media_type=job["result"]["media_type"])
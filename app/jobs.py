@@ -0,0 +1,277 @@
+import asyncio
+import os
+import socket
+import tempfile
+import time
+import uuid
+from datetime import timedelta
+from fastapi import HTTPException
+from sqlalchemy import or_, select, update
+from app import models
+from app.models import utcnow
+from app.database import AsyncSessionLocal, ReadSessionLocal
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "100"))
+JOB_ARTIFACT_DIR = os.getenv("JOB_ARTIFACT_DIR", os.path.join(tempfile.gettempdir(), "books-jobs"))
+# секунды между сигналами процесса о своих задачах; задача без сигнала дольше JOB_STALE_AFTER
+# считается брошенной (процесс упал или перезапущен) и помечается failed
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", "60"))
+# секунды, сколько хранится файл готового экспорта после завершения задачи; 0 — не удалять
+JOB_ARTIFACT_TTL = float(os.getenv("JOB_ARTIFACT_TTL", str(24 * 3600)))
+
+ACTIVE_STATUSES = ("queued", "running")
+
+
+def artifact_path(job_id: str, extension: str) -> str:
+    os.makedirs(JOB_ARTIFACT_DIR, exist_ok=True)
+    return os.path.join(JOB_ARTIFACT_DIR, f"{job_id}.{extension}")
+
+
+def job_files(job) -> list[str]:
+    # файлы задачи на диске: готовый экспорт и загруженный файл импорта (params["file_path"])
+    return [path for path in (job.artifact_path, (job.params or {}).get("file_path")) if path]
+
+
+def remove_files(paths):
+    for path in paths:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+class JobContext:
+    # прогресс выполняющейся задачи живет в памяти: писать его в таблицу jobs на каждой пачке
+    # дорого, а на sqlite импорт держит блокировку записи до своего commit. В таблицу его
+    # периодически переносит сигнал JobManager (кроме sqlite)
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.rows_done = 0
+        self.rows_total = None
+        self.started = time.monotonic()
+
+    def set_total(self, rows: int):
+        self.rows_total = rows
+
+    def advance(self, rows: int):
+        self.rows_done += rows
+
+    def rows_per_sec(self) -> int:
+        elapsed = time.monotonic() - self.started
+        return round(self.rows_done / elapsed) if elapsed else self.rows_done
+
+
+class JobManager:
+    # очередь задач и фиксированное число воркеров внутри процесса; состояние задач в таблице jobs.
+    # Таблица общая для всех воркеров uvicorn: каждый отмечает свои задачи owner и обновляет heartbeat_at
+    def __init__(
+        self, session_factory, workers: int = JOB_WORKERS, queue_size: int = JOB_QUEUE_SIZE, read_session_factory=None,
+        heartbeat_interval: float = JOB_HEARTBEAT_INTERVAL, persist_progress: bool | None = None,
+    ):
+        self.session_factory = session_factory
+        # сессия для задач только на чтение (экспорт); состояние задач всегда пишется через session_factory
+        self.read_session_factory = read_session_factory or session_factory
+        self.workers = workers
+        self.queue = asyncio.Queue(queue_size)
+        self.tasks = []
+        self.running: dict[str, JobContext] = {}
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.heartbeat_interval = heartbeat_interval
+        # None — писать прогресс в jobs везде, кроме sqlite
+        self.persist_progress = persist_progress
+
+    async def start(self):
+        await self.fail_interrupted()
+        if self.persist_progress is None:
+            async with self.session_factory() as db:
+                self.persist_progress = db.get_bind().dialect.name != "sqlite"
+        self.tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        if self.heartbeat_interval > 0:
+            self.tasks.append(asyncio.create_task(self._heartbeat_loop()))
+
+    async def stop(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        self.tasks = []
+
+    async def fail_interrupted(self) -> int:
+        # очередь в памяти не переживает перезапуск: закрываем незавершенные задачи, о которых их
+        # процесс давно не сообщал. Задачи живых соседних воркеров не трогаем
+        stale = utcnow() - timedelta(seconds=JOB_STALE_AFTER)
+        async with self.session_factory() as db:
+            # строки блокируются до commit: сигнал владельца не проскочит между выборкой и update
+            jobs = (await db.execute(
+                select(models.Job.id, models.Job.params, models.Job.artifact_path)
+                .where(
+                    models.Job.status.in_(ACTIVE_STATUSES),
+                    or_(models.Job.heartbeat_at.is_(None), models.Job.heartbeat_at < stale),
+                )
+                .with_for_update(skip_locked=True)
+            )).all()
+            if not jobs:
+                return 0
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.id.in_([job.id for job in jobs]))
+                .values(status="failed", error="Прервана перезапуском сервера", artifact_path=None, finished_at=utcnow())
+            )
+            await db.commit()
+        # загрузка, которую задача так и не разобрала, больше никому не нужна
+        remove_files(path for job in jobs for path in job_files(job))
+        return len(jobs)
+
+    async def purge_artifacts(self) -> int:
+        # файлы экспорта старше JOB_ARTIFACT_TTL удаляются, задача остается со статусом и результатом
+        if JOB_ARTIFACT_TTL <= 0:
+            return 0
+        expired = utcnow() - timedelta(seconds=JOB_ARTIFACT_TTL)
+        async with self.session_factory() as db:
+            jobs = (await db.execute(
+                select(models.Job.id, models.Job.params, models.Job.artifact_path)
+                .where(models.Job.artifact_path.is_not(None), models.Job.finished_at < expired)
+            )).all()
+            if not jobs:
+                return 0
+            await db.execute(update(models.Job).where(models.Job.id.in_([job.id for job in jobs])).values(artifact_path=None))
+            await db.commit()
+        remove_files(path for job in jobs for path in job_files(job))
+        return len(jobs)
+
+    async def heartbeat(self):
+        now = utcnow()
+        async with self.session_factory() as db:
+            await db.execute(
+                update(models.Job)
+                .where(models.Job.owner == self.owner, models.Job.status.in_(ACTIVE_STATUSES))
+                .values(heartbeat_at=now)
+            )
+            if self.persist_progress:
+                for ctx in list(self.running.values()):
+                    # готовая задача уже записала итоговый прогресс, его не перезаписываем
+                    await db.execute(
+                        update(models.Job)
+                        .where(models.Job.id == ctx.job_id, models.Job.status == "running")
+                        .values(rows_done=ctx.rows_done, rows_total=ctx.rows_total)
+                    )
+            await db.commit()
+
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            try:
+                await self.heartbeat()
+                # задачи упавшего соседа закрываются без ожидания перезапуска
+                await self.fail_interrupted()
+                await self.purge_artifacts()
+            except Exception:
+                # пропущенный сигнал не страшен, пока пауза короче JOB_STALE_AFTER
+                pass
+
+    async def submit(self, kind: str, runner, params: dict, read_only: bool = False) -> dict:
+        # runner(db, ctx, **params) -> dict; ключ artifact_path в результате сохраняется отдельно;
+        # read_only: runner получает сессию read_session_factory
+        if self.queue.full():
+            raise HTTPException(status_code=503, detail="Очередь задач переполнена, повторите позже")
+
+        now = utcnow()
+        job = models.Job(
+            id=str(uuid.uuid4()), kind=kind, status="queued", params=params, rows_done=0,
+            created_at=now, owner=self.owner, heartbeat_at=now,
+        )
+        async with self.session_factory() as db:
+            db.add(job)
+            await db.commit()
+
+        try:
+            self.queue.put_nowait((job.id, runner, params, read_only))
+        except asyncio.QueueFull:
+            await self._update(job.id, status="failed", error="Очередь задач переполнена", finished_at=utcnow())
+            raise HTTPException(status_code=503, detail="Очередь задач переполнена, повторите позже")
+        return await self.get(job.id)
+
+    async def get(self, job_id: str) -> dict | None:
+        async with self.session_factory() as db:
+            job = await db.get(models.Job, job_id)
+        if job is None:
+            return None
+
+        data = {
+            "id": job.id,
+            "kind": job.kind,
+            "status": job.status,
+            "rows_done": job.rows_done,
+            "rows_total": job.rows_total,
+            "rows_per_sec": None,
+            "error": job.error,
+            "result": job.result,
+            "has_artifact": job.artifact_path is not None,
+            "created_at": job.created_at,
+            "started_at": job.started_at,
+            "finished_at": job.finished_at,
+        }
+        ctx = self.running.get(job_id)
+        if ctx is not None:
+            data.update(rows_done=ctx.rows_done, rows_total=ctx.rows_total, rows_per_sec=ctx.rows_per_sec())
+        else:
+            # задача другого воркера: прогресс на момент его последнего сигнала
+            measured_at = job.finished_at or (job.heartbeat_at if job.status == "running" else None)
+            if job.started_at and measured_at:
+                elapsed = (measured_at - job.started_at).total_seconds()
+                data["rows_per_sec"] = round(job.rows_done / elapsed) if elapsed > 0 else job.rows_done
+        return data
+
+    async def get_artifact(self, job_id: str) -> str | None:
+        async with self.session_factory() as db:
+            job = await db.get(models.Job, job_id)
+        if job is None or job.status != "done" or not job.artifact_path:
+            return None
+        return job.artifact_path if os.path.exists(job.artifact_path) else None
+
+    async def _update(self, job_id: str, **values):
+        async with self.session_factory() as db:
+            await db.execute(update(models.Job).where(models.Job.id == job_id).values(**values))
+            await db.commit()
+
+    async def _worker(self):
+        while True:
+            job_id, runner, params, read_only = await self.queue.get()
+            try:
+                await self._run(job_id, runner, params, read_only)
+            finally:
+                self.queue.task_done()
+
+    async def _run(self, job_id: str, runner, params: dict, read_only: bool = False):
+        ctx = JobContext(job_id)
+        self.running[job_id] = ctx
+        try:
+            now = utcnow()
+            await self._update(job_id, status="running", started_at=now, owner=self.owner, heartbeat_at=now)
+            try:
+                session_factory = self.read_session_factory if read_only else self.session_factory
+                async with session_factory() as db:
+                    result = await runner(db, ctx, **params)
+            except Exception as e:
+                error = getattr(e, "detail", None) or str(e) or type(e).__name__
+                remove_files([params["file_path"]] if params.get("file_path") else [])
+                await self._update(
+                    job_id, status="failed", error=str(error),
+                    rows_done=ctx.rows_done, rows_total=ctx.rows_total, finished_at=utcnow(),
+                )
+            else:
+                result = dict(result or {})
+                path = result.pop("artifact_path", None)
+                await self._update(
+                    job_id, status="done", result=result, artifact_path=path,
+                    rows_done=ctx.rows_done, rows_total=ctx.rows_total, finished_at=utcnow(),
+                )
+        finally:
+            self.running.pop(job_id, None)
+
+    async def join(self):
+        await self.queue.join()
+
+
+job_manager = JobManager(AsyncSessionLocal, read_session_factory=ReadSessionLocal)
@@ -1,10 +1,38 @@
+import os
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
-from app import models
-from app.database import engine
+from app import google_api
+from app.metrics import MetricsMiddleware
+from app.cpu_pool import cpu_pool
+from app.database import async_engine, replica_engine
+from app.jobs import job_manager
+from app.migrations import migrate
+from app.stats import stats_folder
 from app.routes import router, export_books
 
-models.Base.metadata.create_all(bind=engine)
+# схему готовит python -m app.migrations до старта воркеров; для одного процесса в разработке
+# можно включить MIGRATE_ON_STARTUP=1
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "0") == "1"
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    if MIGRATE_ON_STARTUP:
+        async with async_engine.begin() as conn:
+            await conn.run_sync(migrate)
+    # один пул соединений к Google Books на весь процесс
+    google_api.get_client()
+    await job_manager.start()
+    stats_folder.start(async_engine)
+    yield
+    await stats_folder.stop()
+    await job_manager.stop()
+    cpu_pool.shutdown()
+    await google_api.close_client()
+    await async_engine.dispose()
+    if replica_engine is not async_engine:
+        await replica_engine.dispose()
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(MetricsMiddleware)
 
 app.include_router(router, tags=["Import"])
@@ -0,0 +1,185 @@
+import bisect
+import os
+import time
+
+# метрики в памяти процесса, отдаются в текстовом формате prometheus на GET /metrics;
+# при нескольких воркерах у каждого свои значения, prometheus собирает их по отдельности
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+POOL_WAIT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+MEMORY_BUCKETS = tuple(2 ** power for power in range(16, 32, 2))
+THROUGHPUT_BUCKETS = (100, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 250_000, 500_000)
+
+
+def escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def format_labels(names: tuple, values: tuple, **extra) -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in (*zip(names, values), *extra.items())]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def format_value(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Counter:
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.values = {}
+
+    def inc(self, amount: float = 1, *labels):
+        self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self):
+        for labels, value in self.values.items():
+            yield f"{self.name}{format_labels(self.labelnames, labels)} {format_value(value)}"
+
+    def clear(self):
+        self.values.clear()
+
+
+class Histogram:
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: tuple = (), buckets: tuple = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # на каждую комбинацию меток: [счетчики по корзинам без накопления..., +Inf], сумма
+        self.values = {}
+
+    def observe(self, value: float, *labels):
+        entry = self.values.get(labels)
+        if entry is None:
+            entry = self.values[labels] = [[0] * (len(self.buckets) + 1), 0.0]
+        entry[0][bisect.bisect_left(self.buckets, value)] += 1
+        entry[1] += value
+
+    def samples(self):
+        for labels, (counts, total) in self.values.items():
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else format_value(bound)
+                yield f"{self.name}_bucket{format_labels(self.labelnames, labels, le=le)} {cumulative}"
+            yield f"{self.name}_sum{format_labels(self.labelnames, labels)} {format_value(total)}"
+            yield f"{self.name}_count{format_labels(self.labelnames, labels)} {cumulative}"
+
+    def clear(self):
+        self.values.clear()
+
+
+class Registry:
+    def __init__(self):
+        self.metrics = []
+
+    def register(self, metric):
+        self.metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self.metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type}")
+            lines.extend(metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def clear(self):
+        for metric in self.metrics:
+            metric.clear()
+
+
+registry = Registry()
+
+http_requests = registry.register(Counter(
+    "http_requests_total", "HTTP-запросы по маршруту и коду ответа", ("method", "route", "status"),
+))
+http_duration = registry.register(Histogram(
+    "http_request_duration_seconds", "Время ответа по маршруту, включая отдачу тела", ("method", "route"),
+))
+handler_duration = registry.register(Histogram(
+    "handler_duration_seconds", "Время выполнения обработчика", ("handler",),
+))
+handler_errors = registry.register(Counter(
+    "handler_errors_total", "Обработчики, завершившиеся исключением", ("handler",),
+))
+handler_memory = registry.register(Histogram(
+    "handler_memory_peak_bytes", "Пик памяти обработчика по выборочным замерам tracemalloc", ("handler",), MEMORY_BUCKETS,
+))
+rows_processed = registry.register(Counter(
+    "rows_processed_total", "Строки, обработанные импортом и экспортом", ("operation",),
+))
+rows_throughput = registry.register(Histogram(
+    "rows_per_second", "Скорость импорта и экспорта за одну операцию", ("operation",), THROUGHPUT_BUCKETS,
+))
+
+db_pool_wait = registry.register(Histogram(
+    "db_pool_wait_seconds", "Ожидание соединения из пула SQLAlchemy, включая открытие нового", ("engine",), POOL_WAIT_BUCKETS,
+))
+
+cpu_pool_wait = registry.register(Histogram(
+    "cpu_pool_wait_seconds", "Ожидание свободного места в пуле процессов для разбора и сборки xlsx", ("task",), POOL_WAIT_BUCKETS,
+))
+
+stats_folds = registry.register(Counter(
+    "book_stats_folds_total", "Свертки book_stats_delta в book_stats", ("status",),
+))
+
+
+def record_pool_wait(engine: str, seconds: float):
+    if METRICS_ENABLED:
+        db_pool_wait.observe(seconds, engine)
+
+
+def record_cpu_wait(task: str, seconds: float):
+    if METRICS_ENABLED:
+        cpu_pool_wait.observe(seconds, task)
+
+
+def record_stats_fold(status: str):
+    if METRICS_ENABLED:
+        stats_folds.inc(1, status)
+
+
+def record_rows(operation: str, rows: int, seconds: float):
+    if not METRICS_ENABLED:
+        return
+    rows_processed.inc(rows, operation)
+    if seconds > 0 and rows:
+        rows_throughput.observe(rows / seconds, operation)
+
+
+class MetricsMiddleware:
+    # чистый ASGI, без BaseHTTPMiddleware: не буферизует потоковые ответы и почти ничего не стоит
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            # шаблон пути, а не сам путь: иначе каждая книга станет отдельной серией
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "unmatched"
+            http_duration.observe(time.perf_counter() - start, scope["method"], route_path)
+            http_requests.inc(1, scope["method"], route_path, status[0])
@@ -0,0 +1,178 @@
+# Версионированные миграции схемы. Запускаются один раз перед стартом воркеров:
+#   python -m app.migrations            применить недостающие
+#   python -m app.migrations --status   показать примененные
+# Каждая миграция идемпотентна: проверяет, что уже есть в базе, поэтому подходит и для базы,
+# созданной старым create_all при импорте приложения.
+import argparse
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, bindparam, func, inspect, select, text, update
+from app import models, search, stats
+
+migrations_metadata = MetaData()
+
+schema_migrations = Table(
+    "schema_migrations",
+    migrations_metadata,
+    Column("version", Integer, primary_key=True),
+    Column("description", String, nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+# произвольное число для pg_advisory_xact_lock, общее для всех процессов приложения
+MIGRATION_LOCK_ID = 7_316_001
+
+
+def column_names(conn, table_name: str) -> set[str]:
+    return {column["name"] for column in inspect(conn).get_columns(table_name)}
+
+
+def create_tables(conn):
+    had_books = inspect(conn).has_table("books")
+    models.Base.metadata.create_all(conn, tables=[models.Book.__table__, models.Job.__table__])
+    # after_create с поисковым индексом срабатывает только для новой таблицы
+    if had_books:
+        search.rebuild_search_index(conn)
+
+
+def add_natural_key(conn):
+    if "natural_key" not in column_names(conn, "books"):
+        conn.execute(text("ALTER TABLE books ADD COLUMN natural_key VARCHAR"))
+        conn.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_books_natural_key ON books (natural_key)"))
+
+
+def add_timestamps(conn):
+    existing = column_names(conn, "books")
+    for name in ("created_at", "updated_at"):
+        if name not in existing:
+            conn.execute(text(f"ALTER TABLE books ADD COLUMN {name} TIMESTAMP"))
+    # старым строкам точное время создания неизвестно, ставим время миграции
+    books = models.Book.__table__
+    now = models.utcnow()
+    conn.execute(update(books).where(books.c.created_at.is_(None)).values(created_at=now, updated_at=func.coalesce(books.c.updated_at, now)))
+    conn.execute(update(books).where(books.c.updated_at.is_(None)).values(updated_at=books.c.created_at))
+    for index in books.indexes:
+        index.create(conn, checkfirst=True)
+
+
+def create_catalog_version(conn):
+    models.CatalogVersion.__table__.create(conn, checkfirst=True)
+    table = models.CatalogVersion.__table__
+    if conn.scalar(select(table.c.id).where(table.c.id == 1)) is None:
+        conn.execute(table.insert().values(id=1, version=0, updated_at=models.utcnow()))
+
+
+def create_book_stats(conn):
+    # триггеры уже пишут в book_stats_delta (миграция 7), поэтому она создается здесь же
+    models.BookStat.__table__.create(conn, checkfirst=True)
+    models.BookStatDelta.__table__.create(conn, checkfirst=True)
+    stats.install_triggers(conn)
+    stats.rebuild_book_stats(conn)
+
+
+def add_book_stats_delta(conn):
+    # первая версия book_stats обновляла общие строки счетчиков в каждой транзакции записи
+    models.BookStatDelta.__table__.create(conn, checkfirst=True)
+    conn.execute(text("DROP INDEX IF EXISTS ix_book_stats_facet_books"))
+    stats.install_triggers(conn)
+    stats.rebuild_book_stats(conn)
+
+
+def backfill_natural_key(conn):
+    # раньше ключ заполнял только импорт по естественному ключу. Из дублей (одинаковые title, author,
+    # year) ключ получает самая ранняя книга, остальные остаются с null: миграция книги не удаляет,
+    # лишние копии видны по WHERE natural_key IS NULL
+    books = models.Book.__table__
+    taken = set(conn.scalars(select(books.c.natural_key).where(books.c.natural_key.is_not(None))))
+    rows = conn.execute(
+        select(books.c.id, books.c.title, books.c.author, books.c.year)
+        .where(books.c.natural_key.is_(None))
+        .order_by(books.c.created_at, books.c.id)
+    ).all()
+    params = []
+    for book_id, title, author, year in rows:
+        key = models.natural_key(title, author, year)
+        if key not in taken:
+            taken.add(key)
+            params.append({"b_id": book_id, "b_key": key})
+    if params:
+        # updated_at не трогаем: книга не менялась
+        conn.execute(
+            update(books).where(books.c.id == bindparam("b_id")).values(natural_key=bindparam("b_key"), updated_at=books.c.updated_at),
+            params,
+        )
+
+
+def add_job_heartbeat(conn):
+    existing = column_names(conn, "jobs")
+    if "owner" not in existing:
+        conn.execute(text("ALTER TABLE jobs ADD COLUMN owner VARCHAR"))
+    if "heartbeat_at" not in existing:
+        conn.execute(text("ALTER TABLE jobs ADD COLUMN heartbeat_at TIMESTAMP"))
+
+
+def add_year_sort_index(conn):
+    for index in models.Book.__table__.indexes:
+        index.create(conn, checkfirst=True)
+
+
+MIGRATIONS = [
+    (1, "таблицы books и jobs, поисковый индекс", create_tables),
+    (2, "books.natural_key для импорта upsert", add_natural_key),
+    (3, "books.created_at/updated_at и индексы для сортировки", add_timestamps),
+    (4, "catalog_version для кэша экспорта", create_catalog_version),
+    (5, "book_stats: счетчики по автору и году с триггерами", create_book_stats),
+    (6, "books.natural_key для всех книг, дубли остаются с null", backfill_natural_key),
+    (7, "book_stats_delta: триггеры только дописывают изменения счетчиков", add_book_stats_delta),
+    (8, "jobs.owner/heartbeat_at: прерванными считаются только задачи без сигнала", add_job_heartbeat),
+    (9, "индекс (year, id) для sort_by=year", add_year_sort_index),
+]
+
+
+def applied_versions(conn) -> set[int]:
+    if not inspect(conn).has_table("schema_migrations"):
+        return set()
+    return set(conn.scalars(select(schema_migrations.c.version)))
+
+
+def migrate(conn) -> list[int]:
+    # conn: синхронное соединение внутри транзакции (engine.begin() или AsyncConnection.run_sync)
+    if conn.dialect.name == "postgresql":
+        # второй процесс, запущенный одновременно, ждет первого и потом видит примененные версии
+        conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": MIGRATION_LOCK_ID})
+    migrations_metadata.create_all(conn)
+
+    done = applied_versions(conn)
+    applied = []
+    for version, description, apply in MIGRATIONS:
+        if version in done:
+            continue
+        apply(conn)
+        conn.execute(schema_migrations.insert().values(
+            version=version,
+            description=description,
+            applied_at=models.utcnow(),
+        ))
+        applied.append(version)
+    return applied
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--status", action="store_true")
+    args = parser.parse_args()
+
+    from app.database import engine
+
+    if args.status:
+        with engine.connect() as conn:
+            done = applied_versions(conn)
+        for version, description, _ in MIGRATIONS:
+            print(f"{version:>4} {'+' if version in done else '-'} {description}")
+        return
+
+    with engine.begin() as conn:
+        applied = migrate(conn)
+    print(f"применены миграции: {', '.join(map(str, applied))}" if applied else "схема актуальна")
+
+
+if __name__ == "__main__":
+    main()
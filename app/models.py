@@ -1,9 +1,29 @@
-from sqlalchemy import Column, String, Integer, create_engine, DateTime
+import hashlib
+from datetime import datetime, timezone
+from sqlalchemy import Column, String, Integer, DateTime, Index, JSON
 from sqlalchemy.orm import declarative_base
 import uuid
 
 Base = declarative_base()
 
+
+def utcnow() -> datetime:
+    # в sqlite DateTime хранится без зоны, поэтому везде наивное UTC-время
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def natural_key(title, author, year) -> str:
+    # регистр и лишние пробелы не различаем: "Война и мир " и "война и  мир" одна книга
+    parts = (" ".join(str(value).lower().split()) if value is not None else "" for value in (title, author, year))
+    return hashlib.sha1("\x1f".join(parts).encode("utf-8")).hexdigest()
+
+
+def book_natural_key(context) -> str:
+    # default для любой вставки (ORM, Core insert, executemany): ключ из вставляемых title/author/year
+    params = context.get_current_parameters()
+    return natural_key(params.get("title"), params.get("author"), params.get("year"))
+
+
 class Book(Base):
     __tablename__ = "books"
 
@@ -11,7 +31,72 @@ class Book(Base):
     title = Column(String, nullable=False)
     author = Column(String, nullable=False)
     year = Column(Integer, nullable=True)
+    # естественный ключ (title, author, year): одна книга в каталоге один раз. Вставки заполняют
+    # его сами (book_natural_key), изменения title/author/year пересчитывают явно (crud);
+    # null только у дублей, найденных миграцией 6
+    natural_key = Column(String, nullable=True, unique=True, default=book_natural_key)
+    # default/onupdate срабатывают и в ORM, и в Core insert/update (массовые вставки, импорт);
+    # on conflict do update выставляет updated_at сам, см. crud.upsert_books
+    created_at = Column(DateTime, nullable=False, default=utcnow)
+    updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow)
+
+    # сортировки GET /books/ (sort_by) идут по индексу; id в конце — второй ключ курсора
+    __table_args__ = (
+        Index("ix_books_created_at", "created_at", "id"),
+        Index("ix_books_updated_at", "updated_at", "id"),
+        Index("ix_books_author_year", "author", "year", "id"),
+        Index("ix_books_year_created_at", "year", "created_at", "id"),
+        # sort_by=year без фильтра: (year, created_at, id) не подходит для порядка (year, id)
+        Index("ix_books_year_id", "year", "id"),
+    )
+
+
+class CatalogVersion(Base):
+    # одна строка (id=1): растет в той же транзакции, что и любая запись в books;
+    # общий для всех воркеров ключ кэша файлов экспорта и их ETag
+    __tablename__ = "catalog_version"
 
+    id = Column(Integer, primary_key=True)
+    version = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime, nullable=False, default=utcnow)
 
-engine = create_engine("sqlite:///./test.db", echo=True)
-Base.metadata.create_all(bind=engine)
+
+class BookStat(Base):
+    # счетчики книг по группам для GET /books/stats: facet "author" и "year" (value — автор или год
+    # строкой, '' — год не указан) и одна строка "total"; свернутая часть, см. app.stats
+    __tablename__ = "book_stats"
+
+    facet = Column(String, primary_key=True)
+    value = Column(String, primary_key=True)
+    books = Column(Integer, nullable=False, default=0)
+
+
+class BookStatDelta(Base):
+    # изменения счетчиков, которые триггеры на books только дописывают: запись в books не блокирует
+    # общие строки book_stats; периодически сворачиваются в book_stats
+    __tablename__ = "book_stats_delta"
+
+    id = Column(Integer, primary_key=True, autoincrement=True)
+    facet = Column(String, nullable=False)
+    value = Column(String, nullable=False)
+    books = Column(Integer, nullable=False)
+
+
+class Job(Base):
+    __tablename__ = "jobs"
+
+    id = Column(String, primary_key=True, default=lambda: str(uuid.uuid4()))
+    kind = Column(String, nullable=False)
+    status = Column(String, nullable=False, default="queued")
+    params = Column(JSON, nullable=False, default=dict)
+    result = Column(JSON, nullable=True)
+    error = Column(String, nullable=True)
+    rows_done = Column(Integer, nullable=False, default=0)
+    rows_total = Column(Integer, nullable=True)
+    artifact_path = Column(String, nullable=True)
+    created_at = Column(DateTime, nullable=False)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+    # процесс, в очереди которого задача, и время его последнего сигнала
+    owner = Column(String, nullable=True)
+    heartbeat_at = Column(DateTime, nullable=True)
@@ -0,0 +1,92 @@
+import base64
+import json
+import os
+from datetime import datetime
+from fastapi import HTTPException
+from sqlalchemy import DateTime, and_, or_, tuple_
+from app import models
+
+MAX_PAGE_SIZE = int(os.getenv("MAX_PAGE_SIZE", "1000"))
+
+# поля для sort_by в GET /books/; под каждое есть индекс (поле, ..., id), см. models.Book
+SORT_FIELDS = ("created_at", "updated_at", "year")
+
+
+def encode_cursor(values: dict) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str) -> dict:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    if not isinstance(values, dict) or not isinstance(values.get("id"), str):
+        raise HTTPException(status_code=400, detail="Некорректный курсор")
+    return values
+
+
+def sort_clauses(sort_by: str | None, order: str = "asc") -> list:
+    # id вторым ключом, чтобы порядок был полным; null (только year) всегда в конце asc и в начале desc,
+    # как лежит индекс postgres, на sqlite порядок по умолчанию другой, поэтому указываем явно
+    id_column = models.Book.id
+    if sort_by is None:
+        return [id_column.desc() if order == "desc" else id_column]
+    column = getattr(models.Book, sort_by)
+    if order == "desc":
+        first = column.desc().nulls_first() if column.nullable else column.desc()
+        return [first, id_column.desc()]
+    return [column.asc().nulls_last() if column.nullable else column, id_column]
+
+
+def after_cursor(sort_by: str | None, order: str, values: dict):
+    # строки строго после последней на странице в порядке sort_clauses
+    id_column, last_id = models.Book.id, values["id"]
+    descending = order == "desc"
+    if sort_by is None:
+        return id_column < last_id if descending else id_column > last_id
+
+    column = getattr(models.Book, sort_by)
+    value = values.get("value")
+    if value is not None and isinstance(column.type, DateTime):
+        value = datetime.fromisoformat(value)
+    key, last = tuple_(column, id_column), tuple_(value, last_id)
+
+    if not column.nullable:
+        return key < last if descending else key > last
+    if descending:
+        # null идут первыми: после null-строк дальше null с меньшим id, потом все непустые
+        if value is None:
+            return or_(and_(column.is_(None), id_column < last_id), column.is_not(None))
+        return key < last
+    if value is None:
+        return and_(column.is_(None), id_column > last_id)
+    return or_(key > last, column.is_(None))
+
+
+def cursor_values(book, sort_by: str | None, order: str) -> dict:
+    values = {"id": book.id}
+    if order == "desc":
+        values["order"] = order
+    if sort_by is not None:
+        value = getattr(book, sort_by)
+        values.update(sort=sort_by, value=value.isoformat() if isinstance(value, datetime) else value)
+    return values
+
+
+async def keyset_page(db, query, limit: int, cursor: str | None = None, sort_by: str | None = None, order: str = "asc"):
+    # WHERE (поле, id) > последние ORDER BY поле, id: страница N стоит как первая, идет по индексу
+    if cursor:
+        values = decode_cursor(cursor)
+        if values.get("sort") != sort_by or values.get("order", "asc") != order:
+            raise HTTPException(status_code=400, detail="Курсор выдан для другой сортировки")
+        query = query.where(after_cursor(sort_by, order, values))
+    result = await db.execute(query.order_by(*sort_clauses(sort_by, order)).limit(limit + 1))
+    # select(Book) отдает объекты, выборка по колонкам — строки с теми же атрибутами
+    rows = (result.scalars() if len(query.column_descriptions) == 1 else result).all()
+
+    items = rows[:limit]
+    next_cursor = encode_cursor(cursor_values(items[-1], sort_by, order)) if len(rows) > limit else None
+    return items, next_cursor
@@ -1,68 +1,185 @@
-from fastapi import APIRouter, Depends, HTTPException, Query, Body, UploadFile
-from sqlalchemy.orm import Session
-from app.database import get_db, engine
-from app import crud, schemas
-from app.schemas import BookRead, BookFilter
-from app.models import Base
-from app.handlers.external import fetch_and_save_books_handler
-from app.handlers.internal import import_books_from_excel, export_books_handler, export_books_handler_openpyxl,import_books_from_openpyxl
-
-
-Base.metadata.drop_all(bind=engine)
-Base.metadata.create_all(bind=engine)
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Header, Query, Body, UploadFile
+from fastapi.responses import PlainTextResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+from app.database import get_db, get_read_db
+from app import crud, metrics, schemas
+from app.schemas import BookRead, BookFilter, BookPage
+from app.pagination import MAX_PAGE_SIZE
+from app.handlers.external import fetch_and_save_books_handler, fetch_and_save_books_batch_handler, google_cache
+from app.cache import query_cache
+from app.handlers.internal import import_books_from_excel, export_books_handler, export_books_handler_openpyxl,import_books_from_openpyxl, export_books_handler_streaming, IMPORT_CHUNK_SIZE
 
 router = APIRouter()
 
 
 @router.get("/books/export")
-async def export_books(format: str = "xlsx", db: Session = Depends(get_db)):
-    return await export_books_handler(db, format)
+async def export_books(
+    format: str = "xlsx",
+    stream: bool = False,
+    if_none_match: str | None = Header(None),
+    db: AsyncSession = Depends(get_read_db)
+):
+    if stream or format != "xlsx":
+        return await export_books_handler_streaming(db, format, if_none_match)
+    return await export_books_handler(db, format, if_none_match)
+
+ImportMode = Literal["append", "upsert", "skip_existing"]
+ImportKey = Literal["natural", "id"]
 
 @router.post("/import-books/")
-async def import_books(file: UploadFile, db: Session = Depends(get_db)):
+async def import_books(
+    file: UploadFile,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=100_000),
+    mode: ImportMode = "append",
+    key: ImportKey = Query("natural", description="natural: (title, author, year), id: колонка id из файла"),
+    db: AsyncSession = Depends(get_db)
+):
     if not file.filename.endswith((".xlsx", ".xlsm")):
         raise HTTPException(status_code=400, detail="Файл должен быть в формате .xlsx или .xlsm")
 
-    result = await import_books_from_excel(file, db)
-    return {"status": "ok", "imported": result}
+    result = await import_books_from_excel(file, db, chunk_size, mode, key)
+    return {"status": "ok", **result}
 
 @router.get("/export/openpyxl")
-async def export_books_openpyxl(db: Session = Depends(get_db)):
-    return await export_books_handler_openpyxl(db=db)
+async def export_books_openpyxl(stream: bool = False, if_none_match: str | None = Header(None), db: AsyncSession = Depends(get_read_db)):
+    if stream:
+        return await export_books_handler_streaming(db=db, if_none_match=if_none_match)
+    return await export_books_handler_openpyxl(db=db, if_none_match=if_none_match)
 
 @router.post("/import/openpyxl")
-async def import_books_openpyxl(file: UploadFile, db: Session = Depends(get_db)):
-    return await import_books_from_openpyxl(file=file, db=db)
+async def import_books_openpyxl(
+    file: UploadFile,
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=100_000),
+    mode: ImportMode = "append",
+    key: ImportKey = "natural",
+    db: AsyncSession = Depends(get_db)
+):
+    return await import_books_from_openpyxl(file=file, db=db, chunk_size=chunk_size, mode=mode, key=key)
+
+@router.post("/jobs/import", status_code=202, response_model=schemas.JobOut)
+async def create_import_job(
+    file: UploadFile,
+    engine: Literal["openpyxl", "pandas"] = "openpyxl",
+    chunk_size: int = Query(IMPORT_CHUNK_SIZE, ge=1, le=100_000),
+    mode: ImportMode = "append",
+    key: ImportKey = "natural",
+):
+    from app.handlers.internal import create_import_job_handler
+    return await create_import_job_handler(file, engine, chunk_size, mode, key)
+
+@router.post("/jobs/export", status_code=202, response_model=schemas.JobOut)
+async def create_export_job(format: str = "xlsx"):
+    from app.handlers.internal import create_export_job_handler
+    return await create_export_job_handler(format)
+
+@router.get("/jobs/{job_id}", response_model=schemas.JobOut)
+async def get_job(job_id: str):
+    from app.handlers.internal import get_job_handler
+    return await get_job_handler(job_id)
+
+@router.get("/jobs/{job_id}/artifact")
+async def get_job_artifact(job_id: str):
+    from app.handlers.internal import get_job_artifact_handler
+    return await get_job_artifact_handler(job_id)
 
 @router.post("/admin/fetch-and-save-books/", response_model=list[BookRead])
 async def fetch_and_save_books_route(
-    title: str = Body(..., embed=True, description="Название книги для поиска"),
+    title: str | None = Body(None, embed=True, description="Название книги для поиска"),
+    author: str | None = Body(None, embed=True, description="Автор"),
+    year: str | None = Body(None, embed=True, description="Год издания"),
     password: str = Body(..., embed=True, description="Пароль администратора"),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
-    return await fetch_and_save_books_handler(title=title, password=password, db=db)
+    return await fetch_and_save_books_handler(title=title, author=author, year=year, password=password, db=db)
+
+@router.post("/admin/fetch-and-save-books/batch", response_model=schemas.GoogleBatchResult)
+async def fetch_and_save_books_batch_route(request: schemas.GoogleBatchRequest, db: AsyncSession = Depends(get_db)):
+    return await fetch_and_save_books_batch_handler(request, db)
+
+@router.get("/admin/google-cache")
+async def google_cache_stats():
+    return google_cache.stats()
 
-@router.get("/books/", response_model=list[BookRead])
+@router.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
+@router.get("/admin/query-cache")
+async def query_cache_stats():
+    return query_cache.stats()
+
+@router.get("/admin/export-cache")
+async def export_cache_stats():
+    from app.artifacts import export_cache
+    return export_cache.stats()
+
+@router.get("/books/", response_model=list[BookRead] | BookPage)
 async def get_books_by_properties(
     filters: BookFilter = Depends(),
     skip: int = Query(0, ge=0),
-    limit: int = Query(10, ge=1),
-    db: Session = Depends(get_db)
+    limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE),
+    pagination: Literal["offset", "cursor"] = "offset",
+    cursor: str | None = Query(None, description="next_cursor с предыдущей страницы"),
+    db: AsyncSession = Depends(get_read_db)
 ):
-    from app.handlers.internal import get_books_by_filters
-    return await get_books_by_filters(db, filters, skip, limit)
+    from app.handlers.internal import books_json_response, get_books_by_filters, get_books_page_by_filters
+    if pagination == "cursor" or cursor:
+        return books_json_response(await get_books_page_by_filters(db, filters, limit, cursor))
+    return books_json_response(await get_books_by_filters(db, filters, skip, limit))
+
+@router.post("/books/bulk", response_model=schemas.BulkResult)
+async def bulk_create_books(books: list[schemas.BookCreate], db: AsyncSession = Depends(get_db)):
+    from app.handlers.internal import bulk_create_books_handler
+    return await bulk_create_books_handler(books, db)
+
+@router.patch("/books/bulk", response_model=schemas.BulkResult)
+async def bulk_update_books(books: list[schemas.BookBulkUpdate], db: AsyncSession = Depends(get_db)):
+    from app.handlers.internal import bulk_update_books_handler
+    return await bulk_update_books_handler(books, db)
+
+@router.delete("/books/bulk", response_model=schemas.BulkResult)
+async def bulk_delete_books(ids: list[str] = Body(...), db: AsyncSession = Depends(get_db)):
+    from app.handlers.internal import bulk_delete_books_handler
+    return await bulk_delete_books_handler(ids, db)
 
 @router.post("/books", response_model=schemas.BookOut)
-def create_book(book: schemas.BookCreate, db: Session = Depends(get_db)):
+async def create_book(book: schemas.BookCreate, db: AsyncSession = Depends(get_db)):
     from app.handlers.internal import create_book_handler
-    return create_book_handler(book, db)
+    return await create_book_handler(book, db)
 
 @router.put("/{book_id}", response_model=schemas.Book)
-def update_book(book_id: str, book: schemas.BookCreate, db: Session = Depends(get_db)):
+async def update_book(book_id: str, book: schemas.BookCreate, db: AsyncSession = Depends(get_db)):
     from app.handlers.internal import update_book_handler
-    return update_book_handler(book_id, book, db)
+    return await update_book_handler(book_id, book, db)
 
 @router.delete("/{book_id}")
-def delete_book(book_id: str, db: Session = Depends(get_db)):
+async def delete_book(book_id: str, db: AsyncSession = Depends(get_db)):
     from app.handlers.internal import delete_book_handler
-    return delete_book_handler(book_id, db)
+    return await delete_book_handler(book_id, db)
+
+
+@router.get("/books/stream", response_class=StreamingResponse)
+async def stream_books(
+    filters: BookFilter = Depends(),
+    gzip: bool = Query(False, description="сжать ответ (Content-Encoding: gzip)"),
+    db: AsyncSession = Depends(get_read_db)
+):
+    from app.handlers.internal import stream_books_handler
+    return await stream_books_handler(db, filters, gzip)
+
+@router.get("/books/stats", response_model=schemas.BookStats)
+async def book_stats(
+    top_authors: int = Query(10, ge=1, le=1000),
+    db: AsyncSession = Depends(get_read_db)
+):
+    from app.handlers.internal import get_book_stats_handler
+    return await get_book_stats_handler(db, top_authors)
+
+# должен идти последним среди GET /books/..., иначе перехватит export и другие пути
+# с основной базы, не с реплики: результат кэшируется под версией после последней записи, и
+# выборка с отставшей реплики держалась бы в кэше весь TTL. Промах — одно чтение по первичному ключу
+@router.get("/books/{book_id}", response_model=BookRead)
+async def get_book(book_id: str, db: AsyncSession = Depends(get_db)):
+    from app.handlers.internal import get_book_handler
+    return await get_book_handler(book_id, db)
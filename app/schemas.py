@@ -1,5 +1,6 @@
-from pydantic import BaseModel
-from typing import Optional, Literal
+from pydantic import BaseModel, ConfigDict, Field
+from datetime import datetime
+from typing import Any, Optional, Literal
 
 class BookBase(BaseModel):
     title: str
@@ -11,6 +12,8 @@ class BookFilter(BaseModel):
     title: Optional[str] = None
     author: Optional[str] = None
     year: Optional[int] = None
+    sort_by: Optional[Literal["created_at", "updated_at", "year"]] = None
+    order: Literal["asc", "desc"] = "asc"
 
 class BookCreate(BaseModel):
     title: str
@@ -21,16 +24,91 @@ class Book(BookBase):
     id: str
 
 class BookOut(BookCreate):
-    id: str
+    model_config = ConfigDict(from_attributes=True)
 
-    class Config:
-        orm_mode = True
+    id: str
 
 class BookRead(BaseModel):
+    model_config = ConfigDict(from_attributes=True)
+
     id: str
     title: str
     author: str
     year: Optional[int] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+class BookPage(BaseModel):
+    items: list[BookRead]
+    next_cursor: Optional[str] = None
+
+class AuthorCount(BaseModel):
+    author: str
+    books: int
+
+class YearCount(BaseModel):
+    year: Optional[int] = None
+    books: int
+
+class BookStats(BaseModel):
+    total: int
+    authors: list[AuthorCount]
+    years: list[YearCount]
+
+class BookBulkUpdate(BaseModel):
+    id: str
+    title: Optional[str] = None
+    author: Optional[str] = None
+    year: Optional[int] = None
+
+class BulkItemResult(BaseModel):
+    index: int
+    id: Optional[str] = None
+    status: Literal["created", "updated", "deleted", "not_found", "invalid"]
+    detail: Optional[str] = None
+
+class BulkResult(BaseModel):
+    total: int
+    succeeded: int
+    failed: int
+    items: list[BulkItemResult]
+
+class JobOut(BaseModel):
+    id: str
+    kind: str
+    status: Literal["queued", "running", "done", "failed"]
+    rows_done: int
+    rows_total: Optional[int] = None
+    rows_per_sec: Optional[int] = None
+    error: Optional[str] = None
+    result: Optional[dict[str, Any]] = None
+    has_artifact: bool = False
+    created_at: datetime
+    started_at: Optional[datetime] = None
+    finished_at: Optional[datetime] = None
+
+class GoogleQuery(BaseModel):
+    title: Optional[str] = None
+    author: Optional[str] = None
+    year: Optional[int] = None
+
+class GoogleBatchRequest(BaseModel):
+    password: str
+    queries: list[GoogleQuery]
+    limit: int = Field(5, ge=1, le=40)
+
+class GoogleQueryResult(BaseModel):
+    index: int
+    status: Literal["ok", "not_found", "error"]
+    found: int
+    inserted: int
+    existing: int
+    detail: Optional[str] = None
 
-    class Config:
-        orm_mode = True
\ No newline at end of file
+class GoogleBatchResult(BaseModel):
+    queries: int
+    found: int
+    inserted: int
+    existing: int
+    failed: int
+    items: list[GoogleQueryResult]
@@ -0,0 +1,70 @@
+from sqlalchemy import DDL, column, event, func, literal_column, table
+from app import models
+
+# fts5 trigram ищет подстроки только от 3 символов, короче уходим в ilike
+FTS_MIN_LENGTH = 3
+TEXT_FIELDS = ("title", "author")
+
+books_fts = table("books_fts", column("rowid"), column("rank"))
+
+SQLITE_SEARCH_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5("
+    "title, author, content='books', content_rowid='rowid', tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ai AFTER INSERT ON books BEGIN "
+    "INSERT INTO books_fts(rowid, title, author) VALUES (new.rowid, new.title, new.author); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_ad AFTER DELETE ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author); END",
+    "CREATE TRIGGER IF NOT EXISTS books_fts_au AFTER UPDATE OF title, author ON books BEGIN "
+    "INSERT INTO books_fts(books_fts, rowid, title, author) VALUES ('delete', old.rowid, old.title, old.author); "
+    "INSERT INTO books_fts(rowid, title, author) VALUES (new.rowid, new.title, new.author); END",
+]
+
+POSTGRES_SEARCH_DDL = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX IF NOT EXISTS ix_books_title_trgm ON books USING gin (title gin_trgm_ops)",
+    "CREATE INDEX IF NOT EXISTS ix_books_author_trgm ON books USING gin (author gin_trgm_ops)",
+]
+
+for statement in SQLITE_SEARCH_DDL:
+    event.listen(models.Book.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_SEARCH_DDL:
+    event.listen(models.Book.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+# виртуальная таблица не удаляется вместе с books, иначе после пересоздания в ней останутся старые rowid
+event.listen(models.Book.__table__, "before_drop", DDL("DROP TABLE IF EXISTS books_fts").execute_if(dialect="sqlite"))
+
+
+def rebuild_search_index(conn):
+    # для базы, где books уже заполнена до появления индекса
+    if conn.dialect.name == "sqlite":
+        for statement in SQLITE_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+        conn.exec_driver_sql("INSERT INTO books_fts(books_fts) VALUES ('rebuild')")
+    elif conn.dialect.name == "postgresql":
+        for statement in POSTGRES_SEARCH_DDL:
+            conn.exec_driver_sql(statement)
+
+
+def fts_phrase(field: str, value: str) -> str:
+    return f'{field} : "{value.replace(chr(34), chr(34) * 2)}"'
+
+
+def apply_text_search(query, dialect_name: str, ranked: bool = True, **terms):
+    terms = {field: value for field, value in terms.items() if field in TEXT_FIELDS and value}
+    if not terms:
+        return query
+
+    if dialect_name == "sqlite" and all(len(value) >= FTS_MIN_LENGTH for value in terms.values()):
+        match = " AND ".join(fts_phrase(field, value) for field, value in terms.items())
+        query = (
+            query.join(books_fts, books_fts.c.rowid == literal_column("books.rowid"))
+            .where(literal_column("books_fts").op("MATCH")(match))
+        )
+        return query.order_by(books_fts.c.rank) if ranked else query
+
+    # на postgres ilike '%v%' использует gin_trgm_ops индексы
+    for field, value in terms.items():
+        query = query.where(getattr(models.Book, field).ilike(f"%{value}%"))
+    if dialect_name == "postgresql" and ranked:
+        similarity = [func.similarity(getattr(models.Book, field), value) for field, value in terms.items()]
+        query = query.order_by((similarity[0] if len(similarity) == 1 else func.greatest(*similarity)).desc())
+    return query
@@ -0,0 +1,173 @@
+# разбор и сборка xlsx: чистые функции без базы и event loop, выполняются в процессах app.cpu_pool.
+# Между процессами ходят только пути к файлам; строки передаются через файл-спул из pickle-пачек
+import os
+import pickle
+import uuid
+from typing import TYPE_CHECKING
+from app.models import natural_key
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+EXPORT_HEADER = ["ID", "title", "author", "year"]
+
+
+def dump_batch(f, rows: list):
+    pickle.dump(rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+def read_batches(spool_path: str):
+    with open(spool_path, "rb") as f:
+        while True:
+            try:
+                yield pickle.load(f)
+            except EOFError:
+                return
+
+
+def generate_uuids(count: int) -> list[str]:
+    # uuid4 пачкой: случайные байты одним вызовом, биты версии/варианта проставляем векторно
+    import numpy as np
+
+    raw = np.frombuffer(os.urandom(16 * count), dtype=np.uint8).reshape(count, 16).copy()
+    raw[:, 6] = (raw[:, 6] & 0x0F) | 0x40
+    raw[:, 8] = (raw[:, 8] & 0x3F) | 0x80
+    h = raw.tobytes().hex()
+    return [
+        f"{h[i:i + 8]}-{h[i + 8:i + 12]}-{h[i + 12:i + 16]}-{h[i + 16:i + 20]}-{h[i + 20:i + 32]}"
+        for i in range(0, 32 * count, 32)
+    ]
+
+def cell_text(value) -> str:
+    return str(value).strip() if value is not None else ""
+
+
+def parse_year(value) -> tuple[int | None, bool]:
+    # как pd.to_numeric(errors="coerce") в prepare_books_frame: (год или None, был ли год некорректным)
+    if value is None or (isinstance(value, str) and not value.strip()):
+        return None, False
+    try:
+        number = float(value)
+    except (TypeError, ValueError):
+        return None, True
+    if not number.is_integer():
+        return None, True
+    return int(number), False
+
+
+def prepare_books_frame(df: "pd.DataFrame", key: str | None = None) -> tuple["pd.DataFrame", dict]:
+    import pandas as pd
+
+    df = df.rename(columns=lambda c: str(c).strip().lower())
+
+    required_columns = {"title", "author", "year"} | ({"id"} if key == "id" else set())
+    if not required_columns.issubset(df.columns):
+        missing = required_columns - set(df.columns)
+        raise ValueError(f"Отсутствуют колонки: {', '.join(missing)}")
+
+    title = df["title"].astype("string").str.strip()
+    author = df["author"].astype("string").str.strip()
+    valid = title.notna() & (title != "") & author.notna() & (author != "")
+    if key == "id":
+        ids = df["id"].astype("string").str.strip()
+        valid &= ids.notna() & (ids != "")
+
+    year = pd.to_numeric(df["year"], errors="coerce")
+    bad_year = valid & df["year"].notna() & (year.isna() | (year % 1 != 0))
+    year = year.where(~bad_year & year.notna())
+
+    frame = pd.DataFrame({
+        "title": title[valid].astype(object),
+        "author": author[valid].astype(object),
+        "year": year[valid].astype("Int64").astype(object).where(year[valid].notna(), None),
+    })
+    frame.insert(0, "id", ids[valid].astype(object) if key == "id" else generate_uuids(len(frame)))
+    frame["natural_key"] = [natural_key(*row) for row in zip(frame["title"], frame["author"], frame["year"])]
+
+    stats = {"skipped": int((~valid).sum()), "invalid_year": int(bad_year.sum())}
+    return frame, stats
+
+
+def parse_xlsx_pandas(file_path: str, spool_path: str, chunk_size: int, key: str | None = None) -> dict:
+    # готовые строки пачками по chunk_size в спул, как в parse_xlsx_rows: родительский процесс
+    # читает по пачке, а не весь DataFrame разом
+    import pandas as pd
+
+    frame, stats = prepare_books_frame(pd.read_excel(file_path, engine="openpyxl"), key)
+    with open(spool_path, "wb") as spool:
+        for start in range(0, len(frame), chunk_size):
+            dump_batch(spool, frame.iloc[start:start + chunk_size].to_dict("records"))
+    return {**stats, "rows": len(frame)}
+
+
+def parse_xlsx_rows(file_path: str, spool_path: str, chunk_size: int, mode: str = "append", key: str = "natural") -> dict:
+    # строки листа пачками по chunk_size в спул; правила те же, что в prepare_books_frame:
+    # пустые title/author пропускаются (skipped), нецелый год становится null (invalid_year);
+    # rows — сколько строк записано в спул
+    from openpyxl import load_workbook
+
+    wb = load_workbook(filename=file_path, read_only=True, data_only=True)
+    try:
+        ws = wb.active
+        rows = ws.iter_rows(values_only=True)
+
+        headers = [str(value).strip().lower() if value is not None else "" for value in next(rows, ())]
+        by_id = mode != "append" and key == "id"
+        required_columns = {"title", "author", "year"} | ({"id"} if by_id else set())
+        if not required_columns.issubset(headers):
+            missing = required_columns - set(headers)
+            raise ValueError(f"Отсутствуют колонки: {', '.join(missing)}")
+
+        title_idx, author_idx, year_idx = (headers.index(c) for c in ("title", "author", "year"))
+        id_idx = headers.index("id") if by_id else None
+
+        skipped = invalid_year = total = 0
+        chunk = []
+        with open(spool_path, "wb") as spool:
+            for row in rows:
+                if not any(value is not None for value in row):
+                    continue
+                title = cell_text(row[title_idx]) if title_idx < len(row) else ""
+                author = cell_text(row[author_idx]) if author_idx < len(row) else ""
+                book_id = (cell_text(row[id_idx]) if id_idx < len(row) else "") if by_id else str(uuid.uuid4())
+                if not title or not author or not book_id:
+                    skipped += 1
+                    continue
+                year, bad_year = parse_year(row[year_idx] if year_idx < len(row) else None)
+                invalid_year += int(bad_year)
+                book = {"id": book_id, "title": title, "author": author, "year": year}
+                book["natural_key"] = natural_key(book["title"], book["author"], book["year"])
+                chunk.append(book)
+                total += 1
+                if len(chunk) >= chunk_size:
+                    dump_batch(spool, chunk)
+                    chunk = []
+            if chunk:
+                dump_batch(spool, chunk)
+    finally:
+        wb.close()
+
+    return {"skipped": skipped, "invalid_year": invalid_year, "rows": total}
+
+
+def write_xlsx_openpyxl(spool_path: str, file_path: str) -> int:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(EXPORT_HEADER)
+    rows = 0
+    for batch in read_batches(spool_path):
+        for row in batch:
+            ws.append(list(row))
+        rows += len(batch)
+    wb.save(file_path)
+    return rows
+
+
+def write_xlsx_pandas(spool_path: str, file_path: str) -> int:
+    import pandas as pd
+
+    data = [row for batch in read_batches(spool_path) for row in batch]
+    pd.DataFrame(data, columns=EXPORT_HEADER).to_excel(file_path, index=False, engine="openpyxl")
+    return len(data)
@@ -0,0 +1,201 @@
+# Счетчики книг по автору и году. Триггеры на books в той же транзакции, что и запись, только
+# дописывают изменения в book_stats_delta: одиночные create/update/delete, массовые операции, импорт
+# и загрузка из Google не блокируют общие строки счетчиков и не ждут друг друга. Чтение складывает
+# book_stats и еще не свернутые изменения; StatsFolder периодически сворачивает их в book_stats.
+#   python -m app.stats --fold       свернуть сейчас
+#   python -m app.stats --rebuild    пересчитать все по books (починка)
+import argparse
+import asyncio
+import os
+from sqlalchemy import DDL, delete, event, func, insert, literal, select, text
+from app import metrics, models
+
+# секунды между свертками в каждом воркере; 0 — не сворачивать в этом процессе
+STATS_FOLD_INTERVAL = float(os.getenv("STATS_FOLD_INTERVAL", "5"))
+# произвольное число для pg_advisory_xact_lock: свертку и пересчет выполняет один процесс за раз
+STATS_LOCK_ID = 7_316_002
+
+FACETS = ("author", "year")
+TRIGGERS = ("book_stats_ai", "book_stats_ad", "book_stats_au")
+
+
+def sqlite_delta_values(row: str, books: int) -> str:
+    return (
+        f"('author', {row}.author, {books}), "
+        f"('year', coalesce(cast({row}.year AS TEXT), ''), {books})"
+    )
+
+
+# в sqlite триггеры только построчные, но запись и так одна на всю базу
+SQLITE_STATS_DDL = [
+    *(f"DROP TRIGGER IF EXISTS {name}" for name in TRIGGERS),
+    "CREATE TRIGGER book_stats_ai AFTER INSERT ON books BEGIN "
+    f"INSERT INTO book_stats_delta(facet, value, books) VALUES ('total', '', 1), {sqlite_delta_values('new', 1)}; END",
+    "CREATE TRIGGER book_stats_ad AFTER DELETE ON books BEGIN "
+    f"INSERT INTO book_stats_delta(facet, value, books) VALUES ('total', '', -1), {sqlite_delta_values('old', -1)}; END",
+    # total при изменении не меняется, триггер срабатывает, только если сменилась группа
+    "CREATE TRIGGER book_stats_au AFTER UPDATE OF author, year ON books "
+    "WHEN old.author IS NOT new.author OR old.year IS NOT new.year BEGIN "
+    "INSERT INTO book_stats_delta(facet, value, books) VALUES "
+    f"{sqlite_delta_values('old', -1)}, {sqlite_delta_values('new', 1)}; END",
+]
+
+
+def postgres_delta_function(name: str, changes: str) -> str:
+    # changes: (author, year, books) по строкам оператора; в delta уходит одна строка на группу
+    return (
+        f"CREATE OR REPLACE FUNCTION {name}() RETURNS trigger AS $$ BEGIN "
+        f"WITH changes AS ({changes}) "
+        "INSERT INTO book_stats_delta(facet, value, books) "
+        "SELECT facet, value, sum(books) FROM ("
+        "SELECT 'total' AS facet, '' AS value, books FROM changes "
+        "UNION ALL SELECT 'author', author, books FROM changes "
+        "UNION ALL SELECT 'year', coalesce(year::text, ''), books FROM changes"
+        ") deltas GROUP BY facet, value HAVING sum(books) <> 0; "
+        "RETURN NULL; END $$ LANGUAGE plpgsql"
+    )
+
+
+CHANGED_ROWS = "FROM old_rows o JOIN new_rows n ON n.id = o.id WHERE o.author IS DISTINCT FROM n.author OR o.year IS DISTINCT FROM n.year"
+
+# триггеры на оператор с таблицами переходов: импорт пачки в 5000 строк дописывает по строке на группу
+POSTGRES_STATS_DDL = [
+    *(f"DROP TRIGGER IF EXISTS {name} ON books" for name in TRIGGERS),
+    # построчные функции первой версии (миграция 5)
+    "DROP FUNCTION IF EXISTS book_stats_row()",
+    "DROP FUNCTION IF EXISTS book_stats_add(text, integer, integer, integer)",
+    postgres_delta_function("book_stats_ai", "SELECT author, year, 1 AS books FROM new_rows"),
+    postgres_delta_function("book_stats_ad", "SELECT author, year, -1 AS books FROM old_rows"),
+    postgres_delta_function(
+        "book_stats_au",
+        f"SELECT o.author, o.year, -1 AS books {CHANGED_ROWS} UNION ALL SELECT n.author, n.year, 1 {CHANGED_ROWS}",
+    ),
+    "CREATE TRIGGER book_stats_ai AFTER INSERT ON books REFERENCING NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION book_stats_ai()",
+    "CREATE TRIGGER book_stats_ad AFTER DELETE ON books REFERENCING OLD TABLE AS old_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION book_stats_ad()",
+    # у триггера с таблицами переходов не бывает списка колонок (UPDATE OF), изменения групп отбирает CHANGED_ROWS
+    "CREATE TRIGGER book_stats_au AFTER UPDATE ON books REFERENCING OLD TABLE AS old_rows NEW TABLE AS new_rows "
+    "FOR EACH STATEMENT EXECUTE FUNCTION book_stats_au()",
+]
+
+# тела триггеров проверяются при срабатывании, поэтому их можно создать вместе с books,
+# даже если book_stats_delta появится позже в том же create_all
+for statement in SQLITE_STATS_DDL:
+    event.listen(models.Book.__table__, "after_create", DDL(statement).execute_if(dialect="sqlite"))
+for statement in POSTGRES_STATS_DDL:
+    event.listen(models.Book.__table__, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+
+
+def install_triggers(conn):
+    statements = {"sqlite": SQLITE_STATS_DDL, "postgresql": POSTGRES_STATS_DDL}.get(conn.dialect.name, [])
+    for statement in statements:
+        conn.exec_driver_sql(statement)
+
+
+def fold_book_stats(conn) -> int:
+    # conn: синхронное соединение внутри транзакции; возвращает число затронутых групп.
+    # Блокирует только строки book_stats и свернутые строки delta, запись в books не ждет
+    if conn.dialect.name == "postgresql":
+        if not conn.scalar(text("SELECT pg_try_advisory_xact_lock(:lock_id)"), {"lock_id": STATS_LOCK_ID}):
+            return 0
+        # забираем только видимые (закоммиченные) изменения; группы по порядку, без взаимных блокировок
+        groups = conn.execute(text(
+            "WITH moved AS (DELETE FROM book_stats_delta RETURNING facet, value, books) "
+            "INSERT INTO book_stats(facet, value, books) "
+            "SELECT facet, value, sum(books) FROM moved GROUP BY facet, value ORDER BY facet, value "
+            "ON CONFLICT (facet, value) DO UPDATE SET books = book_stats.books + excluded.books"
+        )).rowcount
+    else:
+        # в sqlite транзакция записи одна на базу, между чтением и удалением delta никто не пишет
+        last_id = conn.scalar(select(func.max(models.BookStatDelta.id)))
+        if last_id is None:
+            return 0
+        groups = conn.execute(text(
+            "INSERT INTO book_stats(facet, value, books) "
+            "SELECT facet, value, sum(books) FROM book_stats_delta WHERE id <= :last_id GROUP BY facet, value "
+            "ON CONFLICT (facet, value) DO UPDATE SET books = book_stats.books + excluded.books"
+        ), {"last_id": last_id}).rowcount
+        conn.execute(delete(models.BookStatDelta).where(models.BookStatDelta.id <= last_id))
+    stats = models.BookStat.__table__
+    conn.execute(delete(stats).where(stats.c.books <= 0, stats.c.facet != "total"))
+    return groups
+
+
+def rebuild_book_stats(conn) -> int:
+    # conn: синхронное соединение внутри транзакции; возвращает число групп
+    books = models.Book.__table__
+    stats = models.BookStat.__table__
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": STATS_LOCK_ID})
+        # запись в books ждет конца пересчета, иначе ее изменение потеряется между delete и insert
+        conn.execute(text("LOCK TABLE books IN SHARE MODE"))
+    conn.execute(delete(models.BookStatDelta))
+    conn.execute(delete(stats))
+    year_value = func.coalesce(books.c.year.cast(models.BookStat.value.type), "")
+    groups = [
+        select(literal("total"), literal(""), func.count()).select_from(books),
+        select(literal("author"), books.c.author, func.count()).group_by(books.c.author),
+        select(literal("year"), year_value, func.count()).group_by(year_value),
+    ]
+    for query in groups:
+        conn.execute(insert(stats).from_select(["facet", "value", "books"], query))
+    return conn.scalar(select(func.count()).select_from(stats).where(stats.c.facet != "total"))
+
+
+class StatsFolder:
+    # фоновая свертка в каждом воркере; на postgres одновременно сворачивает только один
+    def __init__(self, interval: float = STATS_FOLD_INTERVAL):
+        self.interval = interval
+        self.task = None
+
+    def start(self, engine):
+        if self.interval > 0:
+            self.task = asyncio.create_task(self._run(engine))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            await asyncio.gather(self.task, return_exceptions=True)
+            self.task = None
+
+    async def fold(self, engine) -> int:
+        async with engine.begin() as conn:
+            return await conn.run_sync(fold_book_stats)
+
+    async def _run(self, engine):
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.fold(engine)
+            except Exception:
+                # несвернутые изменения остаются в delta и учитываются при чтении
+                metrics.record_stats_fold("error")
+            else:
+                metrics.record_stats_fold("ok")
+
+
+stats_folder = StatsFolder()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rebuild", action="store_true", help="пересчитать book_stats по всей таблице books")
+    parser.add_argument("--fold", action="store_true", help="свернуть book_stats_delta в book_stats")
+    args = parser.parse_args()
+    if not args.rebuild and not args.fold:
+        parser.error("нужен --rebuild или --fold")
+
+    from app.database import engine
+
+    with engine.begin() as conn:
+        if args.rebuild:
+            install_triggers(conn)
+            groups = rebuild_book_stats(conn)
+            print(f"book_stats пересчитана: {groups} групп")
+        else:
+            print(f"свернуто групп: {fold_book_stats(conn)}")
+
+
+if __name__ == "__main__":
+    main()
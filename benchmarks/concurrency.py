@@ -0,0 +1,56 @@
+# Пропускная способность /books/ при разном числе одновременных запросов:
+# python -m benchmarks.concurrency --rows 50000 --requests 2000
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+
+async def run_level(client, in_flight: int, requests: int) -> float:
+    queue = asyncio.Queue()
+    for i in range(requests):
+        queue.put_nowait(i)
+
+    async def worker():
+        while not queue.empty():
+            i = queue.get_nowait()
+            response = await client.get("/books/", params={"author": f"Author {i % 500}", "limit": 20})
+            assert response.status_code == 200, response.text
+
+    start_time = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(in_flight)))
+    return requests / (time.perf_counter() - start_time)
+
+
+async def main_async(args):
+    import httpx
+    from app.database import async_engine, engine
+    from app.main import app
+    from benchmarks.export_formats import fill_books
+
+    fill_books(engine, args.rows)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        print(f"{'in-flight':>9} {'req/sec':>9}")
+        for in_flight in args.levels:
+            print(f"{in_flight:>9} {await run_level(client, in_flight, args.requests):>9.0f}")
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=50_000)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--levels", type=int, nargs="*", default=[1, 4, 16, 64])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # DATABASE_URL нужно выставить до импорта app
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
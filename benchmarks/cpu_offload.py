@@ -0,0 +1,99 @@
+# Задержка легких запросов (GET /books/{id}) во время сборки большого xlsx-экспорта:
+# сборка в обработчике (CPU_POOL_WORKERS=0) против пула процессов.
+# python -m benchmarks.cpu_offload --rows 100000 --exports 2
+import argparse
+import asyncio
+import os
+import random
+import tempfile
+import time
+
+
+async def light_requests(client, rows: int, stop: asyncio.Event, interval: float) -> list[float]:
+    # запросы по расписанию: задержка считается от запланированного момента, поэтому
+    # время, когда loop был занят и не мог даже отправить запрос, тоже попадает в замер
+    latencies = []
+
+    async def one(scheduled_at: float):
+        response = await client.get(f"/books/{random.randrange(rows):032x}")
+        assert response.status_code == 200, response.text
+        latencies.append(time.perf_counter() - scheduled_at)
+
+    tasks = []
+    next_at = time.perf_counter()
+    while not stop.is_set():
+        tasks.append(asyncio.create_task(one(next_at)))
+        next_at += interval
+        await asyncio.sleep(max(0, next_at - time.perf_counter()))
+    await asyncio.gather(*tasks)
+    return latencies
+
+
+async def run_mode(client, args, workers: int) -> dict:
+    from app import handlers
+    from app.artifacts import ArtifactCache
+    from app.cpu_pool import CpuPool
+
+    pool = CpuPool(workers=workers, max_jobs=max(workers, 1))
+    handlers.internal.cpu_pool = pool
+    if workers:
+        await pool.run(time.sleep, 0)
+
+    with tempfile.TemporaryDirectory() as cache_dir:
+        # пустой кэш файлов: каждый экспорт собирается заново
+        handlers.internal.export_cache = ArtifactCache(cache_dir)
+        stop = asyncio.Event()
+        light = asyncio.create_task(light_requests(client, args.rows, stop, args.interval))
+        start_time = time.perf_counter()
+        await asyncio.gather(*(client.get("/export/openpyxl") for _ in range(args.exports)))
+        export_seconds = time.perf_counter() - start_time
+        stop.set()
+        latencies = sorted(await light)
+    pool.shutdown()
+
+    def percentile(share: float) -> float:
+        return latencies[min(len(latencies) - 1, int(share * len(latencies)))] * 1000
+
+    return {"export_s": export_seconds, "requests": len(latencies), "p50_ms": percentile(0.5), "p99_ms": percentile(0.99), "max_ms": latencies[-1] * 1000}
+
+
+async def main_async(args):
+    import httpx
+    from app.database import async_engine, engine
+    from app.main import app
+    from app.migrations import migrate
+    from benchmarks.export_formats import fill_books
+
+    with engine.begin() as conn:
+        migrate(conn)
+    fill_books(engine, args.rows)
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=600) as client:
+        print(f"{'mode':<12} {'export s':>9} {'light req':>9} {'p50 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+        for label, workers in (("inline", 0), (f"pool x{args.workers}", args.workers)):
+            result = await run_mode(client, args, workers)
+            print(
+                f"{label:<12} {result['export_s']:>9.2f} {result['requests']:>9} "
+                f"{result['p50_ms']:>8.1f} {result['p99_ms']:>8.1f} {result['max_ms']:>8.1f}"
+            )
+    await async_engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--exports", type=int, default=2, help="одновременных экспортов")
+    parser.add_argument("--workers", type=int, default=2, help="процессов в пуле")
+    parser.add_argument("--interval", type=float, default=0.01, help="пауза между легкими запросами, секунд")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # DATABASE_URL нужно выставить до импорта app
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        os.environ.setdefault("QUERY_CACHE_BACKEND", "off")
+        asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
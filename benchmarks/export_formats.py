@@ -0,0 +1,53 @@
+# Замер экспорта по форматам: python -m benchmarks.export_formats --rows 100000
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, insert
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import models
+from app.exporters import EXPORT_WRITERS, get_writer, iter_export
+
+
+def fill_books(engine, rows: int, chunk_size: int = 10_000):
+    models.Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for start in range(0, rows, chunk_size):
+            conn.execute(insert(models.Book), [
+                {"id": f"{i:032x}", "title": f"Book title {i}", "author": f"Author {i % 5000}", "year": 1900 + i % 125}
+                for i in range(start, min(start + chunk_size, rows))
+            ])
+
+
+async def export_all(url: str, args):
+    engine = create_async_engine(url)
+    print(f"{'format':<8} {'seconds':>8} {'rows/sec':>10} {'MB':>8}")
+    for file_format in args.formats:
+        async with AsyncSession(bind=engine) as db:
+            start_time = time.perf_counter()
+            size = 0
+            async for chunk in iter_export(db, get_writer(file_format), args.batch_size):
+                size += len(chunk)
+            elapsed = time.perf_counter() - start_time
+        print(f"{file_format:<8} {elapsed:>8.2f} {args.rows / elapsed:>10.0f} {size / 10**6:>8.2f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=100_000)
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--formats", nargs="*", default=list(EXPORT_WRITERS))
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+        fill_books(engine, args.rows)
+
+        engine.dispose()
+        asyncio.run(export_all(f"sqlite+aiosqlite:///{os.path.join(tmp_dir, 'bench.db')}", args))
+
+
+if __name__ == "__main__":
+    main()
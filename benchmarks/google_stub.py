@@ -0,0 +1,79 @@
+# Локальная замена Google Books volumes API для нагрузочных прогонов:
+# python -m benchmarks.google_stub --port 8099 --latency 0.05 --error-rate 0.02
+# приложению передать GOOGLE_API_URL=http://127.0.0.1:8099/volumes
+import argparse
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+class StubVolumesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        settings = self.server.settings
+        delay = settings["latency"] * random.uniform(1 - settings["jitter"], 1 + settings["jitter"])
+        if delay > 0:
+            time.sleep(delay)
+
+        if random.random() < settings["error_rate"]:
+            self.reply(503, {"error": {"code": 503, "message": "stub error"}})
+            return
+
+        params = parse_qs(urlparse(self.path).query)
+        query = params.get("q", [""])[0]
+        limit = int(params.get("maxResults", ["5"])[0])
+        # ответ зависит только от запроса: одинаковые поиски дают одни и те же id
+        seed = zlib.crc32(query.encode("utf-8"))
+        items = [
+            {
+                "id": f"stub-{seed}-{i}",
+                "volumeInfo": {"title": f"Stub {query} {i}", "authors": [f"Stub author {i}"], "publishedDate": f"{1950 + i}-01-01"},
+            }
+            for i in range(limit)
+        ]
+        self.reply(200, {"totalItems": len(items), "items": items})
+
+    def reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, jitter: float = 0.5, error_rate: float = 0.0):
+    server = ThreadingHTTPServer((host, port), StubVolumesHandler)
+    server.daemon_threads = True
+    server.settings = {"latency": latency, "jitter": jitter, "error_rate": error_rate}
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/volumes"
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--latency", type=float, default=0.05, help="средняя задержка ответа, секунд")
+    parser.add_argument("--jitter", type=float, default=0.5, help="разброс задержки, доля от latency")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 503")
+    args = parser.parse_args()
+
+    server, url = start_stub(port=args.port, latency=args.latency, jitter=args.jitter, error_rate=args.error_rate)
+    print(f"заглушка Google Books: {url}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+# Нагрузочный прогон: приложение на SQLite + заглушка Google Books, смешанный трафик с заданным RPS.
+#   python -m benchmarks.loadtest --rps 50 --duration 30 --rows 20000 --google-latency 0.1 --google-error-rate 0.05
+# Запросы отправляются по расписанию (открытая модель): медленный ответ не задерживает следующие,
+# поэтому перцентили не занижены из-за coordinated omission.
+import argparse
+import asyncio
+import io
+import itertools
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+# вес сценария в общем потоке запросов
+DEFAULT_MIX = {
+    "search_hit": 35,
+    "search_miss": 10,
+    "get_book": 25,
+    "create": 8,
+    "update": 8,
+    "delete": 6,
+    "import": 2,
+    "export": 1,
+}
+
+
+def parse_mix(value: str) -> dict:
+    mix = dict(DEFAULT_MIX)
+    for part in filter(None, value.split(",")):
+        name, weight = part.split("=")
+        if name not in DEFAULT_MIX:
+            raise argparse.ArgumentTypeError(f"неизвестный сценарий {name}")
+        mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def small_xlsx(rows: int = 100) -> bytes:
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["title", "author", "year"])
+    for i in range(rows):
+        ws.append([f"Load title {i}", f"Load author {i % 10}", 2000 + i % 20])
+    buffer = io.BytesIO()
+    wb.save(buffer)
+    return buffer.getvalue()
+
+
+class Scenarios:
+    def __init__(self, client, rows: int):
+        self.client = client
+        self.rows = rows
+        self.created = []
+        # книги, которые сейчас обновляются: delete их не берет, иначе put получил бы 404 из-за самого прогона
+        self.updating = set()
+        # title/author/year уникальны в каталоге (409 на дубль), поэтому у каждой записи свой номер
+        self.sequence = itertools.count()
+        self.xlsx = small_xlsx()
+
+    def unique_book(self) -> dict:
+        n = next(self.sequence)
+        return {"title": f"Load {n}", "author": f"Load author {n % 100}", "year": 1900 + n % 120}
+
+    async def search_hit(self):
+        return await self.client.get("/books/", params={"title": f"title {random.randrange(self.rows)}", "limit": 20})
+
+    async def search_miss(self):
+        # такого в каталоге нет, обработчик идет в Google Books (заглушку)
+        return await self.client.get("/books/", params={"title": f"nohit {random.randrange(10**6)}", "limit": 5})
+
+    async def get_book(self):
+        return await self.client.get(f"/books/{random.randrange(self.rows):032x}")
+
+    async def create(self):
+        response = await self.client.post("/books", json=self.unique_book())
+        if response.status_code == 200:
+            self.created.append(response.json()["id"])
+        return response
+
+    async def update(self):
+        if not self.created:
+            return await self.create()
+        book_id = random.choice(self.created)
+        self.updating.add(book_id)
+        try:
+            return await self.client.put(f"/{book_id}", json=self.unique_book())
+        finally:
+            self.updating.discard(book_id)
+
+    async def delete(self):
+        idle = [book_id for book_id in self.created if book_id not in self.updating]
+        if not idle:
+            return await self.create()
+        self.created.remove(idle[-1])
+        return await self.client.delete(f"/{idle[-1]}")
+
+    async def import_(self):
+        files = {"file": ("load.xlsx", self.xlsx, "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet")}
+        return await self.client.post("/import/openpyxl", files=files)
+
+    async def export(self):
+        return await self.client.get("/books/export", params={"format": "csv"})
+
+    def get(self, name: str):
+        return getattr(self, "import_" if name == "import" else name)
+
+
+def percentile(values: list[float], share: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, round(share * len(ordered)) - 1))]
+
+
+def summarize(samples: dict, elapsed: float) -> dict:
+    report = {}
+    for name, entries in sorted(samples.items()):
+        if not entries:
+            continue
+        latencies = [latency for latency, _ in entries]
+        errors = sum(1 for _, ok in entries if not ok)
+        report[name] = {
+            "requests": len(entries),
+            "rps": round(len(entries) / elapsed, 1),
+            "errors": errors,
+            "error_rate": round(errors / len(entries), 4),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "max_ms": round(max(latencies) * 1000, 2),
+        }
+    return report
+
+
+async def drive(base_url: str, args) -> tuple[dict, float]:
+    import httpx
+
+    mix = args.mix
+    names, weights = list(mix), list(mix.values())
+    samples = {name: [] for name in names}
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.timeout) as client:
+        scenarios = Scenarios(client, args.rows)
+        in_flight = asyncio.Semaphore(args.max_in_flight)
+
+        async def one(name: str, scheduled_at: float):
+            # задержка считается от запланированного момента, ожидание свободного слота тоже в нее входит
+            async with in_flight:
+                try:
+                    response = await scenarios.get(name)()
+                    # каждый сценарий при нормальной работе сервиса получает 2xx; 404 и 409 — тоже ошибки
+                    ok = 200 <= response.status_code < 300
+                except httpx.HTTPError:
+                    ok = False
+                samples[name].append((time.perf_counter() - scheduled_at, ok))
+
+        tasks = []
+        interval = 1 / args.rps
+        started = time.perf_counter()
+        deadline = started + args.duration
+        next_at = started
+        while next_at < deadline:
+            delay = next_at - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(one(random.choices(names, weights)[0], next_at)))
+            next_at += interval
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - started
+    return summarize(samples, elapsed), elapsed
+
+
+def wait_ready(base_url: str, process, timeout: float = 30):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"приложение завершилось с кодом {process.returncode}")
+        try:
+            if httpx.get(f"{base_url}/metrics", timeout=1).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError("приложение не поднялось")
+
+
+def print_report(report: dict, elapsed: float, target_rps: float):
+    total = sum(entry["requests"] for entry in report.values())
+    errors = sum(entry["errors"] for entry in report.values())
+    print(f"{total} запросов за {elapsed:.1f} с ({total / elapsed:.1f} rps при цели {target_rps}), ошибок {errors}")
+    print(f"{'scenario':<12} {'requests':>8} {'rps':>7} {'err %':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, entry in report.items():
+        print(
+            f"{name:<12} {entry['requests']:>8} {entry['rps']:>7} {entry['error_rate'] * 100:>6.1f} "
+            f"{entry['p50_ms']:>8} {entry['p95_ms']:>8} {entry['p99_ms']:>8} {entry['max_ms']:>8}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rps", type=float, default=50)
+    parser.add_argument("--duration", type=float, default=30, help="секунд")
+    parser.add_argument("--rows", type=int, default=20_000, help="размер каталога перед прогоном")
+    parser.add_argument("--mix", type=parse_mix, default=dict(DEFAULT_MIX), help="например search_hit=50,export=0")
+    parser.add_argument("--max-in-flight", type=int, default=256)
+    parser.add_argument("--timeout", type=float, default=30)
+    parser.add_argument("--google-latency", type=float, default=0.05)
+    parser.add_argument("--google-error-rate", type=float, default=0.0)
+    parser.add_argument("--workers", type=int, default=1, help="воркеров uvicorn")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="сохранить отчет в JSON")
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    from benchmarks.google_stub import start_stub
+
+    stub, stub_url = start_stub(latency=args.google_latency, error_rate=args.google_error_rate)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "load.db")
+        port = free_port()
+        base_url = f"http://127.0.0.1:{port}"
+        env = {
+            **os.environ,
+            "DATABASE_URL": f"sqlite:///{db_path}",
+            "GOOGLE_API_URL": stub_url,
+            "JOB_ARTIFACT_DIR": os.path.join(tmp_dir, "jobs"),
+        }
+        subprocess.run([sys.executable, "-m", "app.migrations"], env=env, check=True, stdout=subprocess.DEVNULL)
+        process = subprocess.Popen(
+            [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(args.workers), "--log-level", "warning"],
+            env=env,
+        )
+        try:
+            wait_ready(base_url, process)
+            from sqlalchemy import create_engine
+            from benchmarks.export_formats import fill_books
+
+            engine = create_engine(f"sqlite:///{db_path}")
+            fill_books(engine, args.rows)
+            engine.dispose()
+
+            report, elapsed = asyncio.run(drive(base_url, args))
+        finally:
+            process.terminate()
+            process.wait(timeout=30)
+            stub.shutdown()
+
+    print_report(report, elapsed, args.rps)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"settings": {k: v for k, v in vars(args).items() if k != "output"}, "scenarios": report}, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Стоимость глубокой страницы: offset против курсора
+# python -m benchmarks.pagination --rows 500000
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, select
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from app import models
+from app.pagination import encode_cursor, keyset_page
+from benchmarks.export_formats import fill_books
+
+
+async def time_page(db, depth: int, limit: int, repeat: int) -> tuple[float, float]:
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        (await db.scalars(select(models.Book).order_by(models.Book.id).offset(depth).limit(limit))).all()
+    offset_ms = (time.perf_counter() - start_time) / repeat * 1000
+
+    # id в fill_books это номер строки в hex, курсор на depth-ю строку строим напрямую
+    cursor = encode_cursor({"id": f"{depth - 1:032x}"}) if depth else None
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        await keyset_page(db, select(models.Book), limit, cursor)
+    keyset_ms = (time.perf_counter() - start_time) / repeat * 1000
+    return offset_ms, keyset_ms
+
+
+async def main_async(args, db_path: str):
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}")
+    async with AsyncSession(bind=engine) as db:
+        print(f"{'depth':>9} {'offset ms':>10} {'cursor ms':>10}")
+        for depth in [0, args.rows // 10, args.rows // 2, args.rows - args.limit]:
+            offset_ms, keyset_ms = await time_page(db, depth, args.limit, args.repeat)
+            print(f"{depth:>9} {offset_ms:>10.2f} {keyset_ms:>10.2f}")
+    await engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rows", type=int, default=500_000)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        db_path = os.path.join(tmp_dir, "bench.db")
+        engine = create_engine(f"sqlite:///{db_path}")
+        fill_books(engine, args.rows)
+        engine.dispose()
+        asyncio.run(main_async(args, db_path))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,47 @@
+# Задержка поиска по title/author в зависимости от размера каталога:
+# python -m benchmarks.search --sizes 10000 100000
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine, select
+from sqlalchemy.orm import Session
+from app import models
+from app.search import apply_text_search
+from benchmarks.export_formats import fill_books
+
+# первый запрос избирательный, второй совпадает с заметной долей каталога:
+# fts платит за ранжирование всех совпадений, ilike с limit без сортировки останавливается раньше
+QUERIES = [{"title": "title 4242"}, {"author": "Author 17"}]
+
+
+def time_query(db: Session, dialect_name: str, terms: dict, repeat: int, limit: int = 20) -> float:
+    query = apply_text_search(select(models.Book.id), dialect_name, **terms).limit(limit)
+    start_time = time.perf_counter()
+    for _ in range(repeat):
+        db.execute(query).all()
+    return (time.perf_counter() - start_time) / repeat * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="*", default=[10_000, 100_000])
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'rows':>9} {'query':<24} {'fts ms':>8} {'ilike ms':>9}")
+    for size in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            engine = create_engine(f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")
+            fill_books(engine, size)
+            with Session(bind=engine) as db:
+                for terms in QUERIES:
+                    # "generic" отключает fts и дает обычный ilike со сканом таблицы
+                    fts = time_query(db, "sqlite", terms, args.repeat)
+                    ilike = time_query(db, "generic", terms, args.repeat)
+                    print(f"{size:>9} {str(terms):<24} {fts:>8.2f} {ilike:>9.2f}")
+            engine.dispose()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+# Холодный старт: время импорта app.main и время до первого ответа uvicorn с N воркерами
+# python -m benchmarks.startup --repeat 5 --workers 1 4
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from benchmarks.loadtest import free_port, wait_ready
+
+IMPORT_SNIPPET = "import time; start = time.perf_counter(); import app.main; print(time.perf_counter() - start)"
+
+
+def import_seconds(env: dict) -> float:
+    result = subprocess.run([sys.executable, "-c", IMPORT_SNIPPET], env=env, capture_output=True, text=True, check=True)
+    return float(result.stdout.strip().splitlines()[-1])
+
+
+def ready_seconds(env: dict, workers: int) -> float:
+    port = free_port()
+    start_time = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--workers", str(workers), "--log-level", "warning"],
+        env=env,
+    )
+    try:
+        # /metrics отвечает только текущий воркер, но до первого ответа должен подняться хотя бы один
+        wait_ready(f"http://127.0.0.1:{port}", process, timeout=60)
+        return time.perf_counter() - start_time
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--workers", type=int, nargs="*", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        env = {**os.environ, "DATABASE_URL": f"sqlite:///{os.path.join(tmp_dir, 'startup.db')}"}
+        subprocess.run([sys.executable, "-m", "app.migrations"], env=env, check=True, stdout=subprocess.DEVNULL)
+
+        imports = [import_seconds(env) for _ in range(args.repeat)]
+        print(f"{'measure':<22} {'median s':>9} {'min s':>7}")
+        print(f"{'import app.main':<22} {statistics.median(imports):>9.3f} {min(imports):>7.3f}")
+        for workers in args.workers:
+            timings = [ready_seconds(env, workers) for _ in range(args.repeat)]
+            label = f"uvicorn ready, {workers}w"
+            print(f"{label:<22} {statistics.median(timings):>9.3f} {min(timings):>7.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,313 @@
+# Набор замеров импорта, экспорта, фильтров /books/, страниц списка и CRUD на синтетическом каталоге.
+#   python -m benchmarks.suite run --sizes 10000 100000 --output bench.json
+#   python -m benchmarks.suite compare baseline.json bench.json --threshold 0.25
+# Postgres замеряется, если задан BENCH_POSTGRES_URL (все таблицы в этой базе пересоздаются).
+import argparse
+import asyncio
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+
+def generate_xlsx(path: str, rows: int):
+    from openpyxl import Workbook
+
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet()
+    ws.append(["title", "author", "year"])
+    for i in range(rows):
+        ws.append([f"Book title {i}", f"Author {i % 5000}", 1900 + i % 125])
+    wb.save(path)
+
+
+def reset_schema(sync_engine):
+    from app import models
+
+    models.Base.metadata.drop_all(bind=sync_engine)
+    models.Base.metadata.create_all(bind=sync_engine)
+
+
+async def timed(func, repeat: int, before=None) -> list[float]:
+    timings = []
+    for _ in range(repeat):
+        if before:
+            before()
+        start_time = time.perf_counter()
+        await func()
+        timings.append(time.perf_counter() - start_time)
+    return timings
+
+
+async def import_cases(bench, rows: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.handlers.internal import import_books_xlsx_file
+
+    xlsx_path = os.path.join(bench.tmp_dir, f"import_{rows}.xlsx")
+    if not os.path.exists(xlsx_path):
+        generate_xlsx(xlsx_path, rows)
+
+    async def pandas_import():
+        async with AsyncSession(bind=bench.async_engine) as db:
+            await import_books_xlsx_file(db, xlsx_path, engine="pandas")
+
+    async def openpyxl_import():
+        async with AsyncSession(bind=bench.async_engine) as db:
+            await import_books_xlsx_file(db, xlsx_path)
+
+    # импорт каждый раз в пустую таблицу, пересоздание схемы в замер не входит
+    reset = lambda: reset_schema(bench.sync_engine)
+    yield "import_pandas", rows, await timed(pandas_import, bench.repeat, reset)
+    yield "import_openpyxl", rows, await timed(openpyxl_import, bench.repeat, reset)
+
+
+async def export_cases(bench, rows: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.exporters import EXPORT_WRITERS, get_writer, iter_export
+    from app.handlers.internal import export_books_handler, export_books_handler_openpyxl
+
+    async def legacy(handler):
+        async with AsyncSession(bind=bench.async_engine) as db:
+            response = await handler(db)
+        os.remove(response.path)
+
+    yield "export_pandas", rows, await timed(lambda: legacy(export_books_handler), bench.repeat)
+    yield "export_openpyxl", rows, await timed(lambda: legacy(export_books_handler_openpyxl), bench.repeat)
+
+    for file_format in EXPORT_WRITERS:
+        async def streaming():
+            async with AsyncSession(bind=bench.async_engine) as db:
+                async for _ in iter_export(db, get_writer(file_format)):
+                    pass
+
+        yield f"export_stream_{file_format}", rows, await timed(streaming, bench.repeat)
+
+
+def filter_terms(rows: int) -> dict:
+    # фильтры подобраны под данные fill_books, чтобы ни один не уходил в Google Books
+    middle = rows // 2
+    return {
+        "filter_id": {"book_id": f"{middle:032x}"},
+        "filter_title": {"title": f"title {middle}"},
+        "filter_author": {"author": "Author 17"},
+        "filter_year": {"year": 1950},
+    }
+
+
+async def filter_cases(bench, rows: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app.handlers.internal import get_books_by_filters
+    from app.schemas import BookFilter
+
+    async with AsyncSession(bind=bench.async_engine) as db:
+        for name, terms in filter_terms(rows).items():
+            filters = BookFilter(**terms)
+            await get_books_by_filters(db, filters, 0, 20)
+            yield name, None, await timed(lambda: get_books_by_filters(db, filters, 0, 20), bench.queries)
+
+
+async def crud_cases(bench, rows: int):
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app import crud, schemas
+
+    async def round_trip():
+        async with AsyncSession(bind=bench.async_engine, expire_on_commit=False) as db:
+            book = await crud.create_book(db, schemas.BookCreate(title="Bench", author="Bench", year=2000))
+            await crud.get_book(db, book.id)
+            await crud.update_book(db, book.id, schemas.BookCreate(title="Bench 2", author="Bench", year=2001))
+            await crud.delete_book(db, book.id)
+
+    yield "crud_round_trip", None, await timed(round_trip, bench.queries)
+
+
+PAGE_SIZES = (100, 1_000, 10_000)
+
+
+async def page_cases(bench, rows: int):
+    # страница /books/ целиком до байт ответа: ORM + response_model (как было) против колонок + orjson
+    import json
+    from pydantic import TypeAdapter
+    from sqlalchemy import select
+    from sqlalchemy.ext.asyncio import AsyncSession
+    from app import models
+    from app.handlers.internal import books_json_response, get_books_by_filters
+    from app.pagination import sort_clauses
+    from app.schemas import BookFilter, BookRead
+
+    adapter = TypeAdapter(list[BookRead])
+    filters = BookFilter(sort_by="created_at")
+
+    async with AsyncSession(bind=bench.async_engine) as db:
+        for size in (size for size in PAGE_SIZES if size <= rows):
+            async def orm_page():
+                books = (await db.scalars(select(models.Book).order_by(*sort_clauses("created_at")).limit(size))).all()
+                json.dumps(adapter.dump_python(adapter.validate_python(books, from_attributes=True), mode="json")).encode("utf-8")
+                db.expunge_all()
+
+            async def lean_page():
+                books_json_response(await get_books_by_filters(db, filters, 0, size))
+
+            yield f"page_orm_{size}", size, await timed(orm_page, bench.repeat)
+            yield f"page_lean_{size}", size, await timed(lean_page, bench.repeat)
+
+
+CASE_GROUPS = {"import": import_cases, "export": export_cases, "filter": filter_cases, "crud": crud_cases, "page": page_cases}
+
+
+class Bench:
+    def __init__(self, backend: str, url: str, tmp_dir: str, repeat: int, queries: int):
+        from sqlalchemy import create_engine
+        from sqlalchemy.ext.asyncio import create_async_engine
+        from app.database import ASYNC_DRIVERS, SYNC_DRIVERS, driver_url
+
+        self.backend = backend
+        self.tmp_dir = tmp_dir
+        self.repeat = repeat
+        self.queries = queries
+        self.sync_engine = create_engine(driver_url(url, SYNC_DRIVERS))
+        self.async_engine = create_async_engine(driver_url(url, ASYNC_DRIVERS))
+
+    async def run(self, sizes: list[int], groups: list[str]) -> list[dict]:
+        from benchmarks.export_formats import fill_books
+
+        results = []
+        for rows in sizes:
+            for group in groups:
+                # каждая группа начинает с одного и того же каталога
+                reset_schema(self.sync_engine)
+                if group != "import":
+                    fill_books(self.sync_engine, rows)
+                async for case, processed, timings in CASE_GROUPS[group](self, rows):
+                    result = summarize(self.backend, case, rows, processed, timings)
+                    print_result(result)
+                    results.append(result)
+        await self.async_engine.dispose()
+        self.sync_engine.dispose()
+        return results
+
+
+def summarize(backend: str, case: str, rows: int, processed: int | None, timings: list[float]) -> dict:
+    median = statistics.median(timings)
+    result = {
+        "backend": backend,
+        "case": case,
+        "rows": rows,
+        "runs": len(timings),
+        "median_seconds": round(median, 6),
+        "min_seconds": round(min(timings), 6),
+    }
+    if processed:
+        result["rows_per_sec"] = round(processed / median) if median else None
+    return result
+
+
+def print_result(result: dict):
+    rate = result.get("rows_per_sec")
+    print(
+        f"{result['backend']:<9} {result['rows']:>9} {result['case']:<22} "
+        f"{result['median_seconds'] * 1000:>11.2f} {result['min_seconds'] * 1000:>11.2f} "
+        f"{rate if rate is not None else '':>10}",
+        flush=True,
+    )
+
+
+def git_revision() -> str | None:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args) -> int:
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # app.database читает DATABASE_URL при импорте; сам набор работает через свои движки
+        os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(tmp_dir, 'app.db')}")
+        from app.cache import query_cache
+
+        # замеряем базу, а не кэш запросов
+        query_cache.backend = None
+
+        backends = [("sqlite", f"sqlite:///{os.path.join(tmp_dir, 'bench.db')}")]
+        if os.getenv("BENCH_POSTGRES_URL"):
+            backends.append(("postgres", os.environ["BENCH_POSTGRES_URL"]))
+
+        print(f"{'backend':<9} {'rows':>9} {'case':<22} {'median ms':>11} {'min ms':>11} {'rows/sec':>10}")
+        results = []
+        for backend, url in backends:
+            bench = Bench(backend, url, tmp_dir, args.repeat, args.queries)
+            results.extend(asyncio.run(bench.run(args.sizes, args.groups)))
+
+    report = {
+        "meta": {
+            "created_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": args.sizes,
+            "repeat": args.repeat,
+            "queries": args.queries,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"результаты записаны в {args.output}")
+    return 0
+
+
+def compare(args) -> int:
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = {(r["backend"], r["case"], r["rows"]): r for r in json.load(f)["results"]}
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)["results"]
+
+    regressions = []
+    print(f"{'backend':<9} {'rows':>9} {'case':<22} {'base ms':>10} {'now ms':>10} {'change':>8}")
+    for result in current:
+        key = (result["backend"], result["case"], result["rows"])
+        base = baseline.get(key)
+        if base is None:
+            continue
+        before, after = base["median_seconds"], result["median_seconds"]
+        change = (after - before) / before if before else 0.0
+        # совсем короткие замеры шумят сильнее порога, их сравниваем только по абсолютной разнице
+        regressed = change > args.threshold and after - before > args.min_delta
+        mark = "  REGRESSION" if regressed else ""
+        print(f"{key[0]:<9} {key[2]:>9} {key[1]:<22} {before * 1000:>10.2f} {after * 1000:>10.2f} {change:>+8.1%}{mark}")
+        if regressed:
+            regressions.append(key)
+
+    if regressions:
+        print(f"замедлилось {len(regressions)} замеров больше чем на {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--sizes", type=int, nargs="*", default=[10_000, 100_000], help="например 10000 100000 1000000")
+    run_parser.add_argument("--groups", nargs="*", choices=list(CASE_GROUPS), default=list(CASE_GROUPS))
+    run_parser.add_argument("--repeat", type=int, default=3, help="повторов для импорта и экспорта")
+    run_parser.add_argument("--queries", type=int, default=50, help="повторов для фильтров и CRUD")
+    run_parser.add_argument("--output", default="benchmark.json")
+
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.25, help="допустимое замедление медианы, 0.25 = 25%%")
+    compare_parser.add_argument("--min-delta", type=float, default=0.002, help="игнорировать разницу меньше, секунд")
+
+    args = parser.parse_args()
+    sys.exit(run(args) if args.command == "run" else compare(args))
+
+
+if __name__ == "__main__":
+    main()
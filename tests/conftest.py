@@ -0,0 +1,20 @@
+import pytest
+import pytest_asyncio
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.pool import StaticPool
+from app import models, search, stats
+from app.cache import MemoryBackend, query_cache
+
+@pytest.fixture(autouse=True)
+def fresh_query_cache(monkeypatch):
+    # кэш запросов глобальный, между тестами с разными базами его надо сбрасывать
+    monkeypatch.setattr(query_cache, "backend", MemoryBackend())
+
+@pytest_asyncio.fixture
+async def db():
+    engine = create_async_engine("sqlite+aiosqlite://", poolclass=StaticPool)
+    async with engine.begin() as conn:
+        await conn.run_sync(models.Base.metadata.create_all)
+    async with AsyncSession(bind=engine, expire_on_commit=False) as session:
+        yield session
+    await engine.dispose()
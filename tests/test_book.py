@@ -13,7 +13,8 @@ def mock_filters_with_title():
         book_id = None
         author = None
         year = None
-        sort_by_created_at = None
+        sort_by = None
+        order = "asc"
     return Filters()
 
 @pytest.fixture
@@ -23,20 +24,17 @@ def mock_filters_for_db():
         book_id = None
         author = "Guido"
         year = 2020
-        sort_by_created_at = "new"
+        sort_by = "created_at"
+        order = "desc"
     return Filters()
 
 @pytest.fixture
 def mock_db_with_books():
-    fake_query = MagicMock()
-    fake_query.filter.return_value = fake_query
-    fake_query.order_by.return_value = fake_query
-    fake_query.offset.return_value = fake_query
-    fake_query.limit.return_value = fake_query
-    fake_query.all.return_value = ["book1", "book2"]
+    fake_result = MagicMock()
+    fake_result.all.return_value = ["book1", "book2"]
 
     fake_db = MagicMock()
-    fake_db.query.return_value = fake_query
+    fake_db.execute = AsyncMock(return_value=fake_result)
     return fake_db
 
 @pytest.mark.asyncio
@@ -44,7 +42,7 @@ def mock_db_with_books():
 async def test_fetch_books_from_google_success(mock_get):
     mock_response = AsyncMock()
     mock_response.status_code = 200
-    mock_response.json = AsyncMock(return_value={
+    mock_response.json = MagicMock(return_value={
         "items": [
             {
                 "id": "1",
@@ -73,7 +71,8 @@ async def test_fetch_books_from_google_success(mock_get):
 async def test_fetch_books_from_google_failure_status(mock_get):
     mock_response = AsyncMock()
     mock_response.status_code = 500
-    mock_response.json = AsyncMock(return_value={})
+    mock_response.headers = {}
+    mock_response.json = MagicMock(return_value={})
     mock_get.return_value = mock_response
 
     with pytest.raises(HTTPException) as exc_info:
@@ -87,7 +86,7 @@ async def test_fetch_books_from_google_failure_status(mock_get):
 async def test_fetch_books_from_google_no_items(mock_get):
     mock_response = AsyncMock()
     mock_response.status_code = 200
-    mock_response.json = AsyncMock(return_value={})
+    mock_response.json = MagicMock(return_value={})
     mock_get.return_value = mock_response
 
     with pytest.raises(HTTPException) as exc_info:
@@ -99,17 +98,19 @@ async def test_fetch_books_from_google_no_items(mock_get):
 @pytest.mark.asyncio
 async def test_get_books_by_filters_uses_google(monkeypatch, mock_filters_with_title):
     mock_result = [BookRead(id="x", title="T", author="A", year="2020")]
+    mock_google = AsyncMock(return_value=mock_result)
+    # internal импортирует функцию к себе, подменять надо там
+    monkeypatch.setattr("app.handlers.internal.fetch_books_from_google", mock_google)
 
-    async def mock_google(title, limit=5):
-        return mock_result
-
-    monkeypatch.setattr("app.handlers.external.fetch_books_from_google", mock_google)
-
+    empty_result = MagicMock()
+    empty_result.all.return_value = []
     fake_db = MagicMock()
+    fake_db.execute = AsyncMock(return_value=empty_result)
 
     result = await get_books_by_filters(fake_db, mock_filters_with_title, skip=0, limit=5)
 
     assert result == mock_result
+    assert mock_google.await_args.kwargs["title"] == "Python"
 
 
 @pytest.mark.asyncio
@@ -117,9 +118,11 @@ async def test_get_books_by_filters_db_query(mock_db_with_books, mock_filters_fo
     result = await get_books_by_filters(mock_db_with_books, mock_filters_for_db, skip=0, limit=10)
 
     assert result == ["book1", "book2"]
-    assert mock_db_with_books.query.called
-    mock_db_with_books.query.return_value.filter.assert_called()
-    mock_db_with_books.query.return_value.order_by.assert_called()
+    assert mock_db_with_books.execute.called
+    query = mock_db_with_books.execute.call_args.args[0]
+    assert query.whereclause is not None
+    # sort_by ставит порядок (created_at, id) вместо релевантности поиска
+    assert [str(clause) for clause in query._order_by_clauses] == ["books.created_at DESC", "books.id DESC"]
 
 
 @pytest.mark.asyncio
@@ -129,17 +132,14 @@ async def test_get_books_by_filters_empty_result_raises_404(monkeypatch):
         book_id = None
         author = None
         year = None
-        sort_by_created_at = None
+        sort_by = None
+        order = "asc"
 
-    fake_query = MagicMock()
-    fake_query.filter.return_value = fake_query
-    fake_query.order_by.return_value = fake_query
-    fake_query.offset.return_value = fake_query
-    fake_query.limit.return_value = fake_query
-    fake_query.all.return_value = []
+    fake_result = MagicMock()
+    fake_result.all.return_value = []
 
     fake_db = MagicMock()
-    fake_db.query.return_value = fake_query
+    fake_db.execute = AsyncMock(return_value=fake_result)
 
     with pytest.raises(HTTPException) as exc_info:
         await get_books_by_filters(fake_db, EmptyFilters(), skip=0, limit=5)
@@ -147,12 +147,14 @@ async def test_get_books_by_filters_empty_result_raises_404(monkeypatch):
     assert exc_info.value.status_code == 404
     assert "Книги не найдены" in exc_info.value.detail
 
-def test_create_book_handler_success():
+@pytest.mark.asyncio
+async def test_create_book_handler_success():
     book_create = schemas.BookCreate(title="Test Book", author="Test Author", year=2023)
 
-    mock_db = MagicMock()
+    mock_db = AsyncMock()
+    mock_db.add = MagicMock()
 
-    result = create_book_handler(book_create, mock_db)
+    result = await create_book_handler(book_create, mock_db)
 
     mock_db.add.assert_called_once()
     mock_db.commit.assert_called_once()
@@ -163,20 +165,22 @@ def test_create_book_handler_success():
     assert result.author == "Test Author"
     assert result.year == 2023
 
-def test_create_book_handler_missing_title_or_author():
-    mock_db = MagicMock()
+@pytest.mark.asyncio
+async def test_create_book_handler_missing_title_or_author():
+    mock_db = AsyncMock()
 
     book_create1 = schemas.BookCreate(title="", author="Author", year=2023)
     with pytest.raises(HTTPException) as exc:
-        create_book_handler(book_create1, mock_db)
+        await create_book_handler(book_create1, mock_db)
     assert exc.value.status_code == 422
 
     book_create2 = schemas.BookCreate(title="Title", author="", year=2023)
     with pytest.raises(HTTPException) as exc:
-        create_book_handler(book_create2, mock_db)
+        await create_book_handler(book_create2, mock_db)
     assert exc.value.status_code == 422
 
-def test_update_book_handler_success():
+@pytest.mark.asyncio
+async def test_update_book_handler_success():
     book_data = schemas.BookCreate(title="Updated Title", author="Updated Author", year=2025)
     book_id = "some-book-id"
 
@@ -184,8 +188,8 @@ def test_update_book_handler_success():
 
     mock_db = MagicMock()
 
-    with patch("app.handlers.crud.update_book", return_value=updated_book) as mock_update:
-        result = update_book_handler(book_id, book_data, mock_db)
+    with patch("app.handlers.internal.crud.update_book", AsyncMock(return_value=updated_book)) as mock_update:
+        result = await update_book_handler(book_id, book_data, mock_db)
 
         mock_update.assert_called_once_with(mock_db, book_id, book_data)
 
@@ -193,19 +197,21 @@ def test_update_book_handler_success():
         assert result.title == "Updated Title"
         assert result.author == "Updated Author"
 
-def test_update_book_handler_not_found():
+@pytest.mark.asyncio
+async def test_update_book_handler_not_found():
     book_data = schemas.BookCreate(title="New Title", author="New Author", year=2024)
     book_id = "nonexistent-id"
     mock_db = MagicMock()
 
-    with patch("app.handlers.crud.update_book", return_value=None):
+    with patch("app.handlers.internal.crud.update_book", AsyncMock(return_value=None)):
         with pytest.raises(HTTPException) as exc:
-            update_book_handler(book_id, book_data, mock_db)
+            await update_book_handler(book_id, book_data, mock_db)
 
         assert exc.value.status_code == 404
         assert exc.value.detail == "Книга не найдена"
 
-def test_update_book_handler_success():
+@pytest.mark.asyncio
+async def test_update_book_handler_success():
     book_data = schemas.BookCreate(title="Updated Title", author="Updated Author", year=2025)
     book_id = "some-book-id"
 
@@ -213,8 +219,8 @@ def test_update_book_handler_success():
 
     mock_db = MagicMock()
 
-    with patch("app.handlers.crud.update_book", return_value=updated_book) as mock_update:
-        result = update_book_handler(book_id, book_data, mock_db)
+    with patch("app.handlers.internal.crud.update_book", AsyncMock(return_value=updated_book)) as mock_update:
+        result = await update_book_handler(book_id, book_data, mock_db)
 
         mock_update.assert_called_once_with(mock_db, book_id, book_data)
 
@@ -222,14 +228,15 @@ def test_update_book_handler_success():
         assert result.title == "Updated Title"
         assert result.author == "Updated Author"
 
-def test_update_book_handler_not_found():
+@pytest.mark.asyncio
+async def test_update_book_handler_not_found():
     book_data = schemas.BookCreate(title="New Title", author="New Author", year=2024)
     book_id = "nonexistent-id"
     mock_db = MagicMock()
 
-    with patch("app.handlers.crud.update_book", return_value=None):
+    with patch("app.handlers.internal.crud.update_book", AsyncMock(return_value=None)):
         with pytest.raises(HTTPException) as exc:
-            update_book_handler(book_id, book_data, mock_db)
+            await update_book_handler(book_id, book_data, mock_db)
 
         assert exc.value.status_code == 404
         assert exc.value.detail == "Книга не найдена"
\ No newline at end of file
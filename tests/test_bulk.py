@@ -0,0 +1,96 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import select
+from app import models, schemas
+from app.handlers.internal import bulk_create_books_handler, bulk_delete_books_handler, bulk_update_books_handler
+
+@pytest_asyncio.fixture
+async def catalog(db):
+    db.add_all([models.Book(id=f"b{i}", title=f"Book {i}", author="Author", year=2000 + i) for i in range(5)])
+    await db.commit()
+    return db
+
+async def all_books(db):
+    db.expire_all()
+    return {b.id: (b.title, b.author, b.year) for b in await db.scalars(select(models.Book))}
+
+@pytest.mark.asyncio
+async def test_bulk_create_reports_per_item(db):
+    books = [
+        schemas.BookCreate(title="A", author="X", year=1999),
+        schemas.BookCreate(title="", author="X"),
+        schemas.BookCreate(title="B", author="Y"),
+    ]
+
+    result = await bulk_create_books_handler(books, db)
+
+    assert (result["total"], result["succeeded"], result["failed"]) == (3, 2, 1)
+    assert [item["status"] for item in result["items"]] == ["created", "invalid", "created"]
+    stored = await all_books(db)
+    assert stored[result["items"][0]["id"]] == ("A", "X", 1999)
+    assert len(stored) == 2
+
+@pytest.mark.asyncio
+async def test_bulk_update_is_partial_and_single_statement(catalog):
+    updates = [
+        schemas.BookBulkUpdate(id="b0", title="New 0"),
+        schemas.BookBulkUpdate(id="b1", year=None),
+        schemas.BookBulkUpdate(id="missing", title="X"),
+        schemas.BookBulkUpdate(id="b2", author=""),
+    ]
+    statements = []
+
+    def count(conn, cursor, statement, parameters, context, executemany):
+        if statement.startswith("UPDATE books"):
+            statements.append(executemany)
+
+    from sqlalchemy import event
+    sync_engine = catalog.bind.sync_engine
+    event.listen(sync_engine, "before_cursor_execute", count)
+    try:
+        result = await bulk_update_books_handler(updates, catalog)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", count)
+
+    assert statements == [True]
+    assert [item["status"] for item in result["items"]] == ["updated", "updated", "not_found", "invalid"]
+    stored = await all_books(catalog)
+    assert stored["b0"] == ("New 0", "Author", 2000)
+    assert stored["b1"] == ("Book 1", "Author", None)
+    assert stored["b2"] == ("Book 2", "Author", 2002)
+
+@pytest.mark.asyncio
+async def test_bulk_delete(catalog):
+    result = await bulk_delete_books_handler(["b0", "b3", "nope"], catalog)
+
+    assert [item["status"] for item in result["items"]] == ["deleted", "deleted", "not_found"]
+    assert set(await all_books(catalog)) == {"b1", "b2", "b4"}
+
+@pytest.mark.asyncio
+async def test_bulk_limits(db, monkeypatch):
+    monkeypatch.setattr("app.handlers.internal.BULK_MAX_ITEMS", 2)
+    with pytest.raises(HTTPException) as exc:
+        await bulk_delete_books_handler(["a", "b", "c"], db)
+    assert exc.value.status_code == 413
+
+@pytest.mark.asyncio
+async def test_bulk_writes_reject_duplicate_books(catalog):
+    created = await bulk_create_books_handler([
+        schemas.BookCreate(title="book 0", author="Author", year=2000),
+        schemas.BookCreate(title="Fresh", author="Author", year=2000),
+        schemas.BookCreate(title="Fresh ", author="author", year=2000),
+    ], catalog)
+    # b0 отдает свой ключ и освобождает старый для b1 в той же пачке
+    updated = await bulk_update_books_handler([
+        schemas.BookBulkUpdate(id="b2", title="Book 3", year=2003),
+        schemas.BookBulkUpdate(id="b0", title="Renamed"),
+        schemas.BookBulkUpdate(id="b1", title="Book 0", year=2000),
+    ], catalog)
+
+    assert [item["status"] for item in created["items"]] == ["invalid", "created", "invalid"]
+    assert [item["status"] for item in updated["items"]] == ["invalid", "updated", "updated"]
+    stored = await all_books(catalog)
+    assert (stored["b0"], stored["b1"], stored["b2"]) == (("Renamed", "Author", 2000), ("Book 0", "Author", 2000), ("Book 2", "Author", 2002))
+    keys = [book.natural_key for book in await catalog.scalars(select(models.Book))]
+    assert None not in keys and len(set(keys)) == len(keys)
@@ -0,0 +1,44 @@
+import asyncio
+import time
+import pytest
+from app import metrics, spreadsheets
+from app.cpu_pool import CpuPool
+
+@pytest.mark.asyncio
+async def test_pool_caps_jobs_and_keeps_loop_responsive():
+    pool = CpuPool(workers=2, max_jobs=1)
+    await pool.run(time.sleep, 0)  # процессы поднимаются здесь, в замер не входит
+    lags = []
+
+    async def ticker():
+        while True:
+            start_time = time.perf_counter()
+            await asyncio.sleep(0.01)
+            lags.append(time.perf_counter() - start_time - 0.01)
+
+    tick = asyncio.create_task(ticker())
+    try:
+        start_time = time.perf_counter()
+        await asyncio.gather(pool.run(time.sleep, 0.3), pool.run(time.sleep, 0.3))
+        elapsed = time.perf_counter() - start_time
+    finally:
+        tick.cancel()
+        pool.shutdown()
+
+    # max_jobs=1: задачи идут по очереди, хотя процессов два
+    assert elapsed >= 0.6
+    assert max(lags) < 0.1
+    assert sum(metrics.cpu_pool_wait.values[("sleep",)][0]) >= 2
+
+@pytest.mark.asyncio
+async def test_inline_mode_runs_in_process(tmp_path):
+    pool = CpuPool(workers=0)
+    spool_path = tmp_path / "rows.pickle"
+    with open(spool_path, "wb") as spool:
+        spreadsheets.dump_batch(spool, [("1", "Dune", "Herbert", 1965)])
+        spreadsheets.dump_batch(spool, [("2", "Emma", "Austen", None)])
+
+    rows = await pool.run(spreadsheets.write_xlsx_openpyxl, str(spool_path), str(tmp_path / "out.xlsx"))
+
+    assert rows == 2
+    assert pool._executor is None
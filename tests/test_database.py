@@ -0,0 +1,105 @@
+import json
+import httpx
+import pytest
+from sqlalchemy import create_engine, func, select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+from app import database, metrics, migrations, models
+from app.handlers.internal import get_books_by_filters, get_books_page_by_filters
+from app.main import app
+from app.schemas import BookFilter
+
+def migrated_engine(url: str):
+    engine = create_engine(url)
+    with engine.begin() as conn:
+        migrations.migrate(conn)
+    return engine
+
+@pytest.fixture
+def primary_and_replica(tmp_path):
+    primary_url, replica_url = f"sqlite:///{tmp_path / 'primary.db'}", f"sqlite:///{tmp_path / 'replica.db'}"
+    for url in (primary_url, replica_url):
+        migrated_engine(url).dispose()
+    primary = database.create_async_db_engine(primary_url)
+    replica = database.create_async_db_engine(replica_url, "replica")
+    yield primary, replica
+
+@pytest.mark.asyncio
+async def test_pool_settings_and_wait_metric(primary_and_replica):
+    metrics.registry.clear()
+    primary, replica = primary_and_replica
+
+    assert isinstance(replica.pool, database.TimedQueuePool)
+    assert replica.pool.size() == database.DB_POOL_SIZE
+    async with replica.connect() as conn:
+        await conn.execute(select(1))
+
+    assert sum(metrics.db_pool_wait.values[("replica",)][0]) == 1
+    assert ("primary",) not in metrics.db_pool_wait.values
+    for engine in (primary, replica):
+        await engine.dispose()
+    metrics.registry.clear()
+
+@pytest.mark.asyncio
+async def test_reads_go_to_replica_and_writes_to_primary(primary_and_replica):
+    primary, replica = primary_and_replica
+    primary_sessions = async_sessionmaker(primary, expire_on_commit=False)
+    replica_sessions = async_sessionmaker(replica, expire_on_commit=False)
+
+    async with replica_sessions() as db:
+        db.add(models.Book(id="r1", title="Only on replica", author="Author", year=2000))
+        await db.commit()
+
+    async def primary_db():
+        async with primary_sessions() as db:
+            yield db
+
+    async def replica_db():
+        async with replica_sessions() as db:
+            yield db
+
+    app.dependency_overrides[database.get_db] = primary_db
+    app.dependency_overrides[database.get_read_db] = replica_db
+    try:
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://test") as client:
+            assert [book["id"] for book in (await client.get("/books/", params={"author": "Author"})).json()] == ["r1"]
+            assert [json.loads(line)["id"] for line in (await client.get("/books/stream")).text.splitlines()] == ["r1"]
+            assert (await client.get("/books/stats")).json()["authors"] == [{"author": "Author", "books": 1}]
+
+            created = (await client.post("/books", json={"title": "New", "author": "Writer", "year": 2020})).json()
+            # одна книга кэшируется, поэтому читается с основной базы: отставшая реплика не попадет в кэш
+            assert (await client.get(f"/books/{created['id']}")).json()["title"] == "New"
+            assert (await client.get("/books/r1")).status_code == 404
+            export = await client.get("/books/export", params={"format": "csv"})
+            assert "Only on replica" in export.text and "New" not in export.text
+    finally:
+        app.dependency_overrides.clear()
+
+    async with primary_sessions() as db:
+        assert await db.scalar(select(models.Book.title).where(models.Book.id == created["id"])) == "New"
+    async with replica_sessions() as db:
+        assert await db.scalar(select(func.count()).select_from(models.Book)) == 1
+    for engine in (primary, replica):
+        await engine.dispose()
+
+@pytest.mark.asyncio
+async def test_replica_lists_bypass_query_cache(primary_and_replica, monkeypatch):
+    primary, replica = primary_and_replica
+    monkeypatch.setattr(database, "replica_engine", replica)
+    replica_sessions = async_sessionmaker(replica, expire_on_commit=False)
+    filters = BookFilter(author="Author")
+
+    try:
+        async with replica_sessions() as db:
+            db.add(models.Book(id="r1", title="First", author="Author", year=2000))
+            await db.commit()
+            assert [b.id for b in await get_books_by_filters(db, filters, skip=0, limit=10)] == ["r1"]
+            assert (await get_books_page_by_filters(db, filters, limit=10))["items"][0].id == "r1"
+
+            # реплика догнала запись, о которой этот процесс не знает: кэш не должен держать старую страницу
+            db.add(models.Book(id="r2", title="Second", author="Author", year=2000))
+            await db.commit()
+            assert [b.id for b in await get_books_by_filters(db, filters, skip=0, limit=10)] == ["r1", "r2"]
+            assert len((await get_books_page_by_filters(db, filters, limit=10))["items"]) == 2
+    finally:
+        for engine in (primary, replica):
+            await engine.dispose()
@@ -0,0 +1,205 @@
+import asyncio
+import csv
+import gzip
+import io
+import json
+import os
+import pytest
+import pytest_asyncio
+from datetime import timedelta
+from io import BytesIO
+from fastapi import HTTPException
+from sqlalchemy import update
+from openpyxl import load_workbook
+from app import crud, models
+from app.artifacts import ArtifactCache
+from app.handlers import internal
+from app.handlers.internal import export_books_handler, export_books_handler_openpyxl, export_books_handler_streaming, stream_books_handler
+from app.schemas import BookCreate, BookFilter
+
+@pytest_asyncio.fixture
+async def books(db, monkeypatch):
+    monkeypatch.setattr("app.exporters.EXPORT_BATCH_SIZE", 3)
+    db.add_all([models.Book(title=f"Book {i}", author="Автор", year=2000 + i) for i in range(9)])
+    db.add(models.Book(title="No year", author="Автор", year=None))
+    await db.commit()
+    return db
+
+async def read_body(response):
+    chunks = []
+    async for chunk in response.body_iterator:
+        chunks.append(chunk)
+    return b"".join(chunks)
+
+@pytest.mark.asyncio
+async def test_export_streaming_xlsx(books):
+    response = await export_books_handler_streaming(books)
+    body = await read_body(response)
+
+    assert response.media_type == "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+    ws = load_workbook(BytesIO(body), read_only=True).active
+    rows = list(ws.iter_rows(values_only=True))
+    assert rows[0] == ("ID", "title", "author", "year")
+    assert len(rows) == 11
+
+@pytest.mark.asyncio
+async def test_export_streaming_csv(books):
+    response = await export_books_handler_streaming(books, "csv")
+    rows = list(csv.reader(io.StringIO((await read_body(response)).decode("utf-8"))))
+
+    assert response.media_type == "text/csv; charset=utf-8"
+    assert rows[0] == ["id", "title", "author", "year"]
+    assert len(rows) == 11
+    assert ["No year", "Автор", ""] in [r[1:] for r in rows]
+
+@pytest.mark.asyncio
+async def test_export_streaming_ndjson(books):
+    response = await export_books_handler_streaming(books, "ndjson")
+    lines = (await read_body(response)).decode("utf-8").splitlines()
+
+    assert response.media_type == "application/x-ndjson"
+    records = [json.loads(line) for line in lines]
+    assert len(records) == 10
+    assert {"title": "No year", "author": "Автор", "year": None}.items() <= next(r for r in records if r["title"] == "No year").items()
+
+@pytest.mark.asyncio
+async def test_export_streaming_parquet(books):
+    pq = pytest.importorskip("pyarrow.parquet")
+    response = await export_books_handler_streaming(books, "parquet")
+    parquet_file = pq.ParquetFile(BytesIO(await read_body(response)))
+
+    assert response.media_type == "application/vnd.apache.parquet"
+    assert parquet_file.metadata.num_rows == 10
+    assert parquet_file.metadata.num_row_groups == 4
+    assert parquet_file.schema_arrow.names == ["id", "title", "author", "year"]
+
+@pytest.mark.asyncio
+async def test_export_streaming_unknown_format(books):
+    with pytest.raises(HTTPException) as exc:
+        await export_books_handler_streaming(books, "xml")
+    assert exc.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_export_streaming_empty_table_raises(db):
+    with pytest.raises(ValueError):
+        await export_books_handler_streaming(db, "csv")
+
+@pytest.fixture
+def export_cache(monkeypatch, tmp_path):
+    cache = ArtifactCache(str(tmp_path / "exports"), max_bytes=10**9)
+    monkeypatch.setattr(internal, "export_cache", cache)
+    return cache
+
+@pytest.mark.asyncio
+async def test_cached_export_reused_until_catalog_changes(books, export_cache):
+    first = await export_books_handler_openpyxl(books)
+    second = await export_books_handler_openpyxl(books)
+
+    assert first.path == second.path
+    assert (export_cache.misses, export_cache.hits) == (1, 1)
+    assert len(list(load_workbook(first.path, read_only=True).active.iter_rows())) == 11
+
+    await crud.create_book(books, BookCreate(title="New", author="Автор", year=2024))
+    third = await export_books_handler_openpyxl(books)
+
+    assert third.path != first.path
+    assert third.headers["etag"] != first.headers["etag"]
+    assert len(list(load_workbook(third.path, read_only=True).active.iter_rows())) == 12
+
+@pytest.mark.asyncio
+async def test_recreated_catalog_at_same_version_gets_new_export(books, export_cache):
+    await crud.create_book(books, BookCreate(title="New", author="Автор", year=2024))
+    first = await export_books_handler_openpyxl(books)
+
+    # база пересоздана и снова дошла до той же версии: номер совпал, время записи нет
+    await books.execute(update(models.CatalogVersion).values(updated_at=models.utcnow() + timedelta(seconds=1)))
+    await books.commit()
+    second = await export_books_handler_openpyxl(books, if_none_match=first.headers["etag"])
+
+    assert second.status_code == 200
+    assert second.path != first.path
+    assert second.headers["etag"] != first.headers["etag"]
+
+@pytest.mark.asyncio
+async def test_export_if_none_match_returns_304(books, export_cache):
+    response = await export_books_handler(books)
+    etag = response.headers["etag"]
+
+    not_modified = await export_books_handler(books, if_none_match=f"W/{etag}, \"other\"")
+    assert not_modified.status_code == 304
+    assert not_modified.headers["etag"] == etag
+    assert export_cache.misses == 1
+
+    stream = await export_books_handler_streaming(books, "csv", if_none_match=etag)
+    assert stream.status_code == 200 and stream.headers["etag"] != etag
+
+@pytest.mark.asyncio
+async def test_concurrent_builds_use_separate_files(export_cache):
+    release = asyncio.Event()
+
+    async def build(content):
+        async def write(path):
+            await release.wait()
+            with open(path, "w") as f:
+                f.write(content)
+        return write
+
+    tasks = [asyncio.ensure_future(export_cache.get_or_build(f"v{i}.csv", await build(str(i) * 10))) for i in range(2)]
+    duplicate = asyncio.ensure_future(export_cache.get_or_build("v0.csv", await build("never")))
+    await asyncio.sleep(0)
+    release.set()
+    paths = await asyncio.gather(*tasks, duplicate)
+
+    assert [open(path).read() for path in paths] == ["0" * 10, "1" * 10, "0" * 10]
+    assert export_cache.misses == 2
+    assert sorted(os.listdir(export_cache.directory)) == ["v0.csv", "v1.csv"]
+
+@pytest.mark.asyncio
+async def test_export_cache_evicts_oldest_over_size(export_cache):
+    export_cache.max_bytes = 25
+
+    for i in range(4):
+        async def write(path, i=i):
+            with open(path, "w") as f:
+                f.write("x" * 10)
+        await export_cache.get_or_build(f"v{i}.csv", write)
+        os.utime(export_cache.path(f"v{i}.csv"), (i, i))
+
+    assert sorted(os.listdir(export_cache.directory)) == ["v2.csv", "v3.csv"]
+    assert export_cache.evicted == 2
+
+@pytest.mark.asyncio
+async def test_stream_books_ndjson_filtered_in_batches(books):
+    response = await stream_books_handler(books, BookFilter(author="Автор", sort_by="year", order="desc"))
+    chunks = [chunk async for chunk in response.body_iterator]
+
+    assert response.media_type == "application/x-ndjson"
+    # EXPORT_BATCH_SIZE=3: одна пачка строк на кусок ответа
+    assert len(chunks) == 4
+    records = [json.loads(line) for line in b"".join(chunks).splitlines()]
+    assert [r["year"] for r in records] == [None] + list(range(2008, 1999, -1))
+    assert set(records[0]) == {"id", "title", "author", "year", "created_at", "updated_at"}
+
+@pytest.mark.asyncio
+async def test_stream_books_gzip(books):
+    response = await stream_books_handler(books, BookFilter(year=2003), gzip=True)
+    body = gzip.decompress(await read_body(response))
+
+    assert response.headers["content-encoding"] == "gzip"
+    assert [json.loads(line)["title"] for line in body.splitlines()] == ["Book 3"]
+
+@pytest.mark.asyncio
+async def test_streaming_xlsx_is_built_in_cpu_pool(books, monkeypatch):
+    calls = []
+
+    class InlinePool:
+        async def run(self, func, *args):
+            calls.append(func.__name__)
+            return func(*args)
+
+    monkeypatch.setattr("app.exporters.cpu_pool", InlinePool())
+    response = await export_books_handler_streaming(books)
+    rows = list(load_workbook(BytesIO(await read_body(response)), read_only=True).active.iter_rows(values_only=True))
+
+    assert calls == ["write_xlsx_openpyxl"]
+    assert len(rows) == 11
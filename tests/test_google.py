@@ -0,0 +1,240 @@
+import asyncio
+import json
+import threading
+import time
+import httpx
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from fastapi import HTTPException
+from app import google_api
+from app.cache import TTLCache
+from app.handlers.external import fetch_books_from_google, google_cache
+from app.schemas import BookRead
+
+@pytest.fixture(autouse=True)
+def clear_google_cache():
+    google_cache.clear()
+    yield
+    google_cache.clear()
+
+def test_ttl_cache_lru_eviction_and_expiry(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.cache.time.monotonic", lambda: now[0])
+    cache = TTLCache(maxsize=2, ttl=10)
+
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == (True, 1)
+    cache.set("c", 3)
+    assert cache.get("b") == (False, None)
+    assert cache.get("c") == (True, 3)
+
+    now[0] += 11
+    assert cache.get("a") == (False, None)
+    assert cache.stats()["hits"] == 2
+    assert cache.stats()["misses"] == 2
+
+@pytest.mark.asyncio
+async def test_fetch_books_from_google_coalesces_and_caches():
+    calls = []
+    result = [BookRead(id="1", title="T", author="A", year=2020)]
+
+    async def fake_fetch(**kwargs):
+        calls.append(kwargs)
+        await asyncio.sleep(0.01)
+        return result
+
+    with patch("app.handlers.external.fetch_books_from_google_uncached", side_effect=fake_fetch):
+        first = await asyncio.gather(*(fetch_books_from_google(title="Python", limit=5) for _ in range(10)))
+        second = await fetch_books_from_google(title="  python ", limit=5)
+
+    assert len(calls) == 1
+    assert all(r == result for r in first)
+    assert second == result
+    stats = google_cache.stats()
+    assert stats["coalesced"] == 9
+    assert stats["hits"] == 1
+
+@pytest.mark.asyncio
+async def test_fetch_books_from_google_caches_not_found_only():
+    calls = []
+
+    async def fake_fetch(**kwargs):
+        calls.append(kwargs)
+        raise HTTPException(status_code=404 if kwargs["title"] == "missing" else 502, detail="x")
+
+    with patch("app.handlers.external.fetch_books_from_google_uncached", side_effect=fake_fetch):
+        for title in ("missing", "missing", "broken", "broken"):
+            with pytest.raises(HTTPException):
+                await fetch_books_from_google(title=title)
+
+    assert [c["title"] for c in calls] == ["missing", "broken", "broken"]
+
+class StubVolumesHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    statuses = []
+
+    def setup(self):
+        super().setup()
+        self.server.connections += 1
+
+    def do_GET(self):
+        status = self.statuses.pop(0) if self.statuses else 200
+        body = json.dumps({"items": [{"id": "stub", "volumeInfo": {"title": "Stub", "authors": ["A"], "publishedDate": "2001"}}]}).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_server(monkeypatch):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubVolumesHandler)
+    server.connections = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(google_api, "GOOGLE_API_URL", f"http://127.0.0.1:{server.server_address[1]}/volumes")
+    monkeypatch.setattr(google_api, "GOOGLE_RETRY_BACKOFF", 0.001)
+    monkeypatch.setattr(google_api, "rate_limiter", google_api.RateLimiter(0))
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.mark.asyncio
+async def test_shared_client_reuses_connections(stub_server):
+    calls = 30
+    await google_api.close_client()
+
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        async with httpx.AsyncClient() as client:
+            await client.get(google_api.GOOGLE_API_URL, params={"q": "x"})
+    fresh = (time.perf_counter() - start_time) / calls
+    fresh_connections = stub_server.connections
+
+    start_time = time.perf_counter()
+    for _ in range(calls):
+        response = await google_api.request_volumes({"q": "x"})
+        assert response.status_code == 200
+    pooled = (time.perf_counter() - start_time) / calls
+    await google_api.close_client()
+
+    print(f"fresh client {fresh * 1000:.2f} ms/call, pooled {pooled * 1000:.2f} ms/call, saved {(fresh - pooled) * 1000:.2f} ms/call")
+    assert fresh_connections == calls
+    assert stub_server.connections - fresh_connections == 1
+
+@pytest.mark.asyncio
+async def test_request_volumes_retries_on_throttling(stub_server, monkeypatch):
+    monkeypatch.setattr(StubVolumesHandler, "statuses", [429, 503])
+
+    books = await fetch_books_from_google(title="retry")
+    await google_api.close_client()
+
+    assert [b.id for b in books] == ["stub"]
+    assert StubVolumesHandler.statuses == []
+
+@pytest.mark.asyncio
+async def test_request_volumes_gives_up_after_retries(stub_server, monkeypatch):
+    monkeypatch.setattr(StubVolumesHandler, "statuses", [503] * (google_api.GOOGLE_RETRIES + 1))
+
+    with pytest.raises(HTTPException) as exc:
+        await fetch_books_from_google(title="down")
+    await google_api.close_client()
+
+    assert exc.value.status_code == 502
+
+@pytest.mark.asyncio
+async def test_batch_fetch_runs_concurrently_and_saves_once(db, monkeypatch):
+    from sqlalchemy import event
+    from app import models
+    from app.handlers import external
+    from app.schemas import GoogleBatchRequest
+
+    db.add(models.Book(id="known", title="Old", author="A", year=1990))
+    await db.commit()
+
+    active, peak = [0], [0]
+    results = {
+        "one": [BookRead(id="a", title="A", author="X", year=2001), BookRead(id="known", title="New", author="A", year=1990)],
+        "two": [BookRead(id="a", title="A", author="X", year=2001), BookRead(id="b", title="B", author="Y", year=2002)],
+        "three": [BookRead(id="c", title="C", author="Z", year=2003)],
+    }
+
+    async def fake_fetch(title=None, **kwargs):
+        active[0] += 1
+        peak[0] = max(peak[0], active[0])
+        await asyncio.sleep(0.02)
+        active[0] -= 1
+        if title not in results:
+            raise HTTPException(status_code=404, detail="Книги не найдены")
+        return results[title]
+
+    statements = []
+    sync_engine = db.bind.sync_engine
+    # запись версии каталога (catalog_version) не считаем, проверяем только запросы к books
+    listener = lambda conn, cursor, statement, *args: "catalog_version" not in statement and statements.append(statement.split()[0])
+    monkeypatch.setattr(external, "GOOGLE_BATCH_CONCURRENCY", 2)
+    event.listen(sync_engine, "before_cursor_execute", listener)
+    try:
+        with patch("app.handlers.external.fetch_books_from_google_uncached", side_effect=fake_fetch):
+            request = GoogleBatchRequest(password="123", queries=[{"title": t} for t in ("one", "two", "missing", "three")])
+            result = await external.fetch_and_save_books_batch_handler(request, db)
+    finally:
+        event.remove(sync_engine, "before_cursor_execute", listener)
+
+    assert peak[0] == 2
+    # выборки по id и по естественному ключу, потом одна вставка
+    assert statements == ["SELECT", "SELECT", "INSERT"]
+    assert (result["found"], result["inserted"], result["existing"]) == (4, 3, 1)
+    assert [(i["status"], i["inserted"], i["existing"]) for i in result["items"]] == [
+        ("ok", 1, 1), ("ok", 1, 1), ("not_found", 0, 0), ("ok", 1, 0),
+    ]
+    db.expire_all()
+    assert (await db.get(models.Book, "known")).title == "Old"
+    assert (await db.get(models.Book, "b")).year == 2002
+
+class CountingLimiter:
+    def __init__(self):
+        self.acquired = 0
+
+    async def acquire(self):
+        self.acquired += 1
+
+@pytest.mark.asyncio
+async def test_rate_limit_applies_to_upstream_calls_only(stub_server, db, monkeypatch):
+    from app.handlers import external
+    from app.schemas import GoogleBatchRequest
+
+    limiter = CountingLimiter()
+    monkeypatch.setattr(google_api, "rate_limiter", limiter)
+    monkeypatch.setattr(StubVolumesHandler, "statuses", [503])
+    request = GoogleBatchRequest(password="123", queries=[{"title": "stub"}, {"title": " STUB "}])
+
+    await external.fetch_and_save_books_batch_handler(request, db)
+    # повтор после 503 — еще одно обращение к апстриму, одинаковые запросы идут одним
+    assert limiter.acquired == 2
+
+    await external.fetch_and_save_books_batch_handler(request, db)
+    await google_api.close_client()
+    # все запросы ответил google_cache, лимит не тратится
+    assert limiter.acquired == 2
+
+@pytest.mark.asyncio
+async def test_rate_limiter_spaces_requests(monkeypatch):
+    now, sleeps = [100.0], []
+
+    async def fake_sleep(delay):
+        sleeps.append(round(delay, 3))
+
+    monkeypatch.setattr(google_api.time, "monotonic", lambda: now[0])
+    monkeypatch.setattr(google_api.asyncio, "sleep", fake_sleep)
+    limiter = google_api.RateLimiter(4)
+    for _ in range(3):
+        await limiter.acquire()
+
+    assert sleeps == [0.25, 0.5]
@@ -0,0 +1,222 @@
+import os
+import pytest
+import threading
+import uuid
+from datetime import datetime
+from io import BytesIO
+from openpyxl import Workbook
+from fastapi import UploadFile
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from app import crud, models, spreadsheets
+from app.handlers import internal
+from app.handlers.internal import create_book_handler, generate_uuids, get_book_handler, import_books_from_excel, import_books_from_openpyxl, update_book_handler
+from app.schemas import BookCreate
+
+def make_upload(rows, filename="books.xlsx"):
+    wb = Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    buffer = BytesIO()
+    wb.save(buffer)
+    buffer.seek(0)
+    return UploadFile(file=buffer, filename=filename)
+
+@pytest.mark.asyncio
+async def test_import_openpyxl_inserts_in_chunks(db):
+    rows = [["Title", "Author", "Year"]] + [[f"Book {i}", "Author", 2000 + i] for i in range(7)]
+    rows.append(["No year", "Author", None])
+
+    result = await import_books_from_openpyxl(make_upload(rows), db, chunk_size=3)
+
+    assert result["status"] == "ok"
+    assert result["imported"] == 8
+    assert result["rows_per_sec"] > 0
+    books = (await db.scalars(select(models.Book))).all()
+    assert len(books) == 8
+    assert next(b for b in books if b.title == "No year").year is None
+    assert len({b.id for b in books}) == 8
+
+@pytest.mark.asyncio
+async def test_import_openpyxl_missing_columns(db):
+    with pytest.raises(ValueError) as exc:
+        await import_books_from_openpyxl(make_upload([["title", "author"], ["T", "A"]]), db)
+
+    assert "year" in str(exc.value)
+    assert await db.scalar(select(func.count()).select_from(models.Book)) == 0
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("importer", [import_books_from_excel, import_books_from_openpyxl])
+async def test_import_normalizes_rows_in_append_mode(db, importer):
+    rows = [
+        ["Title", "Author", "Year"],
+        ["Good", "Author", 2001],
+        [1984, " Orwell ", "1949"],
+        ["Float year", "Author", 2002.0],
+        ["Bad year", "Author", "unknown"],
+        ["Fraction", "Author", 2003.5],
+        [None, "Author", 2004],
+        ["No author", "  ", 2005],
+        ["Empty year", "Author", None],
+    ]
+
+    result = await importer(make_upload(rows), db, chunk_size=2)
+
+    assert result["imported"] == 6
+    assert result["skipped"] == 2
+    assert result["invalid_year"] == 2
+    books = {b.title: (b.author, b.year) for b in await db.scalars(select(models.Book))}
+    assert books == {
+        "Good": ("Author", 2001), "1984": ("Orwell", 1949), "Float year": ("Author", 2002),
+        "Bad year": ("Author", None), "Fraction": ("Author", None), "Empty year": ("Author", None),
+    }
+
+@pytest.mark.parametrize("parse", ["pandas", "rows"])
+def test_parsers_spool_record_batches(tmp_path, parse):
+    upload = make_upload([["title", "author", "year"]] + [[f"Book {i}", "Author", 2000] for i in range(7)])
+    file_path, spool_path = tmp_path / "books.xlsx", tmp_path / "books.pickle"
+    file_path.write_bytes(upload.file.read())
+
+    if parse == "pandas":
+        stats = spreadsheets.parse_xlsx_pandas(str(file_path), str(spool_path), 3)
+    else:
+        stats = spreadsheets.parse_xlsx_rows(str(file_path), str(spool_path), 3)
+
+    # в event loop родителя читается по пачке из chunk_size словарей, а не весь DataFrame
+    batches = list(spreadsheets.read_batches(str(spool_path)))
+    assert [len(batch) for batch in batches] == [3, 3, 1]
+    assert batches[0][0]["title"] == "Book 0" and batches[0][0]["natural_key"]
+    assert stats["rows"] == 7
+
+@pytest.mark.asyncio
+async def test_spool_upload_copies_outside_event_loop(monkeypatch):
+    threads = []
+    copy_upload = internal.copy_upload
+
+    def record_thread(*args):
+        threads.append(threading.current_thread())
+        return copy_upload(*args)
+
+    monkeypatch.setattr(internal, "copy_upload", record_thread)
+    file_path = await internal.spool_upload(make_upload([["title", "author", "year"]]), suffix=".xlsx")
+    try:
+        assert threads and threads[0] is not threading.main_thread()
+        assert os.path.getsize(file_path) > 0
+    finally:
+        os.remove(file_path)
+
+def test_generate_uuids_are_unique_v4():
+    ids = generate_uuids(1000)
+    assert len(set(ids)) == 1000
+    assert all(uuid.UUID(i).version == 4 for i in ids)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("importer", [import_books_from_excel, import_books_from_openpyxl])
+async def test_upsert_import_is_idempotent(db, importer):
+    rows = [["title", "author", "year"], ["Dune", "Herbert", 1965], ["Emma", "Austen", 1815], ["Dune", "Herbert", 1965]]
+
+    first = await importer(make_upload(rows), db, mode="upsert")
+    second = await importer(make_upload(rows), db, mode="upsert")
+
+    assert (first["inserted"], first["updated"], first["skipped"]) == (2, 0, 1)
+    assert (second["inserted"], second["updated"], second["skipped"]) == (0, 0, 3)
+    assert await db.scalar(select(func.count()).select_from(models.Book)) == 2
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("importer", [import_books_from_excel, import_books_from_openpyxl])
+async def test_upsert_import_by_id_updates_changed_rows(db, importer):
+    old = datetime(2020, 1, 1)
+    db.add_all([
+        models.Book(id="b1", title="Old", author="A", year=2000, created_at=old, updated_at=old),
+        models.Book(id="b2", title="Same", author="B", year=2001, created_at=old, updated_at=old),
+    ])
+    await db.commit()
+    rows = [["ID", "title", "author", "year"], ["b1", "New", "A", 2000], ["b2", "Same", "B", 2001], ["b3", "Added", "C", None], [None, "No id", "D", 1]]
+
+    result = await importer(make_upload(rows), db, mode="upsert", key="id")
+
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 1, 2)
+    db.expire_all()
+    updated, same, added = [await db.get(models.Book, book_id) for book_id in ("b1", "b2", "b3")]
+    assert updated.title == "New"
+    assert (updated.created_at, same.updated_at) == (old, old)
+    assert updated.updated_at > old
+    assert added.year is None and added.created_at > old
+
+@pytest.mark.asyncio
+async def test_skip_existing_import_keeps_stored_rows(db):
+    db.add(models.Book(id="b1", title="Old", author="A", year=2000))
+    await db.commit()
+    rows = [["id", "title", "author", "year"], ["b1", "New", "A", 2000], ["b2", "Added", "C", 1999]]
+
+    result = await import_books_from_openpyxl(make_upload(rows), db, mode="skip_existing", key="id")
+
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 0, 1)
+    db.expire_all()
+    assert (await db.get(models.Book, "b1")).title == "Old"
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("importer", [import_books_from_excel, import_books_from_openpyxl])
+async def test_natural_key_covers_every_insert_path(db, importer):
+    rows = [["title", "author", "year"], ["Dune", "Herbert", 1965], ["Emma", "Austen", None]]
+
+    appended = await importer(make_upload(rows), db)
+    upserted = await importer(make_upload(rows), db, mode="upsert")
+    again = await importer(make_upload(rows), db)
+    manual = await create_book_handler(BookCreate(title="Anna", author="Tolstoy", year=1877), db)
+    skipped = await importer(make_upload([["title", "author", "year"], [" anna ", "TOLSTOY", 1877]]), db, mode="skip_existing")
+
+    assert appended["inserted"] == 2
+    assert (upserted["inserted"], upserted["updated"], upserted["skipped"]) == (0, 0, 2)
+    assert (again["inserted"], again["skipped"]) == (0, 2)
+    assert (skipped["inserted"], skipped["skipped"]) == (0, 1)
+    assert await db.scalar(select(func.count()).select_from(models.Book)) == 3
+    assert manual.natural_key == crud.natural_key("Anna", "Tolstoy", 1877)
+
+@pytest.mark.asyncio
+async def test_upsert_by_id_skips_key_taken_by_other_book(db):
+    db.add_all([models.Book(id="b1", title="Dune", author="Herbert", year=1965), models.Book(id="b2", title="Emma", author="Austen", year=1815)])
+    await db.commit()
+    rows = [["id", "title", "author", "year"], ["b2", "Dune", "Herbert", 1965], ["b3", "Emma", "Austen", 1815], ["b4", "New", "Author", 2000]]
+
+    result = await import_books_from_openpyxl(make_upload(rows), db, mode="upsert", key="id")
+
+    # b2 стал бы копией b1, а b3 — копией b2
+    assert (result["inserted"], result["updated"], result["skipped"]) == (1, 0, 2)
+    db.expire_all()
+    assert (await db.get(models.Book, "b2")).title == "Emma"
+
+@pytest.mark.asyncio
+async def test_create_and_update_reject_duplicate_book(db):
+    # rollback после конфликта сбрасывает объекты сессии, поэтому дальше только id
+    dune_id = (await create_book_handler(BookCreate(title="Dune", author="Herbert", year=1965), db)).id
+    emma_id = (await create_book_handler(BookCreate(title="Emma", author="Austen", year=1815), db)).id
+
+    with pytest.raises(HTTPException) as created:
+        await create_book_handler(BookCreate(title="dune", author="Herbert ", year=1965), db)
+    with pytest.raises(HTTPException) as updated:
+        await update_book_handler(emma_id, BookCreate(title="Dune", author="Herbert", year=1965), db)
+
+    assert created.value.status_code == updated.value.status_code == 409
+    moved = await update_book_handler(dune_id, BookCreate(title="Dune", author="Herbert", year=1966), db)
+    assert moved.natural_key == crud.natural_key("Dune", "Herbert", 1966)
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("key", ["id", "natural"])
+async def test_upsert_import_invalidates_changed_books(db, key):
+    db.add(models.Book(id="b1", title="Old", author="A", year=2000))
+    await db.commit()
+    assert (await get_book_handler("b1", db)).title == "Old"
+    with pytest.raises(HTTPException):
+        await get_book_handler("b2", db)
+
+    if key == "id":
+        rows = [["id", "title", "author", "year"], ["b1", "New", "B", 2000], ["b2", "Added", "C", 2001]]
+    else:
+        rows = [["title", "author", "year"], ["old", "a", 2000]]
+    await import_books_from_openpyxl(make_upload(rows), db, mode="upsert", key=key)
+
+    assert (await get_book_handler("b1", db)).title == ("New" if key == "id" else "old")
+    if key == "id":
+        assert (await get_book_handler("b2", db)).title == "Added"
@@ -0,0 +1,150 @@
+import asyncio
+from datetime import timedelta
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import func, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from app import jobs, models
+from app.handlers import internal
+from tests.test_import import make_upload
+
+@pytest_asyncio.fixture
+async def manager(db, monkeypatch, tmp_path):
+    monkeypatch.setattr(jobs, "JOB_ARTIFACT_DIR", str(tmp_path))
+    manager = jobs.JobManager(lambda: AsyncSession(bind=db.bind, expire_on_commit=False), workers=1, queue_size=2)
+    monkeypatch.setattr(internal, "job_manager", manager)
+    await manager.start()
+    yield manager
+    await manager.stop()
+
+@pytest.mark.asyncio
+async def test_import_job_reports_progress(manager, db):
+    rows = [["title", "author", "year"]] + [[f"Book {i}", "Author", 2000] for i in range(7)]
+
+    job = await internal.create_import_job_handler(make_upload(rows), "pandas", chunk_size=3)
+    assert job["status"] == "queued"
+    await manager.join()
+
+    job = await internal.get_job_handler(job["id"])
+    assert job["status"] == "done"
+    assert (job["rows_done"], job["rows_total"]) == (7, 7)
+    assert job["result"]["imported"] == 7
+    assert job["rows_per_sec"] > 0
+    assert await db.scalar(select(func.count()).select_from(models.Book)) == 7
+
+@pytest.mark.asyncio
+async def test_export_job_produces_artifact(manager, db):
+    db.add_all([models.Book(title=f"Book {i}", author="Author", year=2000) for i in range(5)])
+    await db.commit()
+
+    job = await internal.create_export_job_handler("csv")
+    await manager.join()
+
+    job = await internal.get_job_handler(job["id"])
+    assert job["status"] == "done" and job["has_artifact"]
+    assert job["rows_done"] == 5
+    response = await internal.get_job_artifact_handler(job["id"])
+    with open(response.path, encoding="utf-8") as f:
+        assert len(f.read().splitlines()) == 6
+
+@pytest.mark.asyncio
+async def test_failed_job_keeps_error(manager):
+    job = await internal.create_import_job_handler(make_upload([["title", "author"], ["T", "A"]]))
+    await manager.join()
+
+    job = await internal.get_job_handler(job["id"])
+    assert job["status"] == "failed"
+    assert "year" in job["error"]
+    with pytest.raises(HTTPException) as exc:
+        await internal.get_job_artifact_handler(job["id"])
+    assert exc.value.status_code == 404
+
+@pytest.mark.asyncio
+async def test_interrupted_jobs_fail_on_start(db):
+    now = jobs.utcnow()
+    db.add_all([
+        models.Job(id="stale", kind="export", status="running", params={}, rows_done=0, created_at=now),
+        models.Job(
+            id="silent", kind="export", status="queued", params={}, rows_done=0, created_at=now,
+            owner="other", heartbeat_at=now - timedelta(seconds=jobs.JOB_STALE_AFTER + 1),
+        ),
+        # задача соседнего воркера, который жив и шлет сигналы
+        models.Job(id="sibling", kind="export", status="running", params={}, rows_done=0, created_at=now, owner="other", heartbeat_at=now),
+    ])
+    await db.commit()
+
+    manager = jobs.JobManager(lambda: AsyncSession(bind=db.bind, expire_on_commit=False), workers=1)
+    await manager.start()
+    await manager.stop()
+
+    assert (await manager.get("stale"))["status"] == "failed"
+    assert (await manager.get("silent"))["status"] == "failed"
+    assert (await manager.get("sibling"))["status"] == "running"
+
+@pytest.mark.asyncio
+async def test_failing_interrupted_import_removes_its_upload(db, tmp_path):
+    upload = tmp_path / "upload.xlsx"
+    upload.write_bytes(b"xlsx")
+    db.add(models.Job(id="lost", kind="import", status="queued", params={"file_path": str(upload)}, rows_done=0, created_at=jobs.utcnow()))
+    await db.commit()
+
+    manager = jobs.JobManager(lambda: AsyncSession(bind=db.bind, expire_on_commit=False), workers=1)
+    assert await manager.fail_interrupted() == 1
+
+    assert not upload.exists()
+    assert (await manager.get("lost"))["status"] == "failed"
+
+@pytest.mark.asyncio
+async def test_expired_artifacts_are_purged(db, tmp_path, monkeypatch):
+    monkeypatch.setattr(jobs, "JOB_ARTIFACT_TTL", 3600)
+    now = jobs.utcnow()
+    paths = {}
+    for job_id, age in (("old", 7200), ("fresh", 60)):
+        paths[job_id] = tmp_path / f"{job_id}.csv"
+        paths[job_id].write_text("id")
+        db.add(models.Job(
+            id=job_id, kind="export", status="done", params={}, rows_done=1, artifact_path=str(paths[job_id]),
+            result={}, created_at=now, finished_at=now - timedelta(seconds=age),
+        ))
+    await db.commit()
+
+    manager = jobs.JobManager(lambda: AsyncSession(bind=db.bind, expire_on_commit=False), workers=1)
+    assert await manager.purge_artifacts() == 1
+
+    assert not paths["old"].exists() and paths["fresh"].exists()
+    assert not (await manager.get("old"))["has_artifact"]
+    assert await manager.get_artifact("fresh") == str(paths["fresh"])
+
+@pytest.mark.asyncio
+async def test_heartbeat_persists_progress_for_other_workers(db):
+    session_factory = lambda: AsyncSession(bind=db.bind, expire_on_commit=False)
+    manager = jobs.JobManager(session_factory, workers=1, heartbeat_interval=0, persist_progress=True)
+    sibling = jobs.JobManager(session_factory, workers=1, heartbeat_interval=0)
+    await manager.start()
+    release = asyncio.Event()
+
+    async def runner(db, ctx):
+        ctx.rows_total = 10
+        ctx.advance(4)
+        await release.wait()
+        ctx.advance(6)
+        return {}
+
+    job = await manager.submit("export", runner, {})
+    while job["id"] not in manager.running:
+        await asyncio.sleep(0)
+    await manager.heartbeat()
+
+    seen = await sibling.get(job["id"])
+    assert seen["status"] == "running"
+    assert (seen["rows_done"], seen["rows_total"]) == (4, 10)
+    stored = await db.get(models.Job, job["id"], populate_existing=True)
+    assert stored.owner == manager.owner and stored.heartbeat_at >= stored.started_at
+    # свежий сигнал: перезапуск соседа задачу не закрывает
+    assert await sibling.fail_interrupted() == 0
+
+    release.set()
+    await manager.join()
+    await manager.stop()
+    assert (await sibling.get(job["id"]))["rows_done"] == 10
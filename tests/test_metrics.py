@@ -0,0 +1,69 @@
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app import decorator, metrics
+
+@pytest.fixture(autouse=True)
+def clean_registry():
+    metrics.registry.clear()
+    yield
+    metrics.registry.clear()
+
+def test_histogram_renders_cumulative_buckets():
+    histogram = metrics.Histogram("demo_seconds", "demo", ("route",), buckets=(0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        histogram.observe(value, "/a")
+
+    assert list(histogram.samples()) == [
+        'demo_seconds_bucket{route="/a",le="0.1"} 1',
+        'demo_seconds_bucket{route="/a",le="1"} 3',
+        'demo_seconds_bucket{route="/a",le="+Inf"} 4',
+        'demo_seconds_sum{route="/a"} 4.05',
+        'demo_seconds_count{route="/a"} 4',
+    ]
+
+def test_middleware_labels_by_route_template():
+    app = FastAPI()
+    app.add_middleware(metrics.MetricsMiddleware)
+
+    @app.get("/books/{book_id}")
+    async def get_book(book_id: str):
+        return {"id": book_id}
+
+    client = TestClient(app)
+    client.get("/books/1")
+    client.get("/books/2")
+    client.get("/missing")
+
+    assert metrics.http_requests.values[("GET", "/books/{book_id}", 200)] == 2
+    assert metrics.http_requests.values[("GET", "unmatched", 404)] == 1
+    assert 'route="/books/{book_id}"' in metrics.registry.render()
+
+@pytest.mark.asyncio
+async def test_handler_decorator_records_latency_errors_and_samples_memory(monkeypatch):
+    @decorator.measure_performance
+    async def handler(fail=False):
+        if fail:
+            raise ValueError("x")
+        return bytearray(1_000_000)
+
+    await handler()
+    assert "handler" not in {labels[0] for labels in metrics.handler_memory.values}
+
+    monkeypatch.setattr(decorator, "MEMORY_SAMPLE_RATE", 1.0)
+    await handler()
+    with pytest.raises(ValueError):
+        await handler(fail=True)
+
+    assert sum(metrics.handler_duration.values[("handler",)][0]) == 3
+    assert metrics.handler_errors.values[("handler",)] == 1
+    counts, peak_total = metrics.handler_memory.values[("handler",)]
+    assert sum(counts) == 2 and peak_total >= 1_000_000
+    assert not decorator.tracemalloc.is_tracing()
+
+def test_record_rows():
+    metrics.record_rows("import", 500, 0.5)
+
+    text = metrics.registry.render()
+    assert 'rows_processed_total{operation="import"} 500' in text
+    assert 'rows_per_second_count{operation="import"} 1' in text
@@ -0,0 +1,47 @@
+from sqlalchemy import create_engine, inspect, select, text
+from app import migrations, models
+from app.search import apply_text_search
+
+def test_migrate_fresh_database_is_idempotent(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'fresh.db'}")
+
+    with engine.begin() as conn:
+        assert migrations.migrate(conn) == [version for version, _, _ in migrations.MIGRATIONS]
+    with engine.begin() as conn:
+        assert migrations.migrate(conn) == []
+        assert migrations.applied_versions(conn) == {version for version, _, _ in migrations.MIGRATIONS}
+        assert {"books", "jobs", "books_fts"} <= set(inspect(conn).get_table_names())
+    engine.dispose()
+
+def test_migrate_upgrades_legacy_schema(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        # так выглядела таблица, которую раньше создавал create_all при импорте приложения
+        conn.execute(text("CREATE TABLE books (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, year INTEGER)"))
+        conn.execute(text("INSERT INTO books VALUES ('1', 'Dune', 'Frank Herbert', 1965)"))
+
+    with engine.begin() as conn:
+        migrations.migrate(conn)
+
+    with engine.connect() as conn:
+        assert {"natural_key", "created_at", "updated_at"} <= migrations.column_names(conn, "books")
+        assert conn.execute(text("SELECT count(*) FROM books WHERE created_at IS NULL OR updated_at IS NULL")).scalar() == 0
+        assert "ix_books_year_created_at" in {index["name"] for index in inspect(conn).get_indexes("books")}
+        found = conn.scalars(apply_text_search(select(models.Book.id), "sqlite", title="Dune")).all()
+        assert found == ["1"]
+    engine.dispose()
+
+def test_migrate_backfills_natural_key_and_leaves_duplicates_null(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE books (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, year INTEGER)"))
+        conn.execute(text("INSERT INTO books VALUES ('b', 'Dune', 'Herbert', 1965), ('a', 'dune ', 'HERBERT', 1965), ('c', 'Emma', 'Austen', NULL)"))
+
+    with engine.begin() as conn:
+        migrations.migrate(conn)
+
+    with engine.connect() as conn:
+        keys = dict(conn.execute(text("SELECT id, natural_key FROM books")).all())
+    # created_at у всех одинаковое (время миграции), ключ получает меньший id
+    assert keys == {"a": models.natural_key("Dune", "Herbert", 1965), "b": None, "c": models.natural_key("Emma", "Austen", None)}
+    engine.dispose()
@@ -0,0 +1,149 @@
+import json
+import pytest
+import pytest_asyncio
+from datetime import datetime, timedelta
+from fastapi import HTTPException
+from pydantic import TypeAdapter, ValidationError
+from sqlalchemy import select, text
+from app import crud, models
+from app.handlers.internal import books_json_response, build_books_query, get_books_by_filters, get_books_page_by_filters
+from app.pagination import SORT_FIELDS, decode_cursor, encode_cursor, sort_clauses
+from app.schemas import BookCreate, BookFilter, BookRead
+
+@pytest_asyncio.fixture
+async def catalog(db):
+    db.add_all([models.Book(id=f"{i:04d}", title=f"Book {i}", author="Author", year=2000 + i % 3) for i in range(25)])
+    await db.commit()
+    return db
+
+def test_cursor_roundtrip():
+    token = encode_cursor({"id": "abc"})
+    assert "=" not in token
+    assert decode_cursor(token) == {"id": "abc"}
+
+@pytest.mark.parametrize("token", ["not-base64!", encode_cursor({"x": 1}), "bnVsbA"])
+def test_decode_cursor_rejects_garbage(token):
+    with pytest.raises(HTTPException) as exc:
+        decode_cursor(token)
+    assert exc.value.status_code == 400
+
+@pytest.mark.asyncio
+async def test_crud_get_books_page_walks_whole_table(catalog):
+    seen, cursor = [], None
+    while True:
+        items, cursor = await crud.get_books_page(catalog, limit=10, cursor=cursor)
+        seen.extend(b.id for b in items)
+        if cursor is None:
+            break
+
+    assert seen == [f"{i:04d}" for i in range(25)]
+
+@pytest.mark.asyncio
+async def test_filtered_pages_are_stable_under_inserts(catalog):
+    first = await get_books_page_by_filters(catalog, BookFilter(year=2000), limit=4)
+    assert [b.id for b in first["items"]] == ["0000", "0003", "0006", "0009"]
+
+    catalog.add(models.Book(id="0001a", title="Inserted", author="Author", year=2000))
+    await catalog.commit()
+
+    second = await get_books_page_by_filters(catalog, BookFilter(year=2000), limit=4, cursor=first["next_cursor"])
+    assert [b.id for b in second["items"]] == ["0012", "0015", "0018", "0021"]
+
+    last = await get_books_page_by_filters(catalog, BookFilter(year=2000), limit=4, cursor=second["next_cursor"])
+    assert [b.id for b in last["items"]] == ["0024"]
+    assert last["next_cursor"] is None
+
+@pytest_asyncio.fixture
+async def dated_catalog(db):
+    start = datetime(2024, 1, 1)
+    db.add_all([
+        models.Book(id=f"{i:04d}", title=f"Book {i}", author="Author", year=None if i % 5 == 0 else 2000 + i % 3,
+                    created_at=start + timedelta(hours=i % 7), updated_at=start)
+        for i in range(20)
+    ])
+    await db.commit()
+    return db
+
+async def walk(db, filters, limit=3):
+    seen, cursor = [], None
+    while True:
+        page = await get_books_page_by_filters(db, filters, limit=limit, cursor=cursor)
+        seen.extend(page["items"])
+        cursor = page["next_cursor"]
+        if cursor is None:
+            return seen
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort_by", ["created_at", "year"])
+@pytest.mark.parametrize("order", ["asc", "desc"])
+async def test_sorted_cursor_pages_match_offset_order(dated_catalog, sort_by, order):
+    filters = BookFilter(sort_by=sort_by, order=order)
+    expected = await get_books_by_filters(dated_catalog, filters, skip=0, limit=100)
+
+    seen = await walk(dated_catalog, filters)
+
+    assert [b.id for b in seen] == [b.id for b in expected]
+    assert len(seen) == 20
+    values = [getattr(b, sort_by) for b in seen if getattr(b, sort_by) is not None]
+    assert values == sorted(values, reverse=order == "desc")
+    # null в конце asc и в начале desc
+    nulls = [getattr(b, sort_by) is None for b in seen]
+    assert nulls == sorted(nulls, reverse=order == "desc")
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("sort_by", SORT_FIELDS)
+@pytest.mark.parametrize("order", ["asc", "desc"])
+async def test_sorted_pages_use_index_order(db, sort_by, order):
+    query = select(models.Book.id).order_by(*sort_clauses(sort_by, order)).limit(10)
+    sql = str(query.compile(db.bind, compile_kwargs={"literal_binds": True}))
+    plan = " ".join(row[-1] for row in await db.execute(text("EXPLAIN QUERY PLAN " + sql)))
+    assert "TEMP B-TREE" not in plan
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("filters", [BookFilter(), BookFilter(year=2000), BookFilter(author="Author")])
+async def test_offset_pages_have_total_order(catalog, filters):
+    query = build_books_query(catalog, filters)
+    assert str(query).rstrip().endswith("books.id")
+
+    pages = [await get_books_by_filters(catalog, filters, skip=skip, limit=4) for skip in range(0, 8, 4)]
+    ids = [b.id for page in pages for b in page]
+    assert len(set(ids)) == len(ids) == 8
+    if filters.author is None:
+        assert ids == sorted(ids)
+
+@pytest.mark.asyncio
+async def test_cursor_from_other_sort_is_rejected(dated_catalog):
+    page = await get_books_page_by_filters(dated_catalog, BookFilter(sort_by="created_at"), limit=3)
+    with pytest.raises(HTTPException) as exc:
+        await get_books_page_by_filters(dated_catalog, BookFilter(sort_by="year"), limit=3, cursor=page["next_cursor"])
+    assert exc.value.status_code == 400
+
+def test_sort_by_is_validated():
+    with pytest.raises(ValidationError):
+        BookFilter(sort_by="title")
+
+@pytest.mark.asyncio
+async def test_timestamps_on_create_and_bulk_update(db):
+    book = await crud.create_book(db, BookCreate(title="Dune", author="Herbert", year=1965))
+    created_at, updated_at = book.created_at, book.updated_at
+    assert created_at is not None and updated_at >= created_at
+
+    await crud.bulk_update_books(db, [{"id": book.id, "year": 1966}])
+    await db.commit()
+    await db.refresh(book)
+    assert book.created_at == created_at
+    assert book.updated_at > updated_at
+
+@pytest.mark.asyncio
+async def test_lean_list_response_matches_response_model(dated_catalog):
+    filters = BookFilter(sort_by="created_at")
+    rows = await get_books_by_filters(dated_catalog, filters, skip=0, limit=5)
+    page = await get_books_page_by_filters(dated_catalog, filters, limit=5)
+    books = [await dated_catalog.get(models.Book, row.id) for row in rows]
+
+    expected = TypeAdapter(list[BookRead]).dump_python(books, mode="json")
+    assert json.loads(books_json_response(rows).body) == expected
+    assert json.loads(books_json_response(page).body) == {"items": expected, "next_cursor": page["next_cursor"]}
+
+    google = [BookRead(id="g1", title="Found", author="Google", year=None)]
+    assert json.loads(books_json_response(google).body)[0]["created_at"] is None
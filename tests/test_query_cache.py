@@ -0,0 +1,141 @@
+import pytest
+import pytest_asyncio
+from unittest.mock import patch
+from app import crud, models, schemas
+from app.cache import MemoryBackend, QueryCache, RedisBackend, query_cache
+from app.handlers.internal import (
+    create_book_handler, delete_book_handler, get_book_handler, get_books_by_filters, update_book_handler,
+)
+from app.schemas import BookFilter
+
+class LocalPipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+    def delete(self, *keys):
+        self.commands.append(("delete", keys))
+
+    def incr(self, key):
+        self.commands.append(("incr", (key,)))
+
+    async def execute(self):
+        self.client.pipelines += 1
+        return [await getattr(self.client, name)(*args) for name, args in self.commands]
+
+class LocalRedis:
+    # заглушка redis.asyncio.Redis с теми командами, что использует RedisBackend
+    def __init__(self):
+        self.data = {}
+        self.pipelines = 0
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def mget(self, keys):
+        return [self.data.get(key) for key in keys]
+
+    async def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def incr(self, key):
+        self.data[key] = str(int(self.data.get(key, 0)) + 1).encode()
+        return int(self.data[key])
+
+@pytest_asyncio.fixture
+async def book(db):
+    book = models.Book(id="b1", title="Dune", author="Frank Herbert", year=1965)
+    db.add(book)
+    await db.commit()
+    return book
+
+@pytest.mark.asyncio
+async def test_get_book_is_read_through_and_invalidated_by_update(db, book):
+    with patch("app.handlers.internal.crud.get_book", wraps=crud.get_book) as get_book:
+        assert (await get_book_handler("b1", db)).title == "Dune"
+        assert (await get_book_handler("b1", db)).title == "Dune"
+        assert get_book.call_count == 1
+
+        await update_book_handler("b1", schemas.BookCreate(title="Dune Messiah", author="Frank Herbert", year=1969), db)
+        assert (await get_book_handler("b1", db)).title == "Dune Messiah"
+        assert get_book.call_count == 3
+
+@pytest.mark.asyncio
+async def test_filtered_lists_are_cached_until_any_write(db, book):
+    filters = BookFilter(author="herbert")
+    assert [b.id for b in await get_books_by_filters(db, filters, skip=0, limit=10)] == ["b1"]
+
+    with patch.object(db, "execute", wraps=db.execute) as execute:
+        await get_books_by_filters(db, filters, skip=0, limit=10)
+        assert execute.call_count == 0
+
+    new_book = await create_book_handler(schemas.BookCreate(title="Children of Dune", author="Frank Herbert"), db)
+    assert {b.id for b in await get_books_by_filters(db, filters, skip=0, limit=10)} == {"b1", new_book.id}
+
+    await delete_book_handler("b1", db)
+    assert [b.id for b in await get_books_by_filters(db, filters, skip=0, limit=10)] == [new_book.id]
+
+@pytest.mark.asyncio
+async def test_redis_backend_with_local_stand_in(db, book, monkeypatch):
+    monkeypatch.setattr(query_cache, "backend", RedisBackend(LocalRedis()))
+
+    assert (await get_book_handler("b1", db)).title == "Dune"
+    await crud.update_book(db, "b1", schemas.BookCreate(title="Changed behind the cache", author="X"))
+    assert (await get_book_handler("b1", db)).title == "Dune"
+
+    await query_cache.invalidate("b1")
+    assert (await get_book_handler("b1", db)).title == "Changed behind the cache"
+
+@pytest.mark.asyncio
+async def test_redis_invalidate_is_one_pipeline():
+    client = LocalRedis()
+    cache = QueryCache(RedisBackend(client))
+    await cache.backend.set(await cache.book_key("b1"), "cached")
+
+    await cache.invalidate("b1", "b2", "b1")
+
+    assert client.pipelines == 1
+    assert await cache.backend.get("book:b1:0") == (False, None)
+    assert [await cache.backend.get_counter(f"book-version:{i}") for i in ("b1", "b2")] == [1, 1]
+    assert await cache.backend.get_counter(QueryCache.GENERATION_KEY) == 1
+
+@pytest.mark.asyncio
+async def test_memory_counters_are_bounded_without_stale_reads():
+    cache = QueryCache(MemoryBackend(counters_maxsize=2))
+    await cache.invalidate("old")
+    # чтение, начатое до записи, положило результат под старую версию уже после инвалидации
+    await cache.backend.set("book:old:0", "stale")
+
+    for i in range(5):
+        await cache.invalidate(f"b{i}")
+
+    assert len(cache.backend.counters) == 2
+    key = await cache.book_key("old")
+    assert key != "book:old:0"
+    assert await cache.backend.get(key) == (False, None)
+
+@pytest.mark.asyncio
+async def test_disabled_cache_always_loads():
+    cache = QueryCache(None)
+    calls = []
+
+    async def loader():
+        calls.append(1)
+        return "value"
+
+    assert await cache.get_or_load(await cache.list_key("x"), loader) == "value"
+    assert await cache.get_or_load(await cache.list_key("x"), loader) == "value"
+    assert len(calls) == 2
@@ -0,0 +1,52 @@
+import pytest
+import pytest_asyncio
+from fastapi import HTTPException
+from sqlalchemy import delete, text, update
+from app import models
+from app.handlers.internal import get_books_by_filters
+from app.schemas import BookFilter
+
+@pytest_asyncio.fixture
+async def catalog(db):
+    db.add_all([
+        models.Book(id="1", title="Python Crash Course", author="Eric Matthes", year=2019),
+        models.Book(id="2", title="Fluent Python", author="Luciano Ramalho", year=2015),
+        models.Book(id="3", title="Война и мир", author="Лев Толстой", year=1869),
+        models.Book(id="4", title="Learning SQL", author="Alan Beaulieu", year=2009),
+    ])
+    await db.commit()
+    return db
+
+@pytest.mark.asyncio
+async def test_search_uses_fts_and_matches_substrings(catalog):
+    results = await get_books_by_filters(catalog, BookFilter(title="pyth"), skip=0, limit=10)
+    assert {b.id for b in results} == {"1", "2"}
+
+    results = await get_books_by_filters(catalog, BookFilter(title="ВОЙНА", author="толст"), skip=0, limit=10)
+    assert [b.id for b in results] == ["3"]
+
+@pytest.mark.asyncio
+async def test_search_index_follows_updates_and_deletes(catalog):
+    await catalog.execute(update(models.Book).where(models.Book.id == "4").values(title="Learning Python"))
+    await catalog.execute(delete(models.Book).where(models.Book.id == "1"))
+    await catalog.commit()
+
+    results = await get_books_by_filters(catalog, BookFilter(title="python"), skip=0, limit=10)
+    assert {b.id for b in results} == {"2", "4"}
+
+    fts_rows = (await catalog.execute(text("SELECT count(*) FROM books_fts WHERE books_fts MATCH '\"sql\"'"))).scalar()
+    assert fts_rows == 0
+
+@pytest.mark.asyncio
+async def test_search_short_terms_fall_back_to_ilike(catalog):
+    results = await get_books_by_filters(catalog, BookFilter(title="QL"), skip=0, limit=10)
+    assert [b.id for b in results] == ["4"]
+
+@pytest.mark.asyncio
+async def test_search_no_match_goes_to_google(catalog, monkeypatch):
+    async def fake_google(**kwargs):
+        raise HTTPException(status_code=404, detail="Книги не найдены")
+
+    monkeypatch.setattr("app.handlers.internal.fetch_books_from_google", fake_google)
+    with pytest.raises(HTTPException):
+        await get_books_by_filters(catalog, BookFilter(title="haskell"), skip=0, limit=10)
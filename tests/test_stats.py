@@ -0,0 +1,140 @@
+import asyncio
+import pytest
+from sqlalchemy import create_engine, func, insert, select, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from app import crud, migrations, models, stats
+from app.handlers.internal import (
+    bulk_create_books_handler,
+    bulk_delete_books_handler,
+    bulk_update_books_handler,
+    create_book_handler,
+    delete_book_handler,
+    get_book_stats_handler,
+    update_book_handler,
+)
+from app.schemas import BookBulkUpdate, BookCreate
+
+async def grouped_counts(db) -> dict:
+    # то же, что должно лежать в book_stats, посчитанное по всей books
+    authors = dict((await db.execute(select(models.Book.author, func.count()).group_by(models.Book.author))).all())
+    years = dict((await db.execute(select(models.Book.year, func.count()).group_by(models.Book.year))).all())
+    return {"total": sum(authors.values()), "authors": authors, "years": years}
+
+async def stored_counts(db) -> dict:
+    result = await get_book_stats_handler(db, top_authors=1000)
+    return {
+        "total": result["total"],
+        "authors": {item["author"]: item["books"] for item in result["authors"]},
+        "years": {item["year"]: item["books"] for item in result["years"]},
+    }
+
+@pytest.mark.asyncio
+async def test_stats_follow_every_write_path(db):
+    dune = await create_book_handler(BookCreate(title="Dune", author="Herbert", year=1965), db)
+    await create_book_handler(BookCreate(title="Emma", author="Austen", year=None), db)
+    created = await bulk_create_books_handler(
+        [BookCreate(title=f"Book {i}", author="Austen" if i % 2 else "Tolstoy", year=1800 + i % 3) for i in range(6)], db
+    )
+    assert await stored_counts(db) == await grouped_counts(db)
+
+    await update_book_handler(dune.id, BookCreate(title="Dune", author="Frank Herbert", year=1966), db)
+    ids = [item["id"] for item in created["items"]]
+    await bulk_update_books_handler([BookBulkUpdate(id=ids[0], year=None), BookBulkUpdate(id=ids[1], title="Only title")], db)
+    await bulk_delete_books_handler(ids[2:4], db)
+    await delete_book_handler(dune.id, db)
+    # импорт в режиме upsert по естественному ключу: одна новая и одна существующая книга
+    await crud.sync_books(db, [
+        {"title": "Anna", "author": "Tolstoy", "year": 1877, "natural_key": crud.natural_key("Anna", "Tolstoy", 1877)},
+        {"title": "Anna", "author": "Tolstoy", "year": 1877, "natural_key": crud.natural_key("Anna", "Tolstoy", 1877)},
+    ])
+    await db.commit()
+
+    expected = await grouped_counts(db)
+    assert await stored_counts(db) == expected
+    # опустевшие группы не видны сразу и удаляются сверткой
+    assert "Herbert" not in expected["authors"] and "Frank Herbert" not in expected["authors"]
+    assert await db.scalar(select(func.count()).select_from(models.BookStatDelta)) > 0
+
+    await (await db.connection()).run_sync(stats.fold_book_stats)
+    await db.commit()
+
+    assert await stored_counts(db) == expected
+    assert await db.scalar(select(func.count()).select_from(models.BookStatDelta)) == 0
+    assert await db.scalar(select(func.count()).select_from(models.BookStat).where(models.BookStat.value.in_(["Herbert", "Frank Herbert"]))) == 0
+
+@pytest.mark.asyncio
+async def test_triggers_only_append_deltas(db):
+    await create_book_handler(BookCreate(title="Dune", author="Herbert", year=1965), db)
+    await (await db.connection()).run_sync(stats.fold_book_stats)
+    await db.commit()
+    folded = (await db.execute(select(models.BookStat.facet, models.BookStat.value, models.BookStat.books))).all()
+
+    await bulk_create_books_handler([BookCreate(title=f"Book {i}", author="Herbert", year=1965) for i in range(3)], db)
+
+    # свернутые строки не тронуты, изменения лежат отдельно до следующей свертки
+    assert (await db.execute(select(models.BookStat.facet, models.BookStat.value, models.BookStat.books))).all() == folded
+    assert await db.scalar(select(func.sum(models.BookStatDelta.books)).where(models.BookStatDelta.facet == "author")) == 3
+    assert (await get_book_stats_handler(db))["authors"] == [{"author": "Herbert", "books": 4}]
+
+@pytest.mark.asyncio
+async def test_stats_top_authors_and_year_order(db):
+    for i in range(5):
+        await create_book_handler(BookCreate(title=f"Book {i}", author=f"Author {min(i, 2)}", year=2000 - i), db)
+    await create_book_handler(BookCreate(title="No year", author="Author 0", year=None), db)
+
+    result = await get_book_stats_handler(db, top_authors=2)
+
+    assert result["total"] == 6
+    assert result["authors"] == [{"author": "Author 2", "books": 3}, {"author": "Author 0", "books": 2}]
+    assert [item["year"] for item in result["years"]] == [1996, 1997, 1998, 1999, 2000, None]
+
+def test_migration_and_rebuild_fill_stats(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as conn:
+        conn.execute(text("CREATE TABLE books (id VARCHAR PRIMARY KEY, title VARCHAR NOT NULL, author VARCHAR NOT NULL, year INTEGER)"))
+        conn.execute(text("INSERT INTO books VALUES ('1', 'Dune', 'Herbert', 1965), ('2', 'Emma', 'Austen', NULL), ('3', 'Persuasion', 'Austen', 1817)"))
+
+    with engine.begin() as conn:
+        migrations.migrate(conn)
+    stat_rows = "SELECT facet, value, books FROM book_stats ORDER BY facet, value"
+    with engine.connect() as conn:
+        after_migration = conn.execute(text(stat_rows)).all()
+    assert after_migration == [
+        ("author", "Austen", 2), ("author", "Herbert", 1),
+        ("total", "", 3),
+        ("year", "", 1), ("year", "1817", 1), ("year", "1965", 1),
+    ]
+
+    with engine.begin() as conn:
+        # счетчики разошлись с books (например, правка в обход триггеров), пересчет чинит
+        conn.execute(text("UPDATE book_stats SET books = 100"))
+        conn.execute(text("INSERT INTO books (id, title, author, year, created_at, updated_at) VALUES ('4', 'Emma', 'Austen', NULL, '2024-01-01', '2024-01-01')"))
+        assert stats.rebuild_book_stats(conn) == 5
+    with engine.connect() as conn:
+        assert conn.execute(text("SELECT books FROM book_stats WHERE facet = 'author' AND value = 'Austen'")).scalar() == 3
+        assert conn.execute(text("SELECT books FROM book_stats WHERE facet = 'total'")).scalar() == 4
+    engine.dispose()
+
+@pytest.mark.asyncio
+async def test_stats_folder_folds_in_background(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'stats.db'}")
+    with engine.begin() as conn:
+        migrations.migrate(conn)
+        conn.execute(insert(models.Book), [{"title": "Dune", "author": "Herbert", "year": 1965}])
+    engine.dispose()
+    async_engine = create_async_engine(f"sqlite+aiosqlite:///{tmp_path / 'stats.db'}")
+
+    folder = stats.StatsFolder(interval=0.01)
+    folder.start(async_engine)
+    try:
+        for _ in range(100):
+            async with async_engine.connect() as conn:
+                if not await conn.scalar(select(func.count()).select_from(models.BookStatDelta)):
+                    break
+            await asyncio.sleep(0.01)
+    finally:
+        await folder.stop()
+
+    async with async_engine.connect() as conn:
+        assert await conn.scalar(select(models.BookStat.books).where(models.BookStat.value == "Herbert")) == 1
+    await async_engine.dispose()